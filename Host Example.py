@@ -6,7 +6,6 @@ import time
 from adafruit_circuitplayground import cp
 from ble_management import BluetoothManager
 from _bleio import BluetoothError, RoleError
-from adafruit_ble.advertising.standard import Advertisement, ProvideServicesAdvertisement
 
 #
 # Variables
@@ -22,20 +21,20 @@ adder = 0
 h_service = None
 h_characteristic = None
 
+## This is the handle of h_characteristic, it checks the characteristic's properties once instead of every frame
+h_handle = None
+
 while True:
     try:
         # This code reads and writes to the current characteristic based on whether or not we are in host or peripheral mode
         if ble_manager.get_bluetooth_connection_state():
-            # Get the properties of the characteristic
-            properties = ble_manager.convert_num_to_properties(h_characteristic.properties)
-            
             # Check to see if we can read from the characteristic
-            if properties[2]:
-                print(ble_manager.read_from_characteristic(h_characteristic).decode())
+            if h_handle.can_read:
+                print(h_handle.read().decode())
             
             # Check to see if we can write to the characteristic
-            if properties[0] or properties[1]:
-                ble_manager.write_to_characteristic(h_characteristic, str(adder) + "\n")         
+            if h_handle.can_write:
+                h_handle.write(str(adder) + "\n")
             
             # Increment our test variable
             adder += 1
@@ -46,22 +45,15 @@ while True:
     if cp.button_a:
         # Make sure we aren't already connected to a device
         if not ble_manager.get_bluetooth_connection_state():
-                # Catch if we have any memory related errors when scanning because we only have so much memory
-                try:
-                    # Make sure we aren't already scanning
-                    ble_manager.stop_scanning()
-                    
-                    # Scan for devices with these arbitrary settings to make sure that we don't run out of memory
-                    detected_devices = ble_manager.start_scanning(buffer_size=50, timeout=1, print_debug = True)
-                    
-                    # print all the devices that we could connect to
-                    for key in detected_devices.keys():
-                        print(key)
-
-                except MemoryError as m:
-                    # If we have a memory error tell the user and stop attempting connection
-                    print("ERROR: Scanning Failed due to Memory Issues!\nException:", m, "\n")
-                    continue
+                # Make sure we aren't already scanning
+                ble_manager.stop_scanning()
+                
+                # Scan for devices, the scan buffer and how many devices are kept are sized from the free memory so it doesn't run out
+                detected_devices = ble_manager.start_scanning(timeout=1, print_debug = True)
+                
+                # print all the devices that we could connect to
+                for key in detected_devices.keys():
+                    print(key)
                 
                 # Allow user to specify peripheral they want to connect to
                 is_exiting = False
@@ -123,6 +115,7 @@ while True:
                         # Check if this characteristic exists and if so make it the one that we can use
                         if h_service.characteristics[i] != None and ((properties[0] or properties[1]) or properties[2]):
                             h_characteristic = h_service.characteristics[i]
+                            h_handle = ble_manager.get_handle(h_characteristic)
                             break
                                             
                 except BluetoothError as b:
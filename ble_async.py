@@ -0,0 +1,229 @@
+#
+# Libraries
+#
+
+from ble_management import BluetoothManager
+
+# This lets the functions of a BluetoothManager be awaited from asyncio tasks so scanning, sampling sensors and sending data
+# can all happen at the same time instead of one after the other. It works with CircuitPython's asyncio library on the board
+# and with regular asyncio on a computer when the manager uses ble_simulator.SimulatedBackend.
+#
+# Anything that can be done without waiting on the radio (like get_bluetooth_name() or create_service()) is passed straight
+# through to the manager. Variables are read from the manager the same way, but they have to be set on the manager itself
+# (EX `ble_manager.manager.bluetooth_mode_peripheral = True`).
+#
+# Note: connect(), discover_device_services() and reading a characteristic's value directly have to wait on a response that
+# _bleio won't let us stop waiting for, so those still block but they give every other task a turn before they start.
+class AsyncBluetoothManager:
+    #
+    # Variables
+    #
+
+    ## How long to wait in seconds between checks when waiting on data or space in a buffer
+    poll_interval = 0.01
+
+    ## How long each part of a scan lasts in seconds, other tasks get a turn between every part
+    scan_slice = 0.1
+
+    # (optional) manager -> BluetoothManager = None: The manager to use, if None then a new BluetoothManager() is made
+    def __init__(self, manager: BluetoothManager = None):
+        ## manager is the BluetoothManager that actually does everything
+        self.manager = BluetoothManager() if manager == None else manager
+
+        self._scanning = False
+
+    # Anything we don't have an async version of comes from the manager
+    def __getattr__(self, name: str):
+        return getattr(self.manager, name)
+
+    # Wait the specified amount of seconds while letting other tasks run
+    async def sleep(self, seconds: float):
+        await self.manager._backend.sleep_async(seconds)
+
+    #
+    # Host Functions
+    #
+
+    # This scans like BluetoothManager.start_scanning() except other tasks keep running during the scan.
+    # The scan is done in parts of scan_slice seconds and stops once advertisements_to_collect devices have been found,
+    # the timeout runs out, or stop_scanning() is called
+    #
+    # The arguments are the same as BluetoothManager.start_scanning(), the memory budget is planned once for the whole scan
+    # and it stops early once the results are full
+    async def start_scanning(self, advertisements_to_collect: int = 10, buffer_size: int = None, extended: bool = False, timeout: float = None, interval: float = 0.1, window: float = 0.1, minimum_rssi: int = -80, filter_no_name: bool = True, active: bool = True, print_debug: bool = False, memory_budget: int = None) -> dict:
+        detected_devices = dict()
+        deadline = None if timeout == None else self.manager._backend.monotonic() + timeout
+
+        planned_buffer_size, capacity = self.manager.plan_scan_memory(memory_budget, extended)
+        if buffer_size == None:
+            buffer_size = planned_buffer_size
+        if capacity != None:
+            advertisements_to_collect = min(advertisements_to_collect, capacity)
+
+        self._scanning = True
+        while self._scanning and len(detected_devices) < advertisements_to_collect:
+            scan_time = self.scan_slice
+            if deadline != None:
+                scan_time = min(scan_time, deadline - self.manager._backend.monotonic())
+                if scan_time <= 0:
+                    break
+
+            detected_devices.update(self.manager.start_scanning(advertisements_to_collect - len(detected_devices), buffer_size, extended, scan_time, interval, window, minimum_rssi, filter_no_name, active, print_debug))
+            await self.sleep(0)
+
+        self._scanning = False
+        return detected_devices
+
+    # This scans until an advertisement matches until and returns it, or None if timeout runs out first.
+    # The arguments are the same as BluetoothManager.find_device()
+    async def find_device(self, until, timeout: float = None, buffer_size: int = None, extended: bool = False, interval: float = 0.1, window: float = 0.1, minimum_rssi: int = -80, active: bool = True):
+        deadline = None if timeout == None else self.manager._backend.monotonic() + timeout
+
+        self._scanning = True
+        while self._scanning:
+            scan_time = self.scan_slice
+            if deadline != None:
+                scan_time = min(scan_time, deadline - self.manager._backend.monotonic())
+                if scan_time <= 0:
+                    break
+
+            advertisement = self.manager.find_device(until, scan_time, buffer_size, extended, interval, window, minimum_rssi, active)
+            if advertisement != None:
+                self._scanning = False
+                return advertisement
+            await self.sleep(0)
+
+        self._scanning = False
+        return None
+
+    # This stops start_scanning() or find_device() once the part of the scan they're on has finished
+    def stop_scanning(self):
+        self._scanning = False
+        self.manager.stop_scanning()
+
+    async def connect(self, detected_devices: dict, device_name: str, print_debug: bool = False, timeout: float = 4.0):
+        await self.sleep(0)
+        return self.manager.connect(detected_devices, device_name, print_debug, timeout)
+
+    async def disconnect(self, print_debug: bool = False, address = None):
+        await self.sleep(0)
+        self.manager.disconnect(print_debug, address)
+
+    async def discover_device_services(self, filters: list = [], address = None) -> tuple:
+        await self.sleep(0)
+        return self.manager.discover_device_services(filters, address)
+
+    async def find_characteristic(self, service_uuid: str, characteristic_uuid: str, address = None):
+        await self.sleep(0)
+        return self.manager.find_characteristic(service_uuid, characteristic_uuid, address)
+
+    #
+    # Reading and Writing
+    #
+
+    # This waits without blocking until a message has started arriving in read_buffer and then reads it like
+    # BluetoothManager.read_from_characteristic_with_buffer(). An empty bytes is returned if timeout runs out first
+    #
+    # read_buffer -> CharacteristicBuffer: The buffer to read from
+    # (optional) timeout -> float = None: How long to wait in seconds, None waits until something arrives
+    async def read_from_characteristic_with_buffer(self, read_buffer, timeout: float = None) -> bytes:
+        # A whole packet lands in the buffer at once, so once anything is there the rest of the message is too
+        if not await self._wait_for(lambda: read_buffer.in_waiting > 0, timeout):
+            return b""
+        return self.manager.read_from_characteristic_with_buffer(read_buffer)
+
+    async def read_from_characteristic(self, characteristic) -> bytearray:
+        await self.sleep(0)
+        return self.manager.read_from_characteristic(characteristic)
+
+    # This writes like BluetoothManager.write_to_characteristic_with_buffer() except when write_buffer is full
+    # it waits for space without blocking instead of the message being lost. Returns 0 if timeout runs out first
+    #
+    # (optional) timeout -> float = None: How long to wait in seconds for space in the buffer, None waits until there is space
+    # The rest of the arguments are the same as BluetoothManager.write_to_characteristic_with_buffer()
+    async def write_to_characteristic_with_buffer(self, write_buffer, message: str, max_length: int = None, clear_buffer: bool = True, timeout: float = None) -> int:
+        manager = self.manager
+        if not manager.get_bluetooth_connection_state():
+            manager._count_error()
+            raise Exception("ERROR: Something went wrong when writing to characteristic!")
+        if max_length == None:
+            max_length = manager._get_buffer_packet_length(write_buffer)
+
+        message = manager._encode_buffer_message(write_buffer, message)
+        header = manager._get_buffer_header(write_buffer, message, max_length)
+        if header != None:
+            # The manager fills in the same header for every message, so this one needs its own copy while it waits for space
+            header = bytes(header)
+        padding = manager._get_buffer_padding(max_length, clear_buffer)
+
+        written = 1
+        if padding != None:
+            written = await self._write_packet(write_buffer, padding, None, timeout)
+        if written > 0:
+            written = await self._write_packet(write_buffer, message, header, timeout)
+        manager._count_buffer_write(write_buffer, message, written)
+        return written
+
+    async def write_to_characteristic(self, characteristic, message: str, max_length: int = None, clear_buffer: bool = True) -> bytearray:
+        await self.sleep(0)
+        return self.manager.write_to_characteristic(characteristic, message, max_length, clear_buffer)
+
+    # This hands values to subscriptions (see BluetoothManager.subscribe()) and services every connected peripheral forever,
+    # start it as its own task with asyncio.create_task(ble_manager.run_subscriptions())
+    #
+    # (optional) interval -> float = None: How long to wait in seconds between updates, None uses poll_interval
+    async def run_subscriptions(self, interval: float = None):
+        while True:
+            if len(self.manager.connections) > 0:
+                self.manager.service_connections()
+            else:
+                self.manager.update_subscriptions()
+            await self.sleep(self.poll_interval if interval == None else interval)
+
+    #
+    # Peripheral Functions
+    #
+
+    async def start_advertising(self, advertisement, interval: float = 0.1):
+        await self.sleep(0)
+        self.manager.start_advertising(advertisement, interval)
+
+    async def stop_advertising(self):
+        await self.sleep(0)
+        self.manager.stop_advertising()
+
+    # This waits without blocking until a host has connected to us, returns False if timeout runs out first
+    # (optional) timeout -> float = None: How long to wait in seconds, None waits until a host connects
+    async def wait_for_connection(self, timeout: float = None) -> bool:
+        return await self._wait_for(self.manager.get_bluetooth_connection_state, timeout)
+
+    #
+    # Helpers
+    #
+
+    # This waits until condition returns True, returns False if timeout runs out first
+    async def _wait_for(self, condition, timeout: float = None) -> bool:
+        backend = self.manager._backend
+        deadline = None if timeout == None else backend.monotonic() + timeout
+
+        while not condition():
+            if deadline != None and backend.monotonic() >= deadline:
+                return False
+            await self.sleep(self.poll_interval)
+        return True
+
+    # This writes a single packet (with header in front of it if it isn't None), waiting for space in the buffer whenever it's full
+    async def _write_packet(self, write_buffer, packet: bytes, header: bytes = None, timeout: float = None) -> int:
+        written = write_buffer.write(packet, header=header)
+        if written > 0:
+            return written
+
+        backend = self.manager._backend
+        deadline = None if timeout == None else backend.monotonic() + timeout
+        while True:
+            if deadline != None and backend.monotonic() >= deadline:
+                return 0
+            await self.sleep(self.poll_interval)
+            written = write_buffer.write(packet, header=header)
+            if written > 0:
+                return written
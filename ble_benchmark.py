@@ -0,0 +1,469 @@
+#
+# Libraries
+#
+
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from ble_management import BluetoothManager, FRAMING_NONE, FRAMING_LENGTH, FRAMING_SEQUENCE, match_name
+from ble_simulator import SimulatedAir, SimulatedBackend
+from ble_transport import FragmentTransport
+from ble_codec import DeltaCodec
+from ble_rpc import RpcServer, RpcClient, RPC_OK
+from ble_sampling import SensorSampler
+from ble_file_transfer import FileTransferServer, FileTransferClient, STATUS_OK
+
+# This benchmarks the BluetoothManager read and write functions over the simulated radio in ble_simulator, so it runs on
+# a regular computer (and in CI) without any boards. Every number comes from the simulator's virtual clock which means
+# the results only change when the modelled link or the manager's code changes
+#
+# Run it with: python ble_benchmark.py --messages 500 --json
+
+#
+# Variables
+#
+
+## These are the uuids used by the benchmark's peripheral for its service and characteristic
+SERVICE_UUID = "0x185A"
+CHARACTERISTIC_UUID = "0x2BDE"
+
+## The size in bytes of a snapshot sent by the fragment transport benchmark
+SNAPSHOT_SIZE = 1024
+
+## How many samples the codec benchmark sends in a single notification
+SAMPLES_PER_MESSAGE = 8
+
+## How many calls the rpc benchmark keeps waiting for a response at once
+RPC_IN_FLIGHT = 16
+
+## The properties of the benchmark's characteristic (Write No Response, Write, Read, Notify, Indicate, Broadcast)
+CHARACTERISTIC_PROPERTIES = [True, True, True, True, False, False]
+
+#
+# Functions
+#
+
+# This creates a host and a peripheral in the same air and connects them together
+#
+# air -> SimulatedAir: The air both boards will live in
+# (optional) max_length -> int = 20: The max length of the peripheral's characteristic
+# (optional) properties -> list = CHARACTERISTIC_PROPERTIES: The properties of the peripheral's characteristic
+# (optional) framing -> int = FRAMING_NONE: The message_framing both managers will use
+#
+# Returns a tuple of (host manager, peripheral manager, host's remote characteristic, peripheral's local characteristic)
+def create_loopback(air: SimulatedAir, max_length: int = 20, properties: list = CHARACTERISTIC_PROPERTIES, framing: int = FRAMING_NONE) -> tuple:
+    host = BluetoothManager(SimulatedBackend(air, name="Host"))
+    peripheral = BluetoothManager(SimulatedBackend(air, name="Peripheral"))
+    peripheral.bluetooth_mode_peripheral = True
+    host.message_framing = framing
+    peripheral.message_framing = framing
+
+    p_service = peripheral.create_service(SERVICE_UUID)
+    p_characteristic = peripheral.add_characteristic_to_service(p_service, CHARACTERISTIC_UUID, properties=properties, max_length=max_length)
+    peripheral.start_advertising(peripheral._backend.create_services_advertisement(p_service))
+
+    detected_devices = host.start_scanning(timeout=1)
+    host.connect(detected_devices, "Peripheral")
+
+    h_characteristic = None
+    for service in host.discover_device_services([SERVICE_UUID]):
+        for characteristic in service.characteristics:
+            if characteristic.uuid == p_characteristic.uuid:
+                h_characteristic = characteristic
+
+    return host, peripheral, h_characteristic, p_characteristic
+
+# This returns the value at the specified percentile (0 - 100) of a list of numbers
+def percentile(values: list, percent: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[int(round((percent / 100) * (len(ordered) - 1)))]
+
+# This turns the raw measurements of a benchmark into the numbers we report
+def summarize(messages: int, payload_bytes: int, elapsed: float, latencies: list) -> dict:
+    elapsed = max(elapsed, 1e-9)
+    return {
+        "messages": messages,
+        "messages_per_second": messages / elapsed,
+        "bytes_per_second": payload_bytes / elapsed,
+        "p50_latency_ms": percentile(latencies, 50) * 1000,
+        "p99_latency_ms": percentile(latencies, 99) * 1000,
+    }
+
+# This turns a received line back into the sequence number it was sent with, returns None for anything else
+def parse_sequence(line: bytes):
+    text = line.strip()
+    if len(text) == 0 or not text.isdigit():
+        return None
+    return int(text)
+
+# Host writes to the peripheral's characteristic directly (a write with response per call)
+def benchmark_write_to_characteristic(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    latencies = []
+    payload_bytes = 0
+    start = air.now
+
+    for sequence in range(messages):
+        message = str(sequence) + "\n"
+        sent = air.now
+        host.write_to_characteristic(h_characteristic, message)
+
+        # Writes with a response have landed on the peripheral once the call returns
+        if parse_sequence(peripheral.read_from_characteristic(p_characteristic)) == sequence:
+            latencies.append(air.now - sent)
+            payload_bytes += len(message)
+
+    return summarize(len(latencies), payload_bytes, air.now - start, latencies)
+
+# Host streams to the peripheral with a PacketBuffer which the peripheral reads with a CharacteristicBuffer
+def benchmark_write_to_characteristic_with_buffer(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    write_buffer = host.create_packet_buffer(h_characteristic, buffer_size=4, max_packet_size=20)
+    read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=0, buffer_size=256)
+    return _stream(air, messages, lambda message: host.write_to_characteristic_with_buffer(write_buffer, message), peripheral, read_buffer)
+
+# Host reads the peripheral's characteristic directly (a read request and response per call)
+def benchmark_read_from_characteristic(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    latencies = []
+    payload_bytes = 0
+    start = air.now
+
+    for sequence in range(messages):
+        message = str(sequence) + "\n"
+        peripheral.write_to_characteristic(p_characteristic, message)
+        sent = air.now
+        value = host.read_from_characteristic(h_characteristic)
+        if parse_sequence(value) == sequence:
+            latencies.append(air.now - sent)
+            payload_bytes += len(value)
+
+    return summarize(len(latencies), payload_bytes, air.now - start, latencies)
+
+# Peripheral streams notifications with a PacketBuffer which the host reads with a CharacteristicBuffer
+def benchmark_read_from_characteristic_with_buffer(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    read_buffer = host.create_characteristic_buffer(h_characteristic, timeout=0, buffer_size=256)
+    write_buffer = peripheral.create_packet_buffer(p_characteristic, buffer_size=4, max_packet_size=20)
+    return _stream(air, messages, lambda message: peripheral.write_to_characteristic_with_buffer(write_buffer, message), host, read_buffer)
+
+# Peripheral sets its characteristic's value and the host gets it through a subscription instead of reading it
+def benchmark_subscribe(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    received = []
+    host.subscribe(h_characteristic, lambda characteristic, value: received.append(parse_sequence(value)))
+    latencies = []
+    payload_bytes = 0
+    start = air.now
+
+    for sequence in range(messages):
+        message = str(sequence) + "\n"
+        sent = air.now
+        peripheral.write_to_characteristic(p_characteristic, message, clear_buffer=False)
+        while sequence not in received and air.step():
+            host.update_subscriptions()
+        if sequence in received:
+            latencies.append(air.now - sent)
+            payload_bytes += len(message)
+        del received[:]
+
+    return summarize(len(latencies), payload_bytes, air.now - start, latencies)
+
+# Peripheral notifies SAMPLES_PER_MESSAGE slowly changing samples at a time encoded with a DeltaCodec, every sample counts as a message
+def benchmark_codec(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    host.set_codec(h_characteristic, DeltaCodec())
+    peripheral.set_codec(p_characteristic, DeltaCodec())
+    received = []
+    host.subscribe(h_characteristic, lambda characteristic, value: received.extend(value))
+    latencies = []
+    payload_bytes = 0
+    start = air.now
+
+    for first in range(0, messages, SAMPLES_PER_MESSAGE):
+        # A sample that wanders a little from the one before it, like a temperature reading
+        samples = [20000 + (sequence % 7) - 3 for sequence in range(first, min(first + SAMPLES_PER_MESSAGE, messages))]
+        sent = air.now
+        peripheral.write_to_characteristic(p_characteristic, samples, clear_buffer=False)
+        while len(received) == 0 and air.step():
+            host.update_subscriptions()
+        if received == samples:
+            latencies.extend([air.now - sent] * len(samples))
+            payload_bytes += len(p_characteristic.value)
+        del received[:]
+
+    return summarize(len(latencies), payload_bytes, air.now - start, latencies)
+
+# Host calls a method on the peripheral that echoes its payload back, with up to RPC_IN_FLIGHT calls on their way at once.
+# The characteristic carries both the requests (written by the host) and the responses (notified by the peripheral)
+def benchmark_rpc(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    server = RpcServer(peripheral, p_characteristic, p_characteristic)
+    server.register(1, lambda payload: payload)
+    client = RpcClient(host, h_characteristic, h_characteristic, max_in_flight=RPC_IN_FLIGHT)
+    latencies = []
+    payload_bytes = 0
+    sequence = 0
+    start = air.now
+
+    def finished(sent: float, payload: bytes):
+        return lambda status, response: latencies.append(air.now - sent) if status == RPC_OK and response == payload else None
+
+    while sequence < messages or client.in_flight > 0:
+        while sequence < messages:
+            payload = bytes(str(sequence), 'utf-8')
+            if client.call(1, payload, finished(air.now, payload)) == None:
+                break
+            payload_bytes += len(payload)
+            sequence += 1
+
+        if not air.step():
+            break
+        server.update()
+        client.update()
+
+    return summarize(len(latencies), payload_bytes, air.now - start, latencies)
+
+# Host sends SNAPSHOT_SIZE byte snapshots to the peripheral with a FragmentTransport, the packet size is set by the air's mtu
+def benchmark_fragment_transport(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, max_length=244, framing=framing)
+    sender = FragmentTransport(host, write_buffer=host.create_packet_buffer(h_characteristic, buffer_size=4, max_packet_size=244), max_message_size=SNAPSHOT_SIZE)
+    receiver = FragmentTransport(peripheral, read_buffer=peripheral.create_packet_buffer(p_characteristic, buffer_size=64, max_packet_size=244), max_message_size=SNAPSHOT_SIZE)
+    snapshot = bytearray(SNAPSHOT_SIZE)
+    latencies = []
+    start = air.now
+
+    for sequence in range(messages):
+        snapshot[0] = sequence & 0xFF
+        sent = air.now
+        sender.write(snapshot)
+
+        message = receiver.receive()
+        while message == None and air.step():
+            message = receiver.receive()
+        if message != None and message[0] == sequence & 0xFF:
+            latencies.append(air.now - sent)
+
+    return summarize(len(latencies), len(latencies) * SNAPSHOT_SIZE, air.now - start, latencies)
+
+# Host pulls a SNAPSHOT_SIZE byte file off the peripheral's FileTransferServer over and over, the packet size is set by the air's mtu
+def benchmark_file_transfer(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, max_length=244, framing=framing)
+    root = tempfile.mkdtemp()
+    snapshot = bytes(range(256)) * (SNAPSHOT_SIZE // 256)
+    with open(root + "/snapshot", "wb") as file:
+        file.write(snapshot)
+
+    server = FileTransferServer(peripheral, p_characteristic, p_characteristic, root=root)
+    client = FileTransferClient(host, SERVICE_UUID, CHARACTERISTIC_UUID)
+    latencies = []
+    start = air.now
+
+    try:
+        for sequence in range(messages):
+            sent = air.now
+            destination = io.BytesIO()
+            client.start_pull("snapshot", destination, resume=False)
+            while client.status == None:
+                client.update()
+                server.update()
+                if client.status == None and not air.step():
+                    air.sleep(client.ack_delay)
+            if client.status == STATUS_OK and destination.getvalue() == snapshot:
+                latencies.append(air.now - sent)
+    finally:
+        shutil.rmtree(root)
+
+    return summarize(len(latencies), len(latencies) * SNAPSHOT_SIZE, air.now - start, latencies)
+
+# Host queues small messages in a SendQueue which joins them into full packets, the peripheral reads them with a CharacteristicBuffer
+def benchmark_send_queue(air: SimulatedAir, messages: int, framing: int = FRAMING_NONE) -> dict:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    send_queue = host.create_send_queue(host.create_packet_buffer(h_characteristic, buffer_size=4, max_packet_size=20), max_packet_size=20, capacity=8)
+    read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=0, buffer_size=512)
+    sent_times = {}
+    latencies = []
+    payload_bytes = 0
+    sequence = 0
+    received = bytearray()
+    start = air.now
+
+    while len(latencies) < messages:
+        while sequence < messages and send_queue.send(str(sequence) + "\n"):
+            sent_times[sequence] = air.now
+            sequence += 1
+        host.update_send_queues()
+
+        # A message can be split across two packets without framing so whole lines are put back together first
+        lines = []
+        if framing == FRAMING_NONE:
+            if read_buffer.in_waiting > 0:
+                received += read_buffer.read(read_buffer.in_waiting)
+            while b"\n" in received:
+                end = received.index(b"\n") + 1
+                lines.append(bytes(received[:end]))
+                del received[:end]
+        else:
+            while read_buffer.in_waiting > 0:
+                lines.append(peripheral.read_from_characteristic_with_buffer(read_buffer))
+
+        for line in lines:
+            number = parse_sequence(line)
+            if number in sent_times:
+                latencies.append(air.now - sent_times.pop(number))
+                payload_bytes += len(line)
+
+        # If nothing is on its way then wait for the packet being filled to reach its max_delay
+        if not air.step():
+            if send_queue.pending == 0 and sequence >= messages:
+                break
+            air.sleep(send_queue.max_delay)
+
+    return summarize(len(latencies), payload_bytes, air.now - start, latencies)
+
+# This pushes numbered messages through write as fast as it accepts them and reads them back on the other side
+def _stream(air: SimulatedAir, messages: int, write, reader: BluetoothManager, read_buffer) -> dict:
+    sent_times = {}
+    latencies = []
+    payload_bytes = 0
+    sequence = 0
+    start = air.now
+
+    while len(latencies) < messages:
+        # Keep writing until the buffer is full
+        while sequence < messages:
+            message = str(sequence) + "\n"
+            if write(message) <= 0:
+                break
+            sent_times[sequence] = air.now
+            sequence += 1
+
+        # Drain everything that has arrived so far
+        while read_buffer.in_waiting > 0:
+            line = reader.read_from_characteristic_with_buffer(read_buffer)
+            received = parse_sequence(line)
+            if received in sent_times:
+                latencies.append(air.now - sent_times.pop(received))
+                payload_bytes += len(line)
+
+        # Wait for the next packet to land, if nothing is on its way then whatever is left was lost
+        if not air.step() and sequence >= messages:
+            break
+
+    return summarize(len(latencies), payload_bytes, air.now - start, latencies)
+
+## Every benchmark by the name of the function it measures
+BENCHMARKS = {
+    "write_to_characteristic": benchmark_write_to_characteristic,
+    "write_to_characteristic_with_buffer": benchmark_write_to_characteristic_with_buffer,
+    "read_from_characteristic": benchmark_read_from_characteristic,
+    "read_from_characteristic_with_buffer": benchmark_read_from_characteristic_with_buffer,
+    "subscribe": benchmark_subscribe,
+    "send_queue": benchmark_send_queue,
+    "codec": benchmark_codec,
+    "rpc": benchmark_rpc,
+    "fragment_transport": benchmark_fragment_transport,
+    "file_transfer": benchmark_file_transfer,
+}
+
+## The message_framing to benchmark by the name used for it on the command line
+FRAMINGS = {
+    "none": FRAMING_NONE,
+    "length": FRAMING_LENGTH,
+    "sequence": FRAMING_SEQUENCE,
+}
+
+# This measures how long ble_management takes to import and how much memory that takes, then how long it takes on the
+# virtual clock from a peripheral booting (making its manager, service and sampler and advertising) to a host getting its first sample.
+# The import is measured on this computer so it only shows how much is done at import time, not how long a board takes
+def measure_startup(**air_settings) -> dict:
+    # The modules are imported again from scratch and put back afterwards so the rest of the benchmarks keep using the same ones
+    saved_modules = {}
+    for name in ("ble_management", "ble_simulator"):
+        saved_modules[name] = sys.modules.pop(name)
+    tracemalloc.start()
+    started = time.perf_counter()
+    __import__("ble_management")
+    import_time = time.perf_counter() - started
+    import_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    sys.modules.update(saved_modules)
+
+    air = SimulatedAir(**air_settings)
+    host = BluetoothManager(SimulatedBackend(air, name="Host"))
+    boot = air.now
+    peripheral = BluetoothManager(SimulatedBackend(air, name="Peripheral"))
+    peripheral.bluetooth_mode_peripheral = True
+    p_service = peripheral.declare_service(SERVICE_UUID)
+    p_characteristic = peripheral.declare_characteristic(p_service, CHARACTERISTIC_UUID, properties=CHARACTERISTIC_PROPERTIES)
+    sampler = SensorSampler(peripheral, p_characteristic, sensors=(lambda: 1,), batch_size=1)
+    peripheral.start_advertising(peripheral.create_services_advertisement(p_service))
+
+    # connect() finds the peripheral in the scan cache so it doesn't need the results of the scan
+    host.find_device(match_name("Peripheral"), timeout=5)
+    host.connect(None, "Peripheral")
+    h_characteristic = host.find_characteristic(SERVICE_UUID, CHARACTERISTIC_UUID)
+    host.set_codec(h_characteristic, DeltaCodec())
+    received = []
+    host.subscribe(h_characteristic, lambda characteristic, value: received.append(value))
+    while len(received) == 0 and air.now - boot < 5:
+        sampler.update()
+        air.sleep(0.001)
+        host.update_subscriptions()
+
+    return {
+        "import_ms": import_time * 1000,
+        "import_kb": import_memory / 1024,
+        "first_sample_ms": (air.now - boot) * 1000 if len(received) > 0 else None,
+    }
+
+# This runs every benchmark with a fresh air made from air_settings (see SimulatedAir for the settings)
+def run_benchmarks(messages: int = 200, framing: int = FRAMING_NONE, **air_settings) -> dict:
+    results = {}
+    for name, benchmark in BENCHMARKS.items():
+        results[name] = benchmark(SimulatedAir(**air_settings), messages, framing)
+    return results
+
+def print_results(results: dict):
+    print("%-40s %10s %12s %12s %10s %10s" % ("function", "messages", "msg/s", "bytes/s", "p50 ms", "p99 ms"))
+    for name, result in results.items():
+        print("%-40s %10d %12.1f %12.1f %10.2f %10.2f" % (name, result["messages"], result["messages_per_second"], result["bytes_per_second"], result["p50_latency_ms"], result["p99_latency_ms"]))
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark BluetoothManager over a simulated radio")
+    parser.add_argument("--messages", type=int, default=200, help="messages to send in every benchmark")
+    parser.add_argument("--mtu", type=int, default=23, help="ATT MTU of the simulated link")
+    parser.add_argument("--interval", type=float, default=7.5, help="connection interval in milliseconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="extra one way latency in milliseconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="chance (0 - 1) that a packet needs retransmitting")
+    parser.add_argument("--framing", choices=sorted(FRAMINGS.keys()), default="none", help="message framing used by both boards")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the simulated radio")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    parser.add_argument("--startup", action="store_true", help="measure import time, import memory and time to the first sample instead")
+    args = parser.parse_args(argv)
+
+    air_settings = {"connection_interval": args.interval / 1000, "latency": args.latency / 1000, "mtu": args.mtu, "packet_loss": args.loss, "seed": args.seed}
+    if args.startup:
+        results = measure_startup(**air_settings)
+        if args.json:
+            print(json.dumps(results, indent=2, sort_keys=True))
+        else:
+            print("import: %.1f ms, %.1f KB  first sample: %.1f ms" % (results["import_ms"], results["import_kb"], results["first_sample_ms"]))
+        return 0
+
+    results = run_benchmarks(args.messages, FRAMINGS[args.framing], **air_settings)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print_results(results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#
+# Libraries
+#
+
+from ble_management import BluetoothManager
+
+#
+# Variables
+#
+
+## The type of the advertisement field that holds manufacturer data, its first two bytes are the company id (low byte first)
+MANUFACTURER_DATA = 0xFF
+
+## 0xFFFF is the company id the Bluetooth SIG set aside for testing, boards that aren't a product of a company can use it
+TEST_COMPANY_ID = 0xFFFF
+
+## Every payload goes out after a 4 byte header (company id low and high byte, sequence number, slot)
+HEADER_LENGTH = 4
+
+## The largest payload that fits in a legacy advertisement (31 bytes minus 3 for the flags and 2 for the field's length and type)
+## and in an extended advertisement (255 bytes minus the same 5)
+MAX_PAYLOAD_LENGTH = 31 - 5 - HEADER_LENGTH
+MAX_EXTENDED_PAYLOAD_LENGTH = 255 - 5 - HEADER_LENGTH
+
+
+# This is a single payload a TelemetryCollector heard from a board
+class TelemetryReading:
+    __slots__ = ("address", "slot", "sequence", "payload", "rssi", "time")
+
+    def __init__(self, address, slot: int, sequence: int, payload: bytes, rssi: int, time: float):
+        self.address = address
+        self.slot = slot
+        self.sequence = sequence
+        self.payload = payload
+        self.rssi = rssi
+        self.time = time
+
+    def __repr__(self) -> str:
+        return "TelemetryReading(" + repr(self.address) + ", slot=" + str(self.slot) + ", sequence=" + str(self.sequence) + ", payload=" + repr(self.payload) + ")"
+
+
+# This sends sensor values to anyone listening without ever connecting, by putting them in the manufacturer data of our
+# advertisement. Every payload lives in a slot, when there's more than one slot they take turns being advertised every
+# rotate_interval seconds. Every time a slot is given a new payload its sequence number goes up so a TelemetryCollector
+# can tell a new value apart from the same advertisement heard twice.
+#
+# The advertisement isn't connectable, so while broadcasting nobody can connect to us.
+#
+# manager -> BluetoothManager: The manager to advertise with, it has to be in peripheral mode
+# (optional) company_id -> int = TEST_COMPANY_ID: The company id that goes in front of every payload, collectors only read payloads with theirs
+# (optional) interval -> float = 0.1: The time in seconds between advertisements (0.02 - 10.24)
+# (optional) rotate_interval -> float = 0.5: How long in seconds each slot is advertised before moving on to the next one
+# (optional) slots -> int = 1: How many payloads take turns being advertised (1 - 256)
+# (optional) extended -> bool = False: When true payloads can be up to MAX_EXTENDED_PAYLOAD_LENGTH bytes,
+# but only boards that support extended advertising can send them and only scans with extended=True will hear them
+class TelemetryBroadcaster:
+    def __init__(self, manager: BluetoothManager, company_id: int = TEST_COMPANY_ID, interval: float = 0.1, rotate_interval: float = 0.5, slots: int = 1, extended: bool = False):
+        if slots < 1 or slots > 256:
+            raise ValueError("ERROR: A broadcaster must have between 1 and 256 slots!")
+
+        self._manager = manager
+        self.company_id = company_id
+        self.interval = interval
+        self.rotate_interval = rotate_interval
+        self.max_payload_length = MAX_EXTENDED_PAYLOAD_LENGTH if extended else MAX_PAYLOAD_LENGTH
+
+        ## broadcasting is whether start() has been called without stop() since
+        self.broadcasting = False
+
+        self._payloads = [None] * slots
+        self._sequences = bytearray(slots)
+        self._slot = 0
+        self._on_air_sequence = None
+        self._next_rotation = 0
+        self._last_start = None
+
+        self._advertisement = manager._backend.create_advertisement()
+        self._advertisement.connectable = False
+
+    # This gives a slot a new payload, it goes on the air the next time update() is called if that slot is being advertised
+    # payload -> bytes: The payload to send, at most max_payload_length bytes
+    # (optional) slot -> int = 0: The slot to put the payload in
+    def set(self, payload, slot: int = 0):
+        if slot < 0 or slot >= len(self._payloads):
+            raise ValueError("ERROR: Slot " + str(slot) + " does not exist!")
+        if len(payload) > self.max_payload_length:
+            raise ValueError("ERROR: Payload is " + str(len(payload)) + " bytes but only " + str(self.max_payload_length) + " fit in an advertisement!")
+
+        self._payloads[slot] = bytes(payload)
+        self._sequences[slot] = (self._sequences[slot] + 1) & 0xFF
+
+    # This starts broadcasting whatever slots have a payload
+    def start(self):
+        self.broadcasting = True
+        self._on_air_sequence = None
+        self._next_rotation = self._manager._backend.monotonic()
+        self.update()
+
+    # This stops broadcasting, the payloads are kept for when start() is called again
+    def stop(self):
+        self.broadcasting = False
+        if self._manager.get_bluetooth_advertising_state():
+            self._manager.stop_advertising()
+
+    # This should be called every frame while broadcasting. It moves on to the next slot once rotate_interval has passed and
+    # puts a new payload on the air (at most once every interval seconds so the radio isn't restarted for nothing).
+    # Returns True if what we're advertising changed
+    def update(self) -> bool:
+        if not self.broadcasting:
+            return False
+
+        now = self._manager._backend.monotonic()
+        slot = self._slot
+        if now >= self._next_rotation:
+            self._next_rotation = now + self.rotate_interval
+            for offset in range(1, len(self._payloads) + 1):
+                candidate = (self._slot + offset) % len(self._payloads)
+                if self._payloads[candidate] != None:
+                    slot = candidate
+                    break
+
+        if self._payloads[slot] == None:
+            return False
+        if slot == self._slot and self._sequences[slot] == self._on_air_sequence:
+            return False
+        if slot == self._slot and self._last_start != None and now - self._last_start < self.interval:
+            return False
+
+        self._advertise(slot, now)
+        return True
+
+    def _advertise(self, slot: int, now: float):
+        sequence = self._sequences[slot]
+        header = bytes((self.company_id & 0xFF, (self.company_id >> 8) & 0xFF, sequence, slot))
+        self._advertisement.data_dict[MANUFACTURER_DATA] = header + self._payloads[slot]
+
+        # An advertisement can't be changed while it's going out, so it has to be restarted
+        if self._manager.get_bluetooth_advertising_state():
+            self._manager.stop_advertising()
+        self._manager.start_advertising(self._advertisement, self.interval)
+
+        self._slot = slot
+        self._on_air_sequence = sequence
+        self._last_start = now
+
+
+# This listens for the payloads of any number of TelemetryBroadcasters at once with a passive scan, so the boards sending
+# them never see a scan request. Since the same advertisement is heard many times, a payload is only handed over when its
+# sequence number is different from the last one heard from that board and slot.
+#
+# manager -> BluetoothManager: The manager to scan with, it has to be in host mode
+# (optional) company_id -> int = TEST_COMPANY_ID: Only payloads with this company id are read
+# (optional) capacity -> int = 64: How many boards and slots the last sequence number is remembered for,
+# the one heard from longest ago is forgotten first so memory stays the same no matter how many boards are around
+class TelemetryCollector:
+    def __init__(self, manager: BluetoothManager, company_id: int = TEST_COMPANY_ID, capacity: int = 64):
+        self._manager = manager
+        self.company_id = company_id
+        self.capacity = capacity
+
+        ## The total amount of payloads that were handed over and that were thrown away for being heard before
+        self.readings_received = 0
+        self.duplicates_dropped = 0
+
+        # (address, slot) -> [last sequence number, time it was last heard]
+        self._last_sequences = {}
+
+    # This turns an advertisement into a TelemetryReading, None if it doesn't hold a payload with our company id
+    def decode(self, advertisement) -> TelemetryReading:
+        data = advertisement.data_dict.get(MANUFACTURER_DATA)
+        if data == None or len(data) < HEADER_LENGTH or data[0] | (data[1] << 8) != self.company_id:
+            return None
+        return TelemetryReading(advertisement.address, data[3], data[2], bytes(data[HEADER_LENGTH:]), advertisement.rssi, self._manager._backend.monotonic())
+
+    # This scans for payloads until timeout runs out and returns every new one in the order they were heard
+    # (optional) timeout -> float = 1.0: How long to scan for in seconds
+    # (optional) callback -> function(reading) = None: If given every new reading is passed to it instead of being returned
+    # (optional) extended -> bool = False: When true payloads sent with extended advertising are heard too
+    # The rest of the arguments are the same as BluetoothManager.start_scanning()
+    def collect(self, timeout: float = 1.0, callback = None, extended: bool = False, buffer_size: int = None, interval: float = 0.1, window: float = 0.1, minimum_rssi: int = -80) -> list:
+        readings = []
+        for advertisement in self._manager.scan(None, buffer_size=buffer_size, extended=extended, timeout=timeout, interval=interval, window=window, minimum_rssi=minimum_rssi, filter_no_name=False, active=False, unique=False):
+            reading = self.decode(advertisement)
+            if reading == None:
+                continue
+            if not self._is_new(reading):
+                self.duplicates_dropped += 1
+                continue
+
+            self.readings_received += 1
+            if callback != None:
+                callback(reading)
+            else:
+                readings.append(reading)
+        return readings
+
+    # This forgets every sequence number so the next payload from every board is new again
+    def reset(self):
+        self._last_sequences = {}
+
+    def _is_new(self, reading: TelemetryReading) -> bool:
+        key = (reading.address, reading.slot)
+        last = self._last_sequences.get(key)
+        if last != None:
+            last[1] = reading.time
+            if last[0] == reading.sequence:
+                return False
+            last[0] = reading.sequence
+            return True
+
+        if len(self._last_sequences) >= self.capacity:
+            oldest = None
+            for other, value in self._last_sequences.items():
+                if oldest == None or value[1] < self._last_sequences[oldest][1]:
+                    oldest = other
+            del self._last_sequences[oldest]
+        self._last_sequences[key] = [reading.sequence, reading.time]
+        return True
@@ -0,0 +1,239 @@
+#
+# Libraries
+#
+
+import struct
+
+#
+# Variables
+#
+
+## These are the first byte of a message from a DeltaCodec, a keyframe holds the values themselves and a delta holds
+## how much every value changed since the previous sample
+DELTA_KEYFRAME = 0
+DELTA_CHANGE = 1
+
+## Every message from a DeltaCodec starts with its type and a sequence number that goes up by 1 every message (0 - 255)
+DELTA_HEADER_LENGTH = 2
+
+## The most bytes a single value of a DeltaCodec can take, the change between two 32 bit numbers (the size of a sample
+## on the board) takes up to 33 bits once it's zigzag encoded which is 5 varint bytes
+DELTA_MAX_VALUE_LENGTH = 5
+
+
+# This packs a number that can be negative into a number that can't (0, -1, 1, -2, 2 become 0, 1, 2, 3, 4)
+# so small negative numbers stay small as varints
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+# This adds a number to data as a varint, 7 bits per byte with the top bit set on every byte but the last
+def _write_varint(data: bytearray, value: int):
+    while value > 0x7F:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+
+# This gets how many bytes a number takes as a varint
+def _get_varint_length(value: int) -> int:
+    length = 1
+    while value > 0x7F:
+        value >>= 7
+        length += 1
+    return length
+
+# This reads a varint from data starting at offset, it returns the number and the offset after it
+def _read_varint(data, offset: int) -> tuple:
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("ERROR: Varint is cut off!")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+# This packs values with a struct format so every value takes exactly as many bytes as its type needs
+# (EX "<hhh" packs 3 signed 16 bit numbers into 6 bytes instead of up to 21 bytes of text)
+#
+# format -> str: The struct format of a message, see the struct module for the characters it can hold
+class StructCodec:
+    ## A codec is stateful when decoding a message depends on the messages before it
+    stateful = False
+
+    def __init__(self, format: str):
+        self.format = format
+        self.size = struct.calcsize(format)
+
+        # A format with a single value is encoded from and decoded to that value instead of a tuple
+        self._single = len(struct.unpack(format, bytes(self.size))) == 1
+
+    # values -> tuple or list: The values to pack (or a single value if the format only has one)
+    def encode(self, values) -> bytes:
+        if self._single:
+            return struct.pack(self.format, values)
+        return struct.pack(self.format, *values)
+
+    def decode(self, data):
+        if len(data) != self.size:
+            raise ValueError("ERROR: Message is " + str(len(data)) + " bytes but " + self.format + " needs " + str(self.size) + "!")
+        values = struct.unpack(self.format, data)
+        return values[0] if self._single else values
+
+    def __repr__(self) -> str:
+        return "StructCodec(" + repr(self.format) + ")"
+
+
+# This packs whole numbers as varints, so small numbers take a single byte and bigger ones only take the bytes they need.
+# A message is a list of numbers (a single number is sent as a list of one), so many samples fit in a single packet
+#
+# (optional) signed -> bool = True: If true negative numbers can be sent (they're zigzag encoded so small ones stay small)
+class VarintCodec:
+    stateful = False
+
+    def __init__(self, signed: bool = True):
+        self.signed = signed
+
+    # values -> int or list: The numbers to pack
+    def encode(self, values) -> bytes:
+        if isinstance(values, int):
+            values = (values,)
+        data = bytearray()
+        for value in values:
+            if self.signed:
+                value = _zigzag(value)
+            elif value < 0:
+                raise ValueError("ERROR: Cannot send negative numbers with an unsigned VarintCodec!")
+            _write_varint(data, value)
+        return bytes(data)
+
+    def decode(self, data) -> list:
+        values = []
+        offset = 0
+        while offset < len(data):
+            value, offset = _read_varint(data, offset)
+            values.append(_unzigzag(value) if self.signed else value)
+        return values
+
+    def __repr__(self) -> str:
+        return "VarintCodec(signed=" + str(self.signed) + ")"
+
+
+# This sends how much every value changed since the previous sample as varints instead of the values themselves, which
+# takes a single byte for a value that changes slowly (like a temperature or a light level). A message is a list of samples
+# with channels values each (EX [x, y, z, x, y, z] for 2 samples of an accelerometer with channels=3), the first sample
+# of a message is compared to the last sample of the message before it.
+#
+# Since a change is useless without the sample before it, every message carries a sequence number and every keyframe_interval
+# messages a keyframe with the values themselves is sent. A message heard twice is ignored, and once a message goes missing
+# (or when a receiver started listening late) decode() returns None until the next keyframe, so only that data is lost.
+# Each side of the connection needs its own DeltaCodec, one only encodes and the other only decodes, and every message has
+# to be decoded exactly once in the order it was sent. So it works with notifications and buffers but not with values that are
+# read directly, which BluetoothManager.read_from_characteristic() refuses.
+#
+# (optional) channels -> int = 1: How many values make up a single sample
+# (optional) keyframe_interval -> int = 16: How many messages are sent between keyframes, 1 sends only keyframes
+class DeltaCodec:
+    stateful = True
+
+    def __init__(self, channels: int = 1, keyframe_interval: int = 16):
+        if channels < 1:
+            raise ValueError("ERROR: A DeltaCodec needs at least 1 channel!")
+
+        self.channels = channels
+        self.keyframe_interval = keyframe_interval
+        self._encoded = [0] * channels
+        self._decoded = [0] * channels
+        self._since_keyframe = keyframe_interval
+        self._has_keyframe = False
+        self._encoded_sequence = 0
+        self._decoded_sequence = None
+
+    # values -> int or list: The samples to send, their length has to be a multiple of channels
+    def encode(self, values) -> bytes:
+        if isinstance(values, int):
+            values = (values,)
+        if len(values) % self.channels != 0:
+            raise ValueError("ERROR: A message must hold whole samples of " + str(self.channels) + " values!")
+
+        previous = self._encoded
+        keyframe = self._since_keyframe >= self.keyframe_interval
+        data = bytearray((DELTA_KEYFRAME if keyframe else DELTA_CHANGE, self._encoded_sequence))
+        for index in range(len(values)):
+            channel = index % self.channels
+            # A keyframe is the changes from a sample of all zeros, which are the values themselves
+            if keyframe and index < self.channels:
+                previous[channel] = 0
+            _write_varint(data, _zigzag(values[index] - previous[channel]))
+            previous[channel] = values[index]
+
+        self._since_keyframe = 1 if keyframe else self._since_keyframe + 1
+        self._encoded_sequence = (self._encoded_sequence + 1) & 0xFF
+        return bytes(data)
+
+    # This gets how many bytes encode() would turn values into without changing what the next message is compared to,
+    # so a sender can check that a message fits in a packet before encoding it
+    #
+    # values -> list: The samples to measure
+    # (optional) count -> int = None: Only measure the first count values (a multiple of channels), None measures all of them
+    def get_encoded_length(self, values, count: int = None) -> int:
+        if isinstance(values, int):
+            values = (values,)
+        if count == None:
+            count = len(values)
+
+        keyframe = self._since_keyframe >= self.keyframe_interval
+        length = DELTA_HEADER_LENGTH
+        for index in range(count):
+            if index >= self.channels:
+                previous = values[index - self.channels]
+            else:
+                previous = 0 if keyframe else self._encoded[index]
+            length += _get_varint_length(_zigzag(values[index] - previous))
+        return length
+
+    # This returns None when the message was already decoded, or when it can't be decoded because no keyframe has arrived
+    # since the start or since a message went missing
+    def decode(self, data) -> list:
+        if len(data) == 0:
+            return []
+        if len(data) < DELTA_HEADER_LENGTH:
+            raise ValueError("ERROR: Message is too short to be from a DeltaCodec!")
+
+        sequence = data[1]
+        if sequence == self._decoded_sequence:
+            return None
+        if data[0] == DELTA_KEYFRAME:
+            self._has_keyframe = True
+            for channel in range(self.channels):
+                self._decoded[channel] = 0
+        elif self._decoded_sequence == None or sequence != (self._decoded_sequence + 1) & 0xFF:
+            self._has_keyframe = False
+        self._decoded_sequence = sequence
+        if not self._has_keyframe:
+            return None
+
+        previous = self._decoded
+        values = []
+        offset = DELTA_HEADER_LENGTH
+        while offset < len(data):
+            change, offset = _read_varint(data, offset)
+            channel = len(values) % self.channels
+            previous[channel] += _unzigzag(change)
+            values.append(previous[channel])
+        return values
+
+    # This makes the next message a keyframe, and makes decode() wait for one
+    def reset(self):
+        self._since_keyframe = self.keyframe_interval
+        self._has_keyframe = False
+        self._decoded_sequence = None
+
+    def __repr__(self) -> str:
+        return "DeltaCodec(channels=" + str(self.channels) + ", keyframe_interval=" + str(self.keyframe_interval) + ")"
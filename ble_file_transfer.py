@@ -0,0 +1,862 @@
+#
+# Libraries
+#
+
+import os
+import struct
+import binascii
+from ble_management import BluetoothManager, FRAMING_NONE, PROPERTY_NOTIFY, PROPERTY_WRITE, PROPERTY_WRITE_NO_RESPONSE, RoleError
+
+#
+# Variables
+#
+
+## These are the first byte of every message and say what kind of message it is, the second byte is always the transfer id
+MESSAGE_OPEN = 1
+MESSAGE_ACCEPT = 2
+MESSAGE_DATA = 3
+MESSAGE_ACK = 4
+MESSAGE_CANCEL = 5
+
+## These are how the messages are laid out (see the struct module), OPEN is followed by the file's name and DATA by the chunk
+## OPEN: type, transfer id, mode, chunk length, size of a pushed file or offset to pull from
+## ACCEPT: type, transfer id, status, chunk length, size, offset
+## DATA: type, transfer id, chunk index, crc of the chunk
+## ACK: type, transfer id, index of the first chunk that hasn't arrived, which of the chunks after it have arrived
+OPEN_FORMAT = "<BBBBI"
+ACCEPT_FORMAT = "<BBBBII"
+DATA_FORMAT = "<BBHH"
+ACK_FORMAT = "<BBHI"
+OPEN_LENGTH = 8
+ACCEPT_LENGTH = 12
+DATA_HEADER_LENGTH = 6
+ACK_LENGTH = 8
+CANCEL_LENGTH = 3
+
+## A transfer either pulls a file off the peripheral or pushes one to it, MODE_RESUME is added to the mode to carry on from
+## what already made it across instead of starting over
+MODE_PULL = 0
+MODE_PUSH = 1
+MODE_RESUME = 0x80
+
+## These are what a transfer can end with
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_DENIED = 2
+STATUS_ERROR = 3
+STATUS_CANCELLED = 4
+
+## The most chunks that can be waiting to be acknowledged at once, an ack has room to say which of the 31 chunks after
+## the first missing one have arrived
+MAX_WINDOW = 32
+
+_STATUS_MESSAGES = {
+    STATUS_NOT_FOUND: "The file does not exist on the peripheral!",
+    STATUS_DENIED: "The peripheral does not allow this transfer!",
+    STATUS_ERROR: "The file could not be read or written!",
+    STATUS_CANCELLED: "The transfer was cancelled!",
+}
+
+
+# This turns a 16 bit chunk index from a message back into the whole index closest to reference
+def _unwrap_index(index: int, reference: int) -> int:
+    difference = (index - reference) & 0xFFFF
+    if difference >= 0x8000:
+        difference -= 0x10000
+    return reference + difference
+
+
+# This gets the crc a chunk is sent with, the lower half of its crc32 so it only takes 2 bytes of every packet
+def _get_chunk_crc(data) -> int:
+    return binascii.crc32(data) & 0xFFFF
+
+
+# This gets the most bytes of the file that fit in a single DATA message written with a buffer
+def _get_max_chunk_length(manager: BluetoothManager, buffer) -> int:
+    length = manager._get_buffer_packet_length(buffer) - DATA_HEADER_LENGTH
+    if manager.message_framing != FRAMING_NONE:
+        length -= manager._get_frame_header_length()
+    return min(length, 255)
+
+
+# This gets the size of a file in bytes, or None if it doesn't exist
+def _get_file_size(path: str) -> int:
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return None
+
+
+# This sends the part of a file from offset onwards as numbered chunks, and keeps up to window of them going at once without
+# waiting for each one to be acknowledged. Every chunk stays in its own slot until it has been acknowledged so it can be sent
+# again without reading the file again. A chunk is sent again when a chunk that was sent after it has arrived but it hasn't,
+# and every chunk that hasn't arrived is sent again when nothing has been acknowledged for a while
+class _ChunkSender:
+    def __init__(self, owner, transfer_id: int, file, size: int, offset: int, chunk_length: int, window: int):
+        self._owner = owner
+        self.transfer_id = transfer_id
+        self.file = file
+        self.size = size
+        self.offset = offset
+        self.chunk_length = chunk_length
+        self.window = window
+        self.total = (size - offset + chunk_length - 1) // chunk_length
+
+        ## The first chunk that hasn't been acknowledged and the next one that has never been sent
+        self.base = 0
+        self.next = 0
+
+        # Every slot holds a whole DATA message, and the order it was last sent in
+        self._packets = [bytearray(DATA_HEADER_LENGTH + chunk_length) for slot in range(window)]
+        self._lengths = [0] * window
+        self._sent_order = [0] * window
+        self._acked = [False] * window
+        self._sends = 0
+        self._loaded = -1
+        self._resend = []
+        self._progress_at = None
+        file.seek(offset)
+
+    # Whether every chunk has been acknowledged
+    @property
+    def done(self) -> bool:
+        return self.base >= self.total
+
+    # How many bytes of the file the receiver has, counting from the start of the file
+    @property
+    def confirmed(self) -> int:
+        return min(self.size, self.offset + self.base * self.chunk_length)
+
+    # This writes as many chunks as write() takes, the ones that have to be sent again go first.
+    # It returns how many were written
+    def send(self, write, now: float) -> int:
+        sent = 0
+        while len(self._resend) > 0:
+            index = self._resend[0]
+            slot = index % self.window
+            if index >= self.base and not self._acked[slot]:
+                if not write(memoryview(self._packets[slot])[:self._lengths[slot]]):
+                    return sent
+                self._sends += 1
+                self._sent_order[slot] = self._sends
+                self._owner.chunks_retransmitted += 1
+                sent += 1
+            self._resend.pop(0)
+
+        while self.next < self.total and self.next < self.base + self.window:
+            slot = self.next % self.window
+            if self._loaded != self.next:
+                self._load(self.next)
+            if not write(memoryview(self._packets[slot])[:self._lengths[slot]]):
+                break
+            if self.base == self.next:
+                self._progress_at = now
+            self._sends += 1
+            self._sent_order[slot] = self._sends
+            self.next += 1
+            self._owner.chunks_sent += 1
+            sent += 1
+        return sent
+
+    # This handles an ACK, it moves the window forward and picks out the chunks that were lost
+    def on_ack(self, index: int, bitmap: int, now: float):
+        arrived = _unwrap_index(index, self.base)
+        if arrived < self.base or arrived > self.next:
+            return
+        if arrived > self.base:
+            self.base = arrived
+            self._progress_at = now
+
+        # Any chunk that was sent before the latest one to arrive must have been lost
+        latest = 0
+        index = arrived + 1
+        while bitmap and index < self.next:
+            if bitmap & 1:
+                slot = index % self.window
+                self._acked[slot] = True
+                latest = max(latest, self._sent_order[slot])
+            bitmap >>= 1
+            index += 1
+
+        for index in range(self.base, self.next):
+            slot = index % self.window
+            if not self._acked[slot] and self._sent_order[slot] < latest and index not in self._resend:
+                self._resend.append(index)
+
+    # This sends every chunk that hasn't arrived again once nothing has been acknowledged for timeout seconds
+    def check_timeout(self, now: float, timeout: float):
+        if self.base == self.next or now - self._progress_at < timeout:
+            return
+
+        self._owner.timeouts += 1
+        self._progress_at = now
+        self._resend = [index for index in range(self.base, self.next) if not self._acked[index % self.window]]
+
+    # This reads a chunk from the file into its slot, the file is read in order so it never has to seek
+    def _load(self, index: int):
+        slot = index % self.window
+        packet = self._packets[slot]
+        length = min(self.chunk_length, self.size - self.offset - index * self.chunk_length)
+        chunk = memoryview(packet)[DATA_HEADER_LENGTH:DATA_HEADER_LENGTH + length]
+        if self.file.readinto(chunk) != length:
+            raise OSError("File ended before its size")
+
+        struct.pack_into(DATA_FORMAT, packet, 0, MESSAGE_DATA, self.transfer_id, index & 0xFFFF, _get_chunk_crc(chunk))
+        self._lengths[slot] = DATA_HEADER_LENGTH + length
+        self._acked[slot] = False
+        self._loaded = index
+
+
+# This writes the chunks of a file from offset onwards as they arrive. Chunks that arrive in order go straight into the file so
+# the file always ends where the confirmed part ends, and chunks that arrive after a gap wait in a slot until the gap is filled.
+# Chunks that don't match their crc are thrown away, the sender finds out they're missing from the acks
+class _ChunkReceiver:
+    def __init__(self, owner, transfer_id: int, file, size: int, offset: int, chunk_length: int, window: int):
+        self._owner = owner
+        self.transfer_id = transfer_id
+        self.file = file
+        self.size = size
+        self.offset = offset
+        self.chunk_length = chunk_length
+        self.window = window
+        self.total = (size - offset + chunk_length - 1) // chunk_length
+
+        ## The first chunk that hasn't arrived yet
+        self.next = 0
+
+        self._chunks = [bytearray(chunk_length) for slot in range(window)]
+        self._lengths = [0] * window
+        self._received = [False] * window
+        self._ack = bytearray(ACK_LENGTH)
+        self._unacked = 0
+        self._unacked_since = 0.0
+        # An empty transfer still needs an ack to tell the sender it's done
+        self._ack_due = self.total == 0
+
+    # Whether every chunk has arrived
+    @property
+    def done(self) -> bool:
+        return self.next >= self.total
+
+    # Whether the sender has been told about every chunk that arrived
+    @property
+    def settled(self) -> bool:
+        return not self._ack_due and self._unacked == 0
+
+    # How many bytes of the file have been written, counting from the start of the file
+    @property
+    def confirmed(self) -> int:
+        return min(self.size, self.offset + self.next * self.chunk_length)
+
+    # This handles a DATA message
+    def on_data(self, value: bytes, now: float):
+        index = _unwrap_index(struct.unpack_from("<H", value, 2)[0], self.next)
+        if index < self.next or index >= self.total:
+            # The sender didn't hear about it in time, so tell it again
+            self._owner.duplicates += 1
+            self._ack_due = True
+            return
+        if index >= self.next + self.window:
+            return
+
+        chunk = memoryview(value)[DATA_HEADER_LENGTH:]
+        length = min(self.chunk_length, self.size - self.offset - index * self.chunk_length)
+        if len(chunk) != length or _get_chunk_crc(chunk) != struct.unpack_from("<H", value, 4)[0]:
+            self._owner.crc_errors += 1
+            return
+
+        if index == self.next:
+            self.file.write(chunk)
+            self.next += 1
+            while self.next < self.total and self._received[self.next % self.window]:
+                slot = self.next % self.window
+                self.file.write(memoryview(self._chunks[slot])[:self._lengths[slot]])
+                self._received[slot] = False
+                self.next += 1
+        else:
+            slot = index % self.window
+            if self._received[slot]:
+                self._owner.duplicates += 1
+                return
+            self._chunks[slot][:length] = chunk
+            self._lengths[slot] = length
+            self._received[slot] = True
+            # Let the sender know about the gap straight away
+            self._ack_due = True
+
+        self._owner.chunks_received += 1
+        if self._unacked == 0:
+            self._unacked_since = now
+        self._unacked += 1
+        if self._unacked >= max(1, self.window // 2) or self.done:
+            self._ack_due = True
+
+    # This gets the ACK that should be sent now, or None if it can wait
+    def get_ack(self, now: float, ack_delay: float) -> bytearray:
+        if not self._ack_due and (self._unacked == 0 or now - self._unacked_since < ack_delay):
+            return None
+
+        bitmap = 0
+        for bit in range(self.window - 1):
+            if self._received[(self.next + 1 + bit) % self.window]:
+                bitmap |= 1 << bit
+        struct.pack_into(ACK_FORMAT, self._ack, 0, MESSAGE_ACK, self.transfer_id, self.next & 0xFFFF, bitmap)
+        return self._ack
+
+    # This notes that the ACK from get_ack() was sent
+    def acked(self):
+        self._ack_due = False
+        self._unacked = 0
+
+
+# The parts of a file transfer that FileTransferServer and FileTransferClient share, only one transfer runs at a time
+class _FileTransferEndpoint:
+    def __init__(self, manager: BluetoothManager, window: int, retransmit_timeout: float, ack_delay: float):
+        if window < 1 or window > MAX_WINDOW:
+            raise ValueError("ERROR: window must be between 1 and " + str(MAX_WINDOW) + "!")
+
+        self._manager = manager
+        self.window = window
+        self.retransmit_timeout = retransmit_timeout
+        self.ack_delay = ack_delay
+
+        ## The total amount of chunks that were sent for the first time, sent again, and that arrived
+        self.chunks_sent = 0
+        self.chunks_retransmitted = 0
+        self.chunks_received = 0
+
+        ## The total amount of chunks that were thrown away because they didn't match their crc or had already arrived,
+        ## and how many times nothing was acknowledged for retransmit_timeout seconds
+        self.crc_errors = 0
+        self.duplicates = 0
+        self.timeouts = 0
+
+        self._transfer_id = 0
+        self._sender = None
+        self._receiver = None
+        self._file = None
+        self._owns_file = False
+        self._pending = []
+        self._write_buffer = None
+
+    def _write(self, packet) -> bool:
+        return self._manager.write_to_characteristic_with_buffer(self._write_buffer, packet, None, False) > 0
+
+    # This sends the waiting control messages, then as many chunks or acks as the radio has room for
+    def _pump(self):
+        while len(self._pending) > 0:
+            if not self._write(self._pending[0]):
+                return
+            self._pending.pop(0)
+
+        now = self._manager._backend.monotonic()
+        if self._sender != None:
+            self._sender.check_timeout(now, self.retransmit_timeout)
+            self._sender.send(self._write, now)
+        elif self._receiver != None:
+            ack = self._receiver.get_ack(now, self.ack_delay)
+            if ack != None and self._write(ack):
+                self._receiver.acked()
+
+    # This handles the DATA and ACK messages of the transfer that's running
+    def _on_chunk_message(self, value: bytes):
+        if value[1] != self._transfer_id:
+            return
+        if value[0] == MESSAGE_DATA and self._receiver != None and len(value) >= DATA_HEADER_LENGTH:
+            self._receiver.on_data(value, self._manager._backend.monotonic())
+        elif value[0] == MESSAGE_ACK and self._sender != None and len(value) >= ACK_LENGTH:
+            message_type, transfer_id, index, bitmap = struct.unpack_from(ACK_FORMAT, value, 0)
+            self._sender.on_ack(index, bitmap, self._manager._backend.monotonic())
+
+    # This closes the file of the transfer (or flushes it if it was handed to us) so everything that was written is kept
+    def _close_file(self):
+        if self._file != None:
+            if self._owns_file:
+                self._file.close()
+                self._file = None
+            elif hasattr(self._file, "flush"):
+                self._file.flush()
+
+
+# This lets a host pull files off of our filesystem and push files onto it with a FileTransferClient (EX to get a log the
+# board has been writing, or to give it a new config file). The host writes to one of our characteristics and we notify
+# with another one (or the same one, if it allows both).
+#
+# Files are sent as chunks that each carry a crc, and up to window chunks are sent without waiting for them to be acknowledged.
+# A chunk that goes missing or arrives broken is sent again on its own instead of everything after it. If the connection
+# drops the host opens the transfer again once it's back and it carries on from the last byte that was confirmed.
+# On CircuitPython the filesystem has to be made writable for code (storage.remount("/", readonly=False) in boot.py)
+# before files can be pushed to it. The characteristics shouldn't have a codec (see set_codec())
+#
+# manager -> BluetoothManager: The manager the characteristics belong to, it has to be in peripheral mode
+# request_characteristic -> Characteristic: Our own characteristic the host writes to, it has to allow writing
+# response_characteristic -> Characteristic: Our own characteristic to notify the host with, it has to allow notify
+# (optional) root -> str = "/": The folder the host's file names are looked up in
+# (optional) window -> int = 16: The most chunks we send without them being acknowledged (1 - MAX_WINDOW)
+# (optional) retransmit_timeout -> float = 0.25: How long in seconds to wait for an ack before sending the chunks again
+# (optional) ack_delay -> float = 0.05: The longest we wait in seconds before acknowledging chunks that arrived
+# (optional) allow_push -> bool = True: Whether the host can write files, if False it can only pull them
+# (optional) buffer_size -> int = None: How many messages (packets) can wait between calls to update(), None makes room for window + 4
+class FileTransferServer(_FileTransferEndpoint):
+    def __init__(self, manager: BluetoothManager, request_characteristic, response_characteristic, root: str = "/", window: int = 16, retransmit_timeout: float = 0.25, ack_delay: float = 0.05, allow_push: bool = True, buffer_size: int = None):
+        if not response_characteristic.properties & PROPERTY_NOTIFY:
+            raise RoleError("ERROR: Cannot send files with a characteristic that does not allow for notify!")
+
+        super().__init__(manager, window, retransmit_timeout, ack_delay)
+        self.request_characteristic = request_characteristic
+        self.response_characteristic = response_characteristic
+        self.root = root
+        self.allow_push = allow_push
+
+        ## The name of the file being transferred, None while there isn't a transfer
+        self.name = None
+
+        ## The total amount of transfers that were finished, and that carried on from where an earlier one stopped
+        self.transfers_completed = 0
+        self.transfers_resumed = 0
+
+        if buffer_size == None:
+            buffer_size = window + 4
+        self._write_buffer = manager.create_packet_buffer(response_characteristic)
+        manager.subscribe(request_characteristic, self._on_request, buffer_size=buffer_size)
+
+    # Whether a file is being transferred
+    @property
+    def active(self) -> bool:
+        return self.name != None
+
+    # This handles every message that has arrived since the last call and sends as many chunks or acks as the radio has room for,
+    # call it once every frame. It also hands any other subscription its values (see BluetoothManager.update_subscriptions()).
+    # It returns how many chunks were sent or arrived
+    def update(self) -> int:
+        moved = self.chunks_sent + self.chunks_retransmitted + self.chunks_received
+        if not self._manager.get_bluetooth_connection_state():
+            # The host carries on from what we confirmed once it's back, so make sure it's all in the file
+            if self.active:
+                self._close()
+            return 0
+
+        self._manager.update_subscriptions()
+        try:
+            self._pump()
+        except OSError:
+            self._fail(STATUS_ERROR)
+
+        if self._sender != None and self._sender.done:
+            self._finish()
+        elif self._receiver != None and self._receiver.done and self._receiver.settled and self._file != None:
+            # The receiver stays around so chunks that are sent again after the last ack still get acknowledged
+            self._finish()
+        return self.chunks_sent + self.chunks_retransmitted + self.chunks_received - moved
+
+    def deinit(self):
+        self._close()
+        self._manager.unsubscribe(self.request_characteristic)
+        self._manager.deinit_buffer(self._write_buffer)
+
+    def _on_request(self, characteristic, value: bytes):
+        if len(value) < 2:
+            return
+
+        try:
+            if value[0] == MESSAGE_OPEN and len(value) >= OPEN_LENGTH:
+                self._open(value)
+            elif value[0] == MESSAGE_CANCEL:
+                if value[1] == self._transfer_id:
+                    self._close()
+            else:
+                self._on_chunk_message(value)
+        except OSError:
+            self._fail(STATUS_ERROR)
+
+    def _open(self, value: bytes):
+        message_type, transfer_id, mode, chunk_length, position = struct.unpack_from(OPEN_FORMAT, value, 0)
+        self._close()
+        self._transfer_id = transfer_id
+
+        name = str(bytes(value[OPEN_LENGTH:]), 'utf-8')
+        path = self._get_path(name)
+        resume = mode & MODE_RESUME
+        mode &= ~MODE_RESUME
+        size = position if mode == MODE_PUSH else 0
+        offset = position if mode == MODE_PULL else 0
+        existing = None if path == None else _get_file_size(path)
+
+        status = STATUS_OK
+        if path == None or (mode == MODE_PUSH and not self.allow_push) or mode > MODE_PUSH:
+            status = STATUS_DENIED
+        elif mode == MODE_PULL:
+            if existing == None:
+                status = STATUS_NOT_FOUND
+            else:
+                size = existing
+                if not resume or offset > size:
+                    offset = 0
+                chunk_length = _get_max_chunk_length(self._manager, self._write_buffer)
+                self._file = open(path, "rb")
+                self._sender = _ChunkSender(self, transfer_id, self._file, size, offset, chunk_length, self.window)
+        elif chunk_length == 0:
+            status = STATUS_ERROR
+        else:
+            offset = existing if resume and existing != None and existing <= size else 0
+            self._file = open(path, "ab" if offset > 0 else "wb")
+            self._receiver = _ChunkReceiver(self, transfer_id, self._file, size, offset, chunk_length, self.window)
+
+        if status == STATUS_OK:
+            self._owns_file = True
+            self.name = name
+            if offset > 0:
+                self.transfers_resumed += 1
+        else:
+            chunk_length = size = offset = 0
+        self._pending.append(struct.pack(ACCEPT_FORMAT, MESSAGE_ACCEPT, transfer_id, status, chunk_length, size, offset))
+
+    # This gets where a file the host asked for is, or None if the name tries to leave root
+    def _get_path(self, name: str) -> str:
+        if len(name) == 0 or ".." in name.split("/"):
+            return None
+        return self.root.rstrip("/") + "/" + name.lstrip("/")
+
+    def _finish(self):
+        self.transfers_completed += 1
+        self._close_file()
+        self._sender = None
+        self.name = None
+
+    def _fail(self, status: int):
+        self._pending.append(bytes((MESSAGE_CANCEL, self._transfer_id, status)))
+        self._close()
+
+    def _close(self):
+        self._close_file()
+        self._sender = None
+        self._receiver = None
+        self.name = None
+
+
+# This pulls files off of a peripheral's FileTransferServer and pushes files onto it. Up to window chunks are sent without
+# waiting for them to be acknowledged, so the transfer goes about as fast as the link does instead of waiting on every chunk.
+#
+# The client finds the server's characteristics by uuid, so when the connection drops it finds them again on the next
+# connection (made by connect() or by auto reconnect, see enable_auto_reconnect()) and carries on from the last confirmed
+# byte instead of starting over. A pulled file always ends where the confirmed part ends, so if the board resets in the middle
+# of a pull, pulling again with resume carries on from the end of the file.
+#
+# manager -> BluetoothManager: The manager to transfer with, it has to be in host mode
+# service_uuid -> str: The uuid of the peripheral's service written like a hex code ("0x185A")
+# request_uuid -> str: The uuid of the characteristic the server is written to
+# (optional) response_uuid -> str = None: The uuid of the characteristic the server notifies with, None if it's the same one
+# (optional) window -> int = 16: The most chunks we send without them being acknowledged (1 - MAX_WINDOW)
+# (optional) retransmit_timeout -> float = 0.25: How long in seconds to wait for an ack before sending the chunks again
+# (optional) ack_delay -> float = 0.05: The longest we wait in seconds before acknowledging chunks that arrived
+# (optional) open_timeout -> float = 1.0: How long in seconds to wait for the server to answer before asking again
+# (optional) buffer_size -> int = 4: How many packets the buffer messages are written with holds
+# (optional) address = None: The address of the peripheral, if None then ble is used
+class FileTransferClient(_FileTransferEndpoint):
+    def __init__(self, manager: BluetoothManager, service_uuid: str, request_uuid: str, response_uuid: str = None, window: int = 16, retransmit_timeout: float = 0.25, ack_delay: float = 0.05, open_timeout: float = 1.0, buffer_size: int = 4, address = None):
+        super().__init__(manager, window, retransmit_timeout, ack_delay)
+        self.service_uuid = service_uuid
+        self.request_uuid = request_uuid
+        self.response_uuid = request_uuid if response_uuid == None else response_uuid
+        self.open_timeout = open_timeout
+        self.buffer_size = buffer_size
+        self.address = address
+
+        ## What the last transfer ended with (STATUS_OK, STATUS_NOT_FOUND, STATUS_DENIED, STATUS_ERROR or STATUS_CANCELLED),
+        ## None while it's still going
+        self.status = None
+
+        ## The total amount of times a transfer carried on after the connection dropped
+        self.resumes = 0
+
+        self.request_characteristic = None
+        self.response_characteristic = None
+        self._link = None
+        self._mode = None
+        self._name = None
+        self._path = None
+        self._size = None
+        self._confirmed = 0
+        self._resume = False
+        self._accepted = False
+        self._opened = False
+        self._open_sent_at = None
+
+    # Whether a file is being transferred
+    @property
+    def active(self) -> bool:
+        return self._mode != None
+
+    # The size of the file being transferred in bytes, None until the server has said how big a pulled file is
+    @property
+    def size(self) -> int:
+        return self._size
+
+    # How many bytes of the file have made it across and been confirmed
+    @property
+    def confirmed(self) -> int:
+        if self._sender != None:
+            return self._sender.confirmed
+        if self._receiver != None:
+            return self._receiver.confirmed
+        return self._confirmed
+
+    # How much of the file has been confirmed (0 - 1)
+    @property
+    def progress(self) -> float:
+        if self._size == None:
+            return 0.0
+        if self._size == 0:
+            return 1.0
+        return self.confirmed / self._size
+
+    # This starts pulling a file off of the peripheral, call update() every frame until it's done (or use pull())
+    #
+    # remote_name -> str: The name of the file on the peripheral, it has to fit in a single packet after its 8 byte header
+    # destination -> str or file: The path to write the file to, or a file opened for writing in binary
+    # (optional) resume -> bool = True: Whether to carry on from the end of destination instead of starting over
+    def start_pull(self, remote_name: str, destination, resume: bool = True):
+        self._start(MODE_PULL, remote_name, resume)
+        if isinstance(destination, str):
+            self._path = destination
+            existing = _get_file_size(destination) if resume else None
+            self._confirmed = 0 if existing == None else existing
+        else:
+            self._file = destination
+            self._confirmed = destination.tell() if resume else 0
+        self._open_if_connected()
+
+    # This starts pushing a file onto the peripheral, call update() every frame until it's done (or use push())
+    #
+    # source -> str or file: The path of the file to send, or a file opened for reading in binary
+    # remote_name -> str: The name to give the file on the peripheral, it has to fit in a single packet after its 8 byte header
+    # (optional) resume -> bool = True: Whether to carry on from what the peripheral already has of the file instead of starting over
+    def start_push(self, source, remote_name: str, resume: bool = True):
+        self._start(MODE_PUSH, remote_name, resume)
+        if isinstance(source, str):
+            self._file = open(source, "rb")
+            self._owns_file = True
+            self._size = _get_file_size(source)
+        else:
+            self._file = source
+            source.seek(0, 2)
+            self._size = source.tell()
+        self._open_if_connected()
+
+    # This sends and handles everything it can for the transfer, call it once every frame. When the connection has dropped
+    # the transfer waits, and it's opened again as soon as there's a new connection to the peripheral.
+    # It also hands any other subscription its values (see BluetoothManager.update_subscriptions()).
+    # It returns how many chunks were sent or arrived
+    def update(self) -> int:
+        moved = self.chunks_sent + self.chunks_retransmitted + self.chunks_received
+        manager = self._manager
+        link = manager._get_link(self.address)
+        if link == None or not link.connected:
+            if self._link != None:
+                self._detach()
+            return 0
+
+        if link is not self._link:
+            # The connection can be replaced before an update sees it drop, so how far we got is remembered first
+            if self._link != None:
+                self._detach()
+            self._attach(link)
+        manager.update_subscriptions()
+        if self._mode == None:
+            # A CANCEL can still be waiting for room
+            self._pump()
+            return 0
+
+        try:
+            now = manager._backend.monotonic()
+            if not self._accepted and now - self._open_sent_at >= self.open_timeout:
+                self._send_open()
+            self._pump()
+        except OSError:
+            self.cancel(STATUS_ERROR)
+
+        if self._sender != None and self._sender.done:
+            self._finish(STATUS_OK)
+        elif self._receiver != None and self._receiver.done and self._receiver.settled:
+            self._finish(STATUS_OK)
+        return self.chunks_sent + self.chunks_retransmitted + self.chunks_received - moved
+
+    # This pulls a file off of the peripheral and waits until it's done, it returns the size of the file.
+    # It raises an Exception if the transfer fails or isn't done within timeout (the connection dropping doesn't fail it)
+    # The arguments are the same as start_pull()
+    # (optional) timeout -> float = None: How long to wait in seconds, if None it waits until the transfer is done
+    def pull(self, remote_name: str, destination, resume: bool = True, timeout: float = None) -> int:
+        self.start_pull(remote_name, destination, resume)
+        return self._wait(timeout)
+
+    # This pushes a file onto the peripheral and waits until it's done, it returns the size of the file.
+    # It raises an Exception if the transfer fails or isn't done within timeout (the connection dropping doesn't fail it)
+    # The arguments are the same as start_push()
+    # (optional) timeout -> float = None: How long to wait in seconds, if None it waits until the transfer is done
+    def push(self, source, remote_name: str, resume: bool = True, timeout: float = None) -> int:
+        self.start_push(source, remote_name, resume)
+        return self._wait(timeout)
+
+    # This stops the transfer and tells the server to stop too
+    # (optional) status -> int = STATUS_CANCELLED: What the transfer ends with
+    def cancel(self, status: int = STATUS_CANCELLED):
+        if self._mode == None:
+            return
+        self._finish(status)
+        if self._link != None and self._link.connected:
+            self._pending.append(bytes((MESSAGE_CANCEL, self._transfer_id, status)))
+            self._pump()
+
+    def deinit(self):
+        self.cancel()
+        if self.response_characteristic != None:
+            self._manager.unsubscribe(self.response_characteristic)
+        if self._write_buffer != None:
+            self._manager.deinit_buffer(self._write_buffer)
+
+    def _start(self, mode: int, remote_name: str, resume: bool):
+        if self._mode != None:
+            raise Exception("ERROR: A file is already being transferred!")
+        if self._write_buffer != None and len(bytes(remote_name, 'utf-8')) > self._get_max_name_length():
+            raise ValueError("ERROR: The name " + remote_name + " does not fit in a packet!")
+
+        self._mode = mode
+        self._name = remote_name
+        self._resume = resume
+        self._path = None
+        self._size = None
+        self._opened = False
+        self._owns_file = False
+        self._file = None
+        self.status = None
+
+    def _open_if_connected(self):
+        if self._link != None and self._link.connected:
+            self._send_open()
+
+    def _wait(self, timeout: float) -> int:
+        backend = self._manager._backend
+        deadline = None if timeout == None else backend.monotonic() + timeout
+        while self.status == None:
+            if deadline != None and backend.monotonic() >= deadline:
+                self.cancel()
+                raise Exception("ERROR: File transfer of " + self._name + " timed out!")
+            self._manager.maintain_connection()
+            if self.update() == 0 and self.status == None:
+                backend.sleep(self._manager.poll_interval)
+
+        if self.status != STATUS_OK:
+            raise Exception("ERROR: File transfer of " + self._name + " failed! " + _STATUS_MESSAGES[self.status])
+        return self._size
+
+    # This finds the server's characteristics on a new connection and opens the transfer again
+    def _attach(self, link):
+        manager = self._manager
+        request_characteristic = manager.find_characteristic(self.service_uuid, self.request_uuid, self.address)
+        response_characteristic = manager.find_characteristic(self.service_uuid, self.response_uuid, self.address)
+        if request_characteristic == None or response_characteristic == None:
+            raise Exception("ERROR: The peripheral does not have a file transfer service!")
+        if not request_characteristic.properties & (PROPERTY_WRITE | PROPERTY_WRITE_NO_RESPONSE):
+            raise RoleError("ERROR: Cannot send files with a characteristic that does not allow for writing!")
+
+        if self._write_buffer != None:
+            manager.deinit_buffer(self._write_buffer)
+        self._link = link
+        self.request_characteristic = request_characteristic
+        self.response_characteristic = response_characteristic
+        self._write_buffer = manager.create_packet_buffer(request_characteristic, buffer_size=self.buffer_size)
+        manager.subscribe(response_characteristic, self._on_response, buffer_size=self.window + 4)
+
+        if self._mode != None:
+            self._send_open()
+
+    # This remembers how far the transfer got when the connection drops, the file stays open so it can carry on
+    def _detach(self):
+        self._confirmed = self.confirmed
+        self._sender = None
+        self._receiver = None
+        self._pending = []
+        self._link = None
+        if self._opened:
+            self._resume = True
+
+    def _send_open(self):
+        name = bytes(self._name, 'utf-8')
+        if len(name) > self._get_max_name_length():
+            self._finish(STATUS_ERROR)
+            return
+
+        self._transfer_id = (self._transfer_id + 1) & 0xFF
+        mode = self._mode | (MODE_RESUME if self._resume else 0)
+        if self._mode == MODE_PUSH:
+            message = struct.pack(OPEN_FORMAT, MESSAGE_OPEN, self._transfer_id, mode, _get_max_chunk_length(self._manager, self._write_buffer), self._size)
+        else:
+            message = struct.pack(OPEN_FORMAT, MESSAGE_OPEN, self._transfer_id, mode, 0, self._confirmed)
+        # An OPEN that's still waiting is replaced, but a CANCEL before it still has to go out
+        self._pending = [waiting for waiting in self._pending if waiting[0] != MESSAGE_OPEN]
+        self._pending.append(message + name)
+        self._accepted = False
+        self._open_sent_at = self._manager._backend.monotonic()
+
+    def _get_max_name_length(self) -> int:
+        length = self._manager._get_buffer_packet_length(self._write_buffer) - OPEN_LENGTH
+        if self._manager.message_framing != FRAMING_NONE:
+            length -= self._manager._get_frame_header_length()
+        return length
+
+    def _on_response(self, characteristic, value: bytes):
+        if len(value) < 2 or self._mode == None or value[1] != self._transfer_id:
+            return
+
+        try:
+            if value[0] == MESSAGE_ACCEPT and len(value) >= ACCEPT_LENGTH:
+                if not self._accepted:
+                    self._on_accept(value)
+            elif value[0] == MESSAGE_CANCEL and len(value) >= CANCEL_LENGTH:
+                self._finish(STATUS_CANCELLED if value[2] == STATUS_OK else value[2])
+            else:
+                self._on_chunk_message(value)
+        except OSError:
+            self.cancel(STATUS_ERROR)
+
+    def _on_accept(self, value: bytes):
+        message_type, transfer_id, status, chunk_length, size, offset = struct.unpack_from(ACCEPT_FORMAT, value, 0)
+        if status != STATUS_OK:
+            self._finish(status)
+            return
+
+        self._accepted = True
+        if self._opened:
+            self.resumes += 1
+        self._opened = True
+        self._size = size
+        self._confirmed = offset
+        if self._mode == MODE_PULL:
+            self._prepare_destination(offset)
+            self._receiver = _ChunkReceiver(self, transfer_id, self._file, size, offset, chunk_length, self.window)
+        else:
+            self._sender = _ChunkSender(self, transfer_id, self._file, size, offset, chunk_length, self.window)
+
+    # This makes sure the pulled file ends where the server starts sending from
+    def _prepare_destination(self, offset: int):
+        if self._file != None and self._file.tell() != offset:
+            if self._owns_file:
+                self._file.close()
+                self._file = None
+            else:
+                self._file.seek(offset)
+                if hasattr(self._file, "truncate"):
+                    self._file.truncate()
+
+        if self._file == None:
+            self._file = open(self._path, "ab" if offset > 0 else "wb")
+            self._owns_file = True
+
+    def _finish(self, status: int):
+        self._confirmed = self.confirmed
+        self._close_file()
+        self._sender = None
+        self._receiver = None
+        self._pending = []
+        self._mode = None
+        self.status = status
@@ -6,7 +6,6 @@ import time
 from adafruit_circuitplayground import cp
 from ble_management import BluetoothManager
 from _bleio import BluetoothError, RoleError
-from adafruit_ble.advertising.standard import Advertisement, ProvideServicesAdvertisement
 
 #
 # Variables
@@ -17,7 +16,7 @@ ble_manager = BluetoothManager()
 ## This stores the previous bluetooth mode state when switching between states to keep proper track of them
 bluetooth_mode_previous = False
 
-## max_length is the length in bytes that a packet we will send will be
+## max_length is the most bytes our characteristic can hold, the packets we send are cut down to what the connection allows
 max_length = 20
 
 ## adder is a variable that counts up every frame and it's also what we send as a test value
@@ -28,20 +27,21 @@ h_service = None
 h_characteristic = None
 h_read_buffer = None
 h_write_buffer = None
+h_subscribed = False
 
-# Note: This will create a new service every time the device runs the code again,
-# typically this wouldn't happen since the device would only activate once and then just run from there.
-# This unfortuantely results in the services piling up until you remove power from the circuit playground.
-# I haven't found a way to get around that yet to stop them from piling up.
+# This is called by update_subscriptions() with every new value the peripheral sends us
+def print_value(characteristic, value):
+    print(value.decode())
 
 ## These are variables for a peripheral to advertisement with
 ## I specifically use 0x185A to get make it an unidentified service.
 ## I also use 0x2BDE to make the characteristic identified as a
 ## Fixed String 64 characteristic as seen within bluetooth specifications
-p_service = ble_manager.create_service("0x185A")
-p_characteristic = ble_manager.add_characteristic_to_service(p_service, "0x2BDE", properties=[True, False, True, True, False, True], max_length=max_length)
+## They're declared instead of created so the services don't pile up every time the code is reloaded
+p_service = ble_manager.declare_service("0x185A")
+p_characteristic = ble_manager.declare_characteristic(p_service, "0x2BDE", properties=[True, False, True, True, False, True], max_length=max_length)
 p_read_buffer = ble_manager.create_characteristic_buffer(p_characteristic)
-p_write_buffer = ble_manager.create_packet_buffer(p_characteristic, buffer_size=max_length, max_packet_size=max_length)
+p_write_buffer = ble_manager.create_packet_buffer(p_characteristic)
 
 #
 # Initalization
@@ -91,7 +91,10 @@ while True:
     try:
         # This code reads and writes to the current characteristic based on whether or not we are in host or peripheral mode
         if ble_manager.get_bluetooth_connection_state():
-            if h_read_buffer != None:
+            if h_subscribed:
+                # Only values that have changed come over the radio when we're subscribed
+                ble_manager.update_subscriptions()
+            elif h_read_buffer != None:
                 print(ble_manager.read_from_characteristic(h_characteristic).decode())
                 #print(read_from_characteristic_with_buffer(h_read_buffer).decode())
             if h_write_buffer != None:
@@ -112,6 +115,7 @@ while True:
                 h_read_buffer = None
             if h_write_buffer != None:
                 h_write_buffer = None
+            h_subscribed = False
     except Exception as e:
         print("ERROR: Something went wrong when working with data from another device!\nException:", e, "\n")
 
@@ -120,28 +124,22 @@ while True:
         # Make sure we aren't advertising and that we're in peripheral mode
         if not ble_manager.get_bluetooth_advertising_state() and ble_manager.bluetooth_mode_peripheral:
             # Begin advertising when the user wants them too
-            ble_manager.start_advertising(ProvideServicesAdvertisement(p_service))
+            ble_manager.start_advertising(ble_manager.create_services_advertisement(p_service))
             print("Started Advertising")
         
         # Make sure we aren't connected to another device and that we're in host mode
         if not ble_manager.get_bluetooth_connection_state() and not ble_manager.bluetooth_mode_peripheral:
             
-            # Catch if we have any memory related errors when scanning because we only have so much memory
-            try:
-                # Make sure we aren't already scanning
-                ble_manager.stop_scanning()
-                
-                # Scan for devices with these arbitrary settings to make sure that we don't run out of memory
-                detected_devices = ble_manager.start_scanning(buffer_size=50, timeout=1, print_debug = True)
-                
-                # print all the devices that we could connect to
-                for key in detected_devices.keys():
-                    print(key)
-                    #print(detected_devices[key])
-            except MemoryError as m:
-                # If we have a memory error tell the user and stop attempting connection
-                print("ERROR: Scanning Failed due to Memory Issues!\nException:", m, "\n")
-                continue
+            # Make sure we aren't already scanning
+            ble_manager.stop_scanning()
+            
+            # Scan for devices, the scan buffer and how many devices are kept are sized from the free memory so it doesn't run out
+            detected_devices = ble_manager.start_scanning(timeout=1, print_debug = True)
+            
+            # print all the devices that we could connect to
+            for key in detected_devices.keys():
+                print(key)
+                #print(detected_devices[key])
             
             # Allow user to specify peripheral they want to connect to
             is_exiting = False
@@ -199,7 +197,7 @@ while True:
                 # Get the first characteristic that allows us to read and or write to it
                 for i in range(len(h_service.characteristics)):
                     # Get the properties to check what the characteristic will let us do
-                    properties = ble_manager._convert_num_to_properties(h_service.characteristics[i].properties)
+                    properties = ble_manager.convert_num_to_properties(h_service.characteristics[i].properties)
                     
                     # Check if we can read from this characteristic and if so then store it
                     if properties[2] and h_service.characteristics[i] != None:
@@ -208,9 +206,13 @@ while True:
                     
                     # Check if we can write to this characteristic and if so then store it
                     if (properties[0] or properties[1]) and h_service.characteristics[i] != None:
-                        h_write_buffer = ble_manager.create_packet_buffer(h_service.characteristics[i], buffer_size=max_length, max_packet_size=max_length)
+                        # The buffer's packets are sized by the MTU that was negotiated with the peripheral
+                        h_write_buffer = ble_manager.create_packet_buffer(h_service.characteristics[i])
                 
-                #h_characteristic.set_cccd(notify=True)
+                # Subscribe to the characteristic if it can notify us so we don't have to read it every frame
+                if h_characteristic != None and ble_manager.convert_num_to_properties(h_characteristic.properties)[3]:
+                    ble_manager.subscribe(h_characteristic, print_value)
+                    h_subscribed = True
             except BluetoothError as b:
                 # If we get a Bluetooth Error for whatever reason than tell the user something messed up
                 print("ERROR: something went wrong when setting up data transfer with peripheral.\nException:", b)
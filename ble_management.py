@@ -2,9 +2,982 @@
 # Libraries
 #
 
-from adafruit_ble import BLERadio, BLEConnection
-from adafruit_ble.advertising.standard import Advertisement, ProvideServicesAdvertisement
-from _bleio import UUID, Service, RoleError, Attribute, PacketBuffer, Characteristic, BluetoothError, CharacteristicBuffer
+import gc
+import time
+import random
+
+try:
+    # _bleio is built into the firmware so importing from it doesn't load anything from the filesystem
+    from _bleio import UUID, Service, RoleError, Attribute, PacketBuffer, Characteristic, BluetoothError, CharacteristicBuffer
+    _bleio_available = True
+except ImportError:
+    # Without _bleio (like on a regular computer) only a backend such as ble_simulator.SimulatedBackend can be used
+    from ble_simulator import UUID, Service, RoleError, Attribute, PacketBuffer, Characteristic, BluetoothError, CharacteristicBuffer
+    _bleio_available = False
+
+## adafruit_ble takes a while to load and uses up a lot of memory, so it's only imported the first time a BleioBackend uses
+## the radio (see _import_adafruit_ble()). Until then these are None and are only used as type hints
+BLERadio = None
+BLEConnection = None
+Advertisement = None
+ProvideServicesAdvertisement = None
+
+## This is the BLERadio shared by every BleioBackend (there's only one radio on the board), it's made the first time it's used
+_shared_radio = None
+
+
+## These are the ways a message can be framed when it's written to or read from a characteristic, both sides must use the same one.
+## FRAMING_NONE sends the raw message (and the clear_buffer padding packet), FRAMING_LENGTH puts a byte holding the message's
+## length in front of it, and FRAMING_SEQUENCE puts a sequence number byte and a length byte in front of it
+FRAMING_NONE = 0
+FRAMING_LENGTH = 1
+FRAMING_SEQUENCE = 2
+
+## These are the bits of a characteristic's properties number, they're in the same order as the properties list
+## used by convert_properties_to_num() and convert_num_to_properties() (Write No Response is the most significant bit)
+PROPERTY_WRITE_NO_RESPONSE = 32
+PROPERTY_WRITE = 16
+PROPERTY_READ = 8
+PROPERTY_NOTIFY = 4
+PROPERTY_INDICATE = 2
+PROPERTY_BROADCAST = 1
+
+## A packet can always carry DEFAULT_PACKET_LENGTH bytes (the default MTU of 23 minus 3 bytes of overhead), anything more needs
+## a bigger MTU to be negotiated. CircuitPython asks for an MTU of up to 247, so a packet can carry at most MAX_PACKET_LENGTH bytes
+DEFAULT_PACKET_LENGTH = 20
+MAX_PACKET_LENGTH = 244
+
+## These are the named connection profiles for BluetoothManager.set_connection_profile(), each one is
+## (connection interval in milliseconds, peripheral latency in connection events, supervision timeout in milliseconds).
+## "low-latency" gets every value across as soon as possible, "bulk" leaves room in every connection event for lots of
+## full size packets, and "low-power" lets the radio sleep through connection events when there's nothing to send
+CONNECTION_PROFILES = {
+    "low-latency": (7.5, 0, 2000),
+    "bulk": (15, 0, 4000),
+    "low-power": (100, 4, 6000),
+}
+
+## This is whether the GATT table has been cleared of services left over from before the code was reloaded. It lives in the
+## module instead of a BluetoothManager since the board's radio keeps its services across reloads but the module doesn't
+_gatt_table_checked = False
+
+## A scan leaves at least SCAN_MEMORY_RESERVE bytes of memory free for everything else, once free memory drops below it the
+## scan stops early. Without a memory budget a scan plans to use half of what's free above that
+SCAN_MEMORY_RESERVE = 4096
+
+## Roughly how many bytes a single device takes up in the results of BluetoothManager.start_scanning() (its name, address and
+## the dictionary entry for them), it's used to work out how many devices fit in a memory budget
+SCAN_RESULT_SIZE = 128
+
+## These are the smallest and biggest scan buffers picked from a memory budget. A legacy advertisement takes up to about
+## 40 bytes of the buffer and an extended one up to about 260, so the buffer can hold at least a few of them
+MIN_SCAN_BUFFER_SIZE = 128
+MAX_SCAN_BUFFER_SIZE = 512
+MAX_EXTENDED_SCAN_BUFFER_SIZE = 2048
+
+## These are what a SendQueue does with a new message when it's full. OVERFLOW_BLOCK waits for room, OVERFLOW_DROP_OLDEST
+## throws away the oldest packet to make room, and OVERFLOW_DROP_NEWEST throws away the new message
+OVERFLOW_BLOCK = 0
+OVERFLOW_DROP_OLDEST = 1
+OVERFLOW_DROP_NEWEST = 2
+
+
+# This gets how many bytes of memory are free, None when that can't be known (like on a regular computer)
+# (optional) collect -> bool = True: If true garbage is collected first so memory that isn't used anymore counts as free
+def get_free_memory(collect: bool = True) -> int:
+    if not hasattr(gc, "mem_free"):
+        return None
+    if collect:
+        gc.collect()
+    return gc.mem_free()
+
+# This makes a check for BluetoothManager.scan() and find_device() that matches a device by its name
+def match_name(name: str):
+    return lambda advertisement: advertisement.complete_name == name or advertisement.short_name == name
+
+# This makes a check for BluetoothManager.scan() and find_device() that matches a device advertising a service
+# uuid -> str or int: The uuid of the service written like a hex code ("0x185A") or a number
+def match_service(uuid):
+    if isinstance(uuid, str):
+        uuid = int(uuid, 0)
+
+    def matches(advertisement) -> bool:
+        for service_uuid in getattr(advertisement, "services", ()):
+            # adafruit_ble wraps the _bleio UUID while the simulator doesn't
+            service_uuid = getattr(service_uuid, "bleio_uuid", service_uuid)
+            if getattr(service_uuid, "uuid16", None) == uuid:
+                return True
+        return False
+    return matches
+
+
+# This imports adafruit_ble the first time it's needed and fills in the variables for it at the top of the module
+def _import_adafruit_ble():
+    global BLERadio, BLEConnection, Advertisement, ProvideServicesAdvertisement
+    if BLERadio != None:
+        return
+
+    from adafruit_ble import BLERadio as radio_type, BLEConnection as connection_type
+    from adafruit_ble.advertising.standard import Advertisement as advertisement_type, ProvideServicesAdvertisement as services_advertisement_type
+    BLEConnection = connection_type
+    Advertisement = advertisement_type
+    ProvideServicesAdvertisement = services_advertisement_type
+    BLERadio = radio_type
+
+# This gets the BLERadio every BleioBackend shares, the radio is only brought up the first time this is called
+def _get_shared_radio():
+    global _shared_radio
+    if _shared_radio == None:
+        _import_adafruit_ble()
+        _shared_radio = BLERadio()
+    return _shared_radio
+
+
+# A backend is what the BluetoothManager goes through to reach the radio and create GATT objects.
+# This one is used by default and talks to the board's actual radio through adafruit_ble and _bleio,
+# anything with the same variables and functions (like ble_simulator.SimulatedBackend) can be used instead
+#
+# Nothing is brought up when it's made, the radio and adafruit_ble are only loaded the first time they're used
+# so a board that never touches bluetooth (or only does later on) starts up faster and with more free memory
+class BleioBackend:
+    def __init__(self):
+        if not _bleio_available:
+            raise ImportError("ERROR: _bleio is not available! Pass a different backend such as ble_simulator.SimulatedBackend into BluetoothManager!")
+
+    # radio is a BLERadio which allows it to scan for devices and handle basic connections, it's shared by every BleioBackend
+    @property
+    def radio(self):
+        return _get_shared_radio()
+
+    # These are the advertisement types we look for when scanning
+    @property
+    def scan_types(self) -> tuple:
+        _import_adafruit_ble()
+        return (ProvideServicesAdvertisement, Advertisement)
+
+    # Get the current time in seconds
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    # Wait for the specified amount of seconds
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    # Wait for the specified amount of seconds while letting other asyncio tasks run (see ble_async)
+    async def sleep_async(self, seconds: float):
+        # asyncio is only imported here since it's a separate library on CircuitPython that only ble_async needs
+        import asyncio
+        await asyncio.sleep(seconds)
+
+    def create_service(self, uuid: int) -> Service:
+        return Service(UUID(uuid))
+
+    def add_characteristic(self, service: Service, uuid: int, properties: int, read_perm: Attribute, write_perm: Attribute, max_length: int, fixed_length: bool, user_description: str) -> Characteristic:
+        return Characteristic.add_to_service(service, UUID(uuid), properties=properties, read_perm=read_perm, write_perm=write_perm, max_length=max_length, fixed_length=fixed_length, user_description=user_description)
+
+    def create_characteristic_buffer(self, characteristic: Characteristic, timeout: float, buffer_size: int) -> CharacteristicBuffer:
+        return CharacteristicBuffer(characteristic, timeout=timeout, buffer_size=buffer_size)
+
+    def create_packet_buffer(self, characteristic: Characteristic, buffer_size: int, max_packet_size: int) -> PacketBuffer:
+        return PacketBuffer(characteristic, buffer_size=buffer_size, max_packet_size=max_packet_size)
+
+    def create_services_advertisement(self, service: Service) -> Advertisement:
+        _import_adafruit_ble()
+        return ProvideServicesAdvertisement(service)
+
+    # Create an empty advertisement to fill in ourselves
+    def create_advertisement(self) -> Advertisement:
+        _import_adafruit_ble()
+        return Advertisement()
+
+    # Get rid of every service we've added, _bleio can't list or remove them so the adapter is turned off and on again
+    # which empties the GATT table (this also stops advertising and drops every connection)
+    def reset_local_services(self):
+        import _bleio
+        _bleio.adapter.enabled = False
+        _bleio.adapter.enabled = True
+
+    # uuids is a list of numbers for the services to look for, if it's empty then every service is discovered
+    def discover_remote_services(self, connection: BLEConnection, uuids: list) -> tuple:
+        if len(uuids) > 0:
+            return connection._bleio_connection.discover_remote_services(iter([UUID(uuid) for uuid in uuids]))
+        else:
+            return connection._bleio_connection.discover_remote_services()
+
+    # Get the rssi of a connection, _bleio doesn't give it to us so this is always None
+    def connection_rssi(self, connection: BLEConnection) -> int:
+        return None
+
+    # Get the (connection interval in ms, peripheral latency, supervision timeout in ms, max packet length) of a connection,
+    # _bleio doesn't give us the peripheral latency or supervision timeout so those are None
+    def get_connection_parameters(self, connection: BLEConnection) -> tuple:
+        return (connection.connection_interval, None, None, connection._bleio_connection.max_packet_length)
+
+    # Ask for new connection parameters, anything that's None is left as it is.
+    # _bleio only lets us ask for a connection interval so the peripheral latency and supervision timeout are ignored
+    def set_connection_parameters(self, connection: BLEConnection, interval: float, latency: int, timeout: float):
+        if interval != None:
+            connection.connection_interval = interval
+
+
+# This is what the ScanCache remembers about a device it has seen
+class CachedDevice:
+    __slots__ = ("address", "name", "rssi", "last_seen", "services")
+
+    def __init__(self, address, name: str, rssi: float, last_seen: float, services: tuple):
+        self.address = address
+        self.name = name
+        self.rssi = rssi
+        self.last_seen = last_seen
+        self.services = services
+
+    def __repr__(self) -> str:
+        return "CachedDevice(" + repr(self.name) + ", " + repr(self.address) + ", rssi=" + str(self.rssi if self.rssi == None else round(self.rssi, 1)) + ")"
+
+
+# This remembers the devices that were recently seen while scanning, by address so devices with the same name don't
+# overwrite each other. It never holds more than capacity devices (the one seen longest ago is forgotten first)
+# and devices that haven't been seen for ttl seconds are forgotten as well, so memory stays the same no matter how many devices are around
+#
+# (optional) capacity -> int = 16: The most devices that can be remembered at once
+# (optional) ttl -> float = 60: How many seconds a device is remembered after it was last seen
+# (optional) smoothing -> float = 0.25: How much a new rssi reading moves the remembered rssi (0 - 1), lower is smoother
+# (optional) clock -> function = time.monotonic: The function used to get the current time
+class ScanCache:
+    def __init__(self, capacity: int = 16, ttl: float = 60, smoothing: float = 0.25, clock = time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.smoothing = smoothing
+        self._clock = clock
+        self._devices = {}
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    # This adds or refreshes the device that sent an advertisement
+    def update(self, advertisement):
+        now = self._clock()
+        device = self._devices.get(advertisement.address)
+        services = tuple(getattr(advertisement, "services", ()))
+
+        if device == None:
+            if len(self._devices) >= self.capacity:
+                self.expire()
+            if len(self._devices) >= self.capacity:
+                self._forget_oldest()
+
+            device = CachedDevice(advertisement.address, advertisement.complete_name, advertisement.rssi, now, services)
+            self._devices[advertisement.address] = device
+            return device
+
+        # The name and services usually come in different packets so keep whatever we already know
+        if advertisement.complete_name != None:
+            device.name = advertisement.complete_name
+        if len(services) > 0:
+            device.services = services
+        if advertisement.rssi != None:
+            device.rssi = advertisement.rssi if device.rssi == None else device.rssi + self.smoothing * (advertisement.rssi - device.rssi)
+        device.last_seen = now
+        return device
+
+    # This gets a device by address, None if it isn't remembered or was seen too long ago
+    def get(self, address) -> CachedDevice:
+        device = self._devices.get(address)
+        if device != None and self._clock() - device.last_seen > self.ttl:
+            del self._devices[address]
+            return None
+        return device
+
+    # This gets the most recently seen device with the specified name, None if there isn't one
+    def find(self, name: str) -> CachedDevice:
+        self.expire()
+        newest = None
+        for device in self._devices.values():
+            if device.name == name and (newest == None or device.last_seen > newest.last_seen):
+                newest = device
+        return newest
+
+    # This returns every remembered device with the strongest rssi first
+    def devices(self) -> list:
+        self.expire()
+        return sorted(self._devices.values(), key=lambda device: -(device.rssi if device.rssi != None else -1000))
+
+    # This forgets every device that was seen too long ago
+    def expire(self):
+        now = self._clock()
+        for address in [address for address, device in self._devices.items() if now - device.last_seen > self.ttl]:
+            del self._devices[address]
+
+    def clear(self):
+        self._devices = {}
+
+    def _forget_oldest(self):
+        oldest = None
+        for device in self._devices.values():
+            if oldest == None or device.last_seen < oldest.last_seen:
+                oldest = device
+        del self._devices[oldest.address]
+
+
+# This remembers the services and characteristics of the peripherals we've connected to, so when we connect to one of them again
+# only the services we need are discovered instead of every service the peripheral has. It can be saved to a small file
+# so it's kept between restarts, everything about a peripheral is checked against what's discovered again and replaced if it changed.
+#
+# _bleio doesn't allow characteristics to be made from stored handles, so the services still have to be discovered,
+# but discovering a single service is a lot faster than discovering all of them
+#
+# (optional) path -> str = None: The file to keep the cache in (like "/gatt_cache.bin"), if None then it's only kept in memory.
+# The board's storage has to be writable by code (see storage.remount() in boot.py) for it to be saved
+# (optional) capacity -> int = 8: The most peripherals that can be remembered at once
+class GattCache:
+    ## This is at the start of a saved cache file followed by the version of the format
+    FILE_HEADER = b"GC\x01"
+
+    def __init__(self, path: str = None, capacity: int = 8):
+        self.path = path
+        self.capacity = capacity
+
+        # Peripheral address bytes -> list of (service uuid, list of (characteristic uuid, properties))
+        self._peripherals = {}
+        self._order = []
+        if path != None:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._peripherals)
+
+    # This gets the remembered services of a peripheral, None if we don't know it
+    def get(self, address) -> list:
+        return self._peripherals.get(self._get_key(address))
+
+    # This gets the uuid and properties of every remembered characteristic of a service, None if we don't know it
+    def get_service(self, address, service_uuid) -> list:
+        services = self.get(address)
+        if services == None:
+            return None
+        for uuid, characteristics in services:
+            if uuid == service_uuid:
+                return characteristics
+        return None
+
+    # This remembers discovered services for a peripheral and saves the cache if anything changed
+    #
+    # address -> Address: The address of the peripheral
+    # services -> tuple: The services returned by discovery
+    # complete -> bool: True if every service was discovered, otherwise the services only replace the ones we already know
+    def update(self, address, services: tuple, complete: bool):
+        key = self._get_key(address)
+        entries = [(_get_uuid_key(service.uuid), [(_get_uuid_key(c.uuid), c.properties) for c in service.characteristics]) for service in services]
+
+        if not complete:
+            known = self._peripherals.get(key)
+            if known == None:
+                return
+            merged = list(known)
+            for entry in entries:
+                for i in range(len(merged)):
+                    if merged[i][0] == entry[0]:
+                        merged[i] = entry
+            entries = merged
+
+        if self._peripherals.get(key) == entries:
+            return
+
+        if key not in self._peripherals and len(self._peripherals) >= self.capacity:
+            del self._peripherals[self._order.pop(0)]
+        if key in self._order:
+            self._order.remove(key)
+        self._order.append(key)
+        self._peripherals[key] = entries
+        self.save()
+
+    # This forgets everything about a peripheral
+    def forget(self, address):
+        key = self._get_key(address)
+        if key in self._peripherals:
+            del self._peripherals[key]
+            self._order.remove(key)
+            self.save()
+
+    # This loads the cache from path, a missing or broken file just leaves the cache empty
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return
+
+        if data[:len(self.FILE_HEADER)] != self.FILE_HEADER:
+            return
+        try:
+            offset = len(self.FILE_HEADER) + 1
+            for _ in range(data[offset - 1]):
+                address_length = data[offset]
+                key = bytes(data[offset + 1:offset + 1 + address_length])
+                offset += 1 + address_length
+                services = []
+                for _ in range(data[offset]):
+                    service_uuid, offset = _read_uuid(data, offset + 1)
+                    characteristics = []
+                    for _ in range(data[offset]):
+                        characteristic_uuid, offset = _read_uuid(data, offset + 1)
+                        characteristics.append((characteristic_uuid, data[offset]))
+                    services.append((service_uuid, characteristics))
+                offset += 1
+                self._peripherals[key] = services
+                self._order.append(key)
+        except IndexError:
+            self._peripherals = {}
+            self._order = []
+
+    # This saves the cache to path, if the storage isn't writable it's only kept in memory
+    def save(self):
+        if self.path == None:
+            return
+
+        data = bytearray(self.FILE_HEADER)
+        data.append(len(self._order))
+        for key in self._order:
+            data.append(len(key))
+            data += key
+            data.append(len(self._peripherals[key]))
+            for service_uuid, characteristics in self._peripherals[key]:
+                _write_uuid(data, service_uuid)
+                data.append(len(characteristics))
+                for characteristic_uuid, properties in characteristics:
+                    _write_uuid(data, characteristic_uuid)
+                    data.append(properties)
+        try:
+            with open(self.path, "wb") as file:
+                file.write(data)
+        except OSError:
+            pass
+
+    def _get_key(self, address) -> bytes:
+        return bytes(getattr(address, "address_bytes", address))
+
+
+# A uuid is kept as its 16 bit number, or as its bytes if it's a 128 bit uuid
+def _get_uuid_key(uuid):
+    if getattr(uuid, "size", 16) == 128:
+        return bytes(uuid.uuid128)
+    return uuid.uuid16
+
+def _write_uuid(data: bytearray, uuid):
+    if isinstance(uuid, int):
+        data.append(2)
+        data.append(uuid & 0xFF)
+        data.append(uuid >> 8)
+    else:
+        data.append(len(uuid))
+        data += uuid
+
+def _read_uuid(data: bytes, offset: int) -> tuple:
+    length = data[offset]
+    if length == 2:
+        return data[offset + 1] | (data[offset + 2] << 8), offset + 3
+    return bytes(data[offset + 1:offset + 1 + length]), offset + 1 + length
+
+
+# This holds everything about a single connection to a peripheral, the Bluetooth Manager keeps one for every
+# peripheral it's connected to in its connections dictionary (by address)
+class PeripheralLink:
+    def __init__(self, address, connection: BLEConnection, max_outgoing: int):
+        ## The address of the peripheral and the BLEConnection to it
+        self.address = address
+        self.connection = connection
+
+        ## The most messages that can wait to be written before send_to() refuses more
+        self.max_outgoing = max_outgoing
+
+        # The services discovered from this peripheral so far (uuid -> Service) and the messages waiting to be written to it
+        self._discovered_services = {}
+        self._outgoing = []
+
+        ## These are how healthy the link is, they're only kept while auto reconnect is on (see BluetoothManager.enable_auto_reconnect()).
+        ## last_data is when a value last came from the peripheral (or when we connected), write_failures is how many writes
+        ## in a row the buffer didn't take, and rssi is the smoothed rssi with rssi_trend being how fast it's changing in dBm per second
+        ## (rssi stays None if the backend can't tell us the rssi of a connection)
+        self.last_data = None
+        self.write_failures = 0
+        self.rssi = None
+        self.rssi_trend = 0.0
+        self._rssi_time = None
+
+    # Get whether this peripheral is still connected
+    @property
+    def connected(self) -> bool:
+        return self.connection.connected
+
+    # Get how many messages are waiting to be written
+    @property
+    def pending(self) -> int:
+        return len(self._outgoing)
+
+    # This adds a new rssi reading to the smoothed rssi and its trend
+    def _record_rssi(self, rssi: int, now: float, smoothing: float = 0.25):
+        if self.rssi == None:
+            self.rssi = rssi
+        else:
+            previous = self.rssi
+            self.rssi += (rssi - self.rssi) * smoothing
+            if now > self._rssi_time:
+                self.rssi_trend += ((self.rssi - previous) / (now - self._rssi_time) - self.rssi_trend) * smoothing
+        self._rssi_time = now
+
+    def __repr__(self) -> str:
+        return "PeripheralLink(" + repr(self.address) + ", connected=" + str(self.connected) + ")"
+
+
+# This wraps a characteristic so the checks done every frame don't have to convert its properties again.
+# The properties are only looked at once when the handle is made, and the buffers are only made the first time they're used.
+# Get one with BluetoothManager.get_handle() so every characteristic only ever has one handle
+class CharacteristicHandle:
+    __slots__ = ("characteristic", "uuid", "flags", "max_length", "buffer_size", "_manager", "_read_buffer", "_write_buffer")
+
+    # manager -> BluetoothManager: The manager the characteristic belongs to
+    # characteristic -> Characteristic: The characteristic to wrap
+    # (optional) max_length -> int = None: The max length of a packet for the write buffer and the write functions,
+    # None uses the most the characteristic and the connection allow (see BluetoothManager.get_packet_length())
+    # (optional) buffer_size -> int = 64: How many bytes the read buffer can hold
+    def __init__(self, manager, characteristic: Characteristic, max_length: int = None, buffer_size: int = 64):
+        self.characteristic = characteristic
+        self.uuid = characteristic.uuid
+        self.flags = characteristic.properties
+        self.max_length = max_length
+        self.buffer_size = buffer_size
+        self._manager = manager
+        self._read_buffer = None
+        self._write_buffer = None
+
+    @property
+    def can_read(self) -> bool:
+        return self.flags & PROPERTY_READ != 0
+
+    @property
+    def can_write(self) -> bool:
+        return self.flags & (PROPERTY_WRITE | PROPERTY_WRITE_NO_RESPONSE) != 0
+
+    @property
+    def can_notify(self) -> bool:
+        return self.flags & PROPERTY_NOTIFY != 0
+
+    @property
+    def can_indicate(self) -> bool:
+        return self.flags & PROPERTY_INDICATE != 0
+
+    # The CharacteristicBuffer to read with, it's made the first time it's used
+    @property
+    def read_buffer(self) -> CharacteristicBuffer:
+        if self._read_buffer == None:
+            self._read_buffer = self._manager.create_characteristic_buffer(self.characteristic, buffer_size=self.buffer_size)
+        return self._read_buffer
+
+    # The PacketBuffer to write with, it's made the first time it's used
+    @property
+    def write_buffer(self) -> PacketBuffer:
+        if self._write_buffer == None:
+            self._write_buffer = self._manager.create_packet_buffer(self.characteristic, max_packet_size=self.max_length)
+        return self._write_buffer
+
+    # This reads the characteristic's value directly (see BluetoothManager.read_from_characteristic())
+    def read(self) -> bytearray:
+        return self._manager.read_from_characteristic(self.characteristic)
+
+    # This writes to the characteristic's value directly (see BluetoothManager.write_to_characteristic())
+    def write(self, message: str, clear_buffer: bool = True) -> bytearray:
+        return self._manager.write_to_characteristic(self.characteristic, message, self.max_length, clear_buffer)
+
+    # This gets rid of the buffers, they'll be made again if they're used after this
+    def deinit(self):
+        if self._read_buffer != None:
+            self._manager.deinit_buffer(self._read_buffer)
+            self._read_buffer = None
+        if self._write_buffer != None:
+            self._manager.deinit_buffer(self._write_buffer)
+            self._write_buffer = None
+
+    def __repr__(self) -> str:
+        return "CharacteristicHandle(" + str(self.uuid) + ", flags=" + str(self.flags) + ")"
+
+
+# This joins small messages together into full packets before they're written with a PacketBuffer, so a connection event
+# carries several messages instead of one message and a lot of empty space. A packet is written as soon as it's full,
+# or once its first message has waited max_delay seconds so no message waits longer than that (unless the link is full).
+# Get one with BluetoothManager.create_send_queue() and call BluetoothManager.update_send_queues() every frame.
+#
+# The queue never holds more than capacity packets. When it's full, overflow decides what happens to a new message:
+# OVERFLOW_DROP_NEWEST refuses it, OVERFLOW_DROP_OLDEST throws away the oldest packet to make room, and OVERFLOW_BLOCK
+# keeps writing packets until there's room. Every message thrown away is counted in messages_dropped.
+#
+# Since several messages end up in the same packet the other side has to read with a CharacteristicBuffer, which joins
+# packets back together (FRAMING_NONE messages should end with a "\n" and framed messages are read one at a time)
+class SendQueue:
+    # manager -> BluetoothManager: The manager the buffer belongs to
+    # write_buffer -> PacketBuffer: The buffer the packets are written with
+    # (optional) max_packet_size -> int = None: The size of a packet, None uses the outgoing packet length of write_buffer
+    # (optional) max_delay -> float = 0.01: The longest a message waits in seconds for the rest of its packet to fill up
+    # (optional) capacity -> int = 4: How many packets can be waiting to be written, all of them are allocated up front
+    # (optional) overflow -> int = OVERFLOW_DROP_NEWEST: What to do with a new message when the queue is full
+    # (optional) block_timeout -> float = None: How long send() waits in seconds with OVERFLOW_BLOCK, None waits until there's room
+    def __init__(self, manager, write_buffer: PacketBuffer, max_packet_size: int = None, max_delay: float = 0.01, capacity: int = 4, overflow: int = OVERFLOW_DROP_NEWEST, block_timeout: float = None):
+        if max_packet_size == None:
+            max_packet_size = manager._get_buffer_packet_length(write_buffer)
+
+        self.write_buffer = write_buffer
+        self.max_packet_size = max_packet_size
+        self.max_delay = max_delay
+        self.capacity = capacity
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._manager = manager
+
+        ## The total amount of messages that were thrown away because the queue was full
+        self.messages_dropped = 0
+
+        # The packets are used in a circle, _head is the oldest and the newest one is open for more messages while _is_open is True.
+        # _message_counts is how many messages start in each packet so we know how many are lost when one is dropped
+        self._packets = [bytearray(max_packet_size) for _ in range(capacity)]
+        self._views = [memoryview(packet) for packet in self._packets]
+        self._lengths = [0] * capacity
+        self._message_counts = [0] * capacity
+        self._head = 0
+        self._count = 0
+        self._is_open = False
+        self._opened_at = 0.0
+        self._occupancy = 0
+
+    # Get how many packets are waiting to be written (including the one being filled)
+    @property
+    def pending(self) -> int:
+        return self._count
+
+    # Get how many bytes are waiting to be written
+    @property
+    def occupancy(self) -> int:
+        return self._occupancy
+
+    # This adds a message to the queue, it returns False if the message was dropped (see overflow).
+    # Without message_framing a message can be split across packets, with message_framing it must fit in a single packet
+    #
+    # message -> str, bytes, bytearray or memoryview: The message to send
+    def send(self, message) -> bool:
+        if isinstance(message, str):
+            message = bytes(message, 'utf-8')
+
+        header_length = 0
+        if self._manager.message_framing != FRAMING_NONE:
+            header_length = self._manager._get_frame_header_length()
+            if len(message) + header_length > self.max_packet_size:
+                raise ValueError("ERROR: Message is too long to fit in a single framed packet!")
+
+        # Framed messages are never split up, and neither are messages that fit in a packet when old packets can be dropped
+        # (otherwise dropping a packet could leave the end of a message behind without its start)
+        whole = header_length > 0 or (self.overflow == OVERFLOW_DROP_OLDEST and len(message) <= self.max_packet_size)
+        length = len(message) + header_length
+        if not self._has_room(length, whole):
+            if not self._make_room(length, whole):
+                self.messages_dropped += 1
+                return False
+        if whole and self._is_open and self.max_packet_size - self._lengths[self._get_tail()] < length:
+            self._is_open = False
+
+        if header_length > 0:
+            self._append(self._manager._get_write_header(self.write_buffer, message, self.max_packet_size), 0)
+            self._message_counts[self._get_tail()] += 1
+            self._append(message, 0)
+        else:
+            offset = self._append(message, 0)
+            self._message_counts[self._get_tail()] += 1
+            while offset < len(message):
+                offset = self._append(message, offset)
+        return True
+
+    # This writes every full packet, and the packet being filled if its first message has waited max_delay.
+    # It stops as soon as write_buffer is full and returns how many packets were written
+    def update(self) -> int:
+        written = 0
+        while self._count > 0:
+            index = self._head
+            if self._count == 1 and self._is_open and self._lengths[index] < self.max_packet_size and self._manager._backend.monotonic() - self._opened_at < self.max_delay:
+                break
+            if self.write_buffer.write(self._views[index][:self._lengths[index]]) <= 0:
+                break
+
+            if self._manager._stats != None:
+                self._manager._stats.count(self._manager._buffer_uuids.get(self.write_buffer), BluetoothStats.MESSAGES_WRITTEN, self._lengths[index], self._message_counts[index])
+            self._remove_oldest()
+            written += 1
+        return written
+
+    # This writes everything that's queued without waiting for packets to fill up, returns False if timeout runs out first
+    # (optional) timeout -> float = None: How long to wait in seconds for room in write_buffer, None waits until everything is written
+    def flush(self, timeout: float = None) -> bool:
+        backend = self._manager._backend
+        deadline = None if timeout == None else backend.monotonic() + timeout
+
+        self._is_open = False
+        while True:
+            self.update()
+            if self._count == 0:
+                return True
+            if deadline != None and backend.monotonic() >= deadline:
+                return False
+            backend.sleep(self._manager.poll_interval)
+
+    # This throws away everything in the queue, the messages in it are counted as dropped
+    def clear(self):
+        while self._count > 0:
+            self.messages_dropped += self._message_counts[self._head]
+            self._remove_oldest()
+
+    # This checks if length bytes can be added, whole means they can't be split across packets
+    def _has_room(self, length: int, whole: bool) -> bool:
+        if self._is_open and self.max_packet_size - self._lengths[self._get_tail()] >= length:
+            return True
+        if whole:
+            return self._count < self.capacity
+        return length <= (self.capacity - self._count) * self.max_packet_size + (self.max_packet_size - self._lengths[self._get_tail()] if self._is_open else 0)
+
+    # This makes room for length bytes the way overflow says to, it returns False if there still isn't room
+    def _make_room(self, length: int, whole: bool) -> bool:
+        # A message bigger than the whole queue will never fit
+        if length > self.capacity * self.max_packet_size:
+            return False
+
+        if self.overflow == OVERFLOW_DROP_OLDEST:
+            while not self._has_room(length, whole):
+                self.messages_dropped += self._message_counts[self._head]
+                self._remove_oldest()
+            return True
+
+        if self.overflow == OVERFLOW_BLOCK:
+            backend = self._manager._backend
+            deadline = None if self.block_timeout == None else backend.monotonic() + self.block_timeout
+
+            # The packet being filled won't be written until max_delay so it's closed to let it go now
+            self._is_open = False
+            while not self._has_room(length, whole):
+                self.update()
+                if self._has_room(length, whole):
+                    break
+                if deadline != None and backend.monotonic() >= deadline:
+                    return False
+                backend.sleep(self._manager.poll_interval)
+            return True
+
+        return False
+
+    # This copies as much of data (from offset) as fits into the open packet, opening a new one if needed.
+    # It returns the offset in data after what was copied
+    def _append(self, data, offset: int) -> int:
+        if not self._is_open or self._lengths[self._get_tail()] >= self.max_packet_size:
+            self._count += 1
+            self._is_open = True
+            self._opened_at = self._manager._backend.monotonic()
+
+        tail = self._get_tail()
+        start = self._lengths[tail]
+        count = min(self.max_packet_size - start, len(data) - offset)
+        self._packets[tail][start:start + count] = data[offset:offset + count]
+        self._lengths[tail] = start + count
+        self._occupancy += count
+        return offset + count
+
+    def _remove_oldest(self):
+        index = self._head
+        if self._count == 1:
+            self._is_open = False
+        self._occupancy -= self._lengths[index]
+        self._lengths[index] = 0
+        self._message_counts[index] = 0
+        self._head = (index + 1) % self.capacity
+        self._count -= 1
+
+    def _get_tail(self) -> int:
+        return (self._head + self._count - 1) % self.capacity
+
+
+# This counts how many values land in each of a fixed set of latency ranges, so it never grows no matter how much it's given
+class LatencyHistogram:
+    ## The top of every bucket in milliseconds, anything slower than the last one goes into one more bucket at the end
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    # seconds -> float: How long something took
+    def add(self, seconds: float):
+        milliseconds = seconds * 1000
+        index = 0
+        while index < len(self.BUCKETS_MS) and milliseconds > self.BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.minimum == None or seconds < self.minimum:
+            self.minimum = seconds
+        if self.maximum == None or seconds > self.maximum:
+            self.maximum = seconds
+
+    # This returns the top of the bucket (in milliseconds) that the specified percentile (0 - 100) lands in, None if it's empty.
+    # Anything in the last bucket is reported as the slowest value seen
+    def percentile(self, percent: float) -> float:
+        if self.count == 0:
+            return None
+        wanted = max(1, percent / 100 * self.count)
+        seen = 0
+        for index in range(len(self.counts)):
+            seen += self.counts[index]
+            if seen >= wanted:
+                if index < len(self.BUCKETS_MS):
+                    return self.BUCKETS_MS[index]
+                break
+        return self.maximum * 1000
+
+    def reset(self):
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def snapshot(self) -> dict:
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000,
+            "min_ms": self.minimum * 1000,
+            "max_ms": self.maximum * 1000,
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+            "buckets": self.counts[:],
+        }
+
+
+# This holds every counter and histogram the BluetoothManager keeps when its stats are enabled (see BluetoothManager.enable_stats())
+class BluetoothStats:
+    ## The indexes of the counters kept for every characteristic
+    MESSAGES_WRITTEN = 0
+    BYTES_WRITTEN = 1
+    MESSAGES_READ = 2
+    BYTES_READ = 3
+
+    def __init__(self):
+        ## The counters of every characteristic by uuid, each one is a list indexed by the variables above
+        self.characteristics = {}
+
+        ## How many buffered writes weren't taken by the buffer (so the message was lost) and how many functions failed
+        self.write_shortfalls = 0
+        self.errors = 0
+
+        ## How many scans were done, how long they took in total in seconds and how many advertisements they saw
+        self.scans = 0
+        self.scan_time = 0.0
+        self.advertisements_seen = 0
+
+        self.connects = 0
+        self.connect_latency = LatencyHistogram()
+        self.discovery_latency = LatencyHistogram()
+        self.read_latency = LatencyHistogram()
+        self.write_latency = LatencyHistogram()
+
+    # uuid -> UUID: The uuid of the characteristic that was written to or read from, None if it isn't known
+    # index -> int: MESSAGES_WRITTEN or MESSAGES_READ
+    # length -> int: How many bytes were written or read
+    # (optional) messages -> int = 1: How many messages those bytes were
+    def count(self, uuid, index: int, length: int, messages: int = 1):
+        key = None if uuid == None else _get_uuid_key(uuid)
+        counters = self.characteristics.get(key)
+        if counters == None:
+            counters = [0, 0, 0, 0]
+            self.characteristics[key] = counters
+        counters[index] += messages
+        counters[index + 1] += length
+
+    def reset(self):
+        self.characteristics = {}
+        self.write_shortfalls = 0
+        self.errors = 0
+        self.scans = 0
+        self.scan_time = 0.0
+        self.advertisements_seen = 0
+        self.connects = 0
+        for histogram in (self.connect_latency, self.discovery_latency, self.read_latency, self.write_latency):
+            histogram.reset()
+
+    # This returns everything as a dictionary (characteristics are by their uuid written like "0x2BDE")
+    def snapshot(self) -> dict:
+        characteristics = {}
+        for key, counters in self.characteristics.items():
+            if key == None:
+                name = "unknown"
+            elif isinstance(key, int):
+                name = "0x%04X" % key
+            else:
+                name = "".join(["%02x" % byte for byte in reversed(key)])
+            characteristics[name] = {
+                "messages_written": counters[self.MESSAGES_WRITTEN],
+                "bytes_written": counters[self.BYTES_WRITTEN],
+                "messages_read": counters[self.MESSAGES_READ],
+                "bytes_read": counters[self.BYTES_READ],
+            }
+
+        return {
+            "characteristics": characteristics,
+            "write_shortfalls": self.write_shortfalls,
+            "errors": self.errors,
+            "scans": self.scans,
+            "scan_time": self.scan_time,
+            "advertisements_seen": self.advertisements_seen,
+            "connects": self.connects,
+            "connect_latency": self.connect_latency.snapshot(),
+            "discovery_latency": self.discovery_latency.snapshot(),
+            "read_latency": self.read_latency.snapshot(),
+            "write_latency": self.write_latency.snapshot(),
+        }
+
+
+# This holds the settings and state of auto reconnect (see BluetoothManager.enable_auto_reconnect())
+class ReconnectPolicy:
+    def __init__(self, initial_delay: float, max_delay: float, multiplier: float, jitter: float, connect_timeout: float, max_silence: float, max_write_failures: int, min_rssi: int, rssi_drop_rate: float, on_reconnect, max_attempts: int):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.connect_timeout = connect_timeout
+        self.max_silence = max_silence
+        self.max_write_failures = max_write_failures
+        self.min_rssi = min_rssi
+        self.rssi_drop_rate = rssi_drop_rate
+        self.on_reconnect = on_reconnect
+        self.max_attempts = max_attempts
+
+        ## How many attempts have been made since the link was last stable, when the next one is made, and when we last reconnected
+        self.attempts = 0
+        self.next_attempt = None
+        self.connected_at = None
+
+        ## The total amount of times we reconnected and dropped a link early because it was unhealthy, and why the last link was lost
+        self.reconnects = 0
+        self.early_drops = 0
+        self.last_reason = None
+
+        # The (service uuid, characteristic uuid, callback, indicate) of every subscription to subscribe to again after reconnecting
+        self._subscriptions = []
+
+    # This works out when to make the next attempt after the current one, the delay doubles (by multiplier) every attempt
+    # up to max_delay and is moved up or down by jitter so boards that dropped together don't all try at the same time
+    def schedule(self, now: float):
+        delay = min(self.max_delay, self.initial_delay * self.multiplier ** self.attempts)
+        self.next_attempt = now + delay * (1 + random.uniform(-self.jitter, self.jitter))
+        self.attempts += 1
 
 
 class BluetoothManager:
@@ -17,18 +990,129 @@ class BluetoothManager:
     ## Peripheral Mode allows you to advertise your own services and characteristics for a host to work with.
     bluetooth_mode_peripheral = False
     
-    ## radio is a BLERadio which allows it to scan for devices and handle basic connections
-    _radio = BLERadio()
+    ## backend is what we use to reach the radio and create services, characteristics and buffers
+    _backend = None
+
+    ## This is the backend's radio once it's been used, see _radio
+    _radio_instance = None
 
     ## ble will eventually become a BLEConnection which will then be able to be used to disconnect
     ble = None
+
+    ## message_framing is how messages are framed by the read and write functions (FRAMING_NONE, FRAMING_LENGTH or FRAMING_SEQUENCE).
+    ## With framing every message takes exactly one write and clear_buffer is ignored since old data can't bleed into a framed message
+    message_framing = FRAMING_NONE
+
+    ## These keep track of the last sequence number written to and read from each characteristic or buffer when using FRAMING_SEQUENCE
+    _write_sequences = None
+    _read_sequences = None
+
+    ## These hold the frame headers that are read and written with buffers so framing a message doesn't allocate anything,
+    ## the views are by header length so there's no need to slice them
+    _read_header = None
+    _write_header = None
+    _write_header_views = None
+
+    ## This holds the frame header (sequence * 256 + length) read from a buffer whose message hasn't all arrived yet,
+    ## so the message is read once it has instead of a read stopping halfway through it
+    _read_frames = None
+
+    ## This holds the clear_buffer padding packet for every max_length it's been used with
+    _padding = None
+
+    ## This holds the buffer, callback and receiving bytearray for every subscribed characteristic
+    _subscriptions = None
+
+    ## This holds the CharacteristicHandle made by get_handle() for every characteristic
+    _handles = None
+
+    ## This holds every SendQueue made by create_send_queue() so update_send_queues() can write them
+    _send_queues = None
+
+    ## How long to wait in seconds between attempts when something has to wait for room in a buffer
+    poll_interval = 0.001
+
+    ## This holds the BluetoothStats while stats are enabled, when it's None nothing is counted
+    _stats = None
+
+    ## This remembers the uuid of the characteristic a buffer was made for so the stats and codecs know what a buffer belongs to,
+    ## it's only filled while stats are on or a codec is set
+    _buffer_uuids = None
+
+    ## This holds the codec set with set_codec() for every characteristic by its uuid
+    _codecs = None
+
+    ## scan_cache remembers every device seen while scanning so connect() doesn't need a new scan for them
+    scan_cache = None
+
+    ## gatt_cache remembers the services of peripherals we've connected to so find_characteristic() only discovers what it needs
+    gatt_cache = None
+
+    ## connections holds a PeripheralLink for every peripheral we're connected to by its address, ble is the most recent one
+    connections = None
+
+    ## This is the PeripheralLink for ble
+    _link = None
+
+    ## This is the most messages that can wait to be written to a single peripheral by service_connections()
+    max_outgoing_messages = 8
+
+    ## This is where service_connections() starts next time so every peripheral gets a turn at going first
+    _next_link_index = 0
+
+    ## This is the address and name of the last peripheral connect() connected to
+    _last_peer = None
+
+    ## This holds the ReconnectPolicy while auto reconnect is on, when it's None link health isn't kept
+    _reconnect = None
+
+    ## This remembers the PeripheralLink of every buffer made for a peripheral's characteristic so link health knows where data came from
+    _buffer_links = None
+
+    ## This holds every service made by declare_service() by its uuid so declaring it again gives back the same one
+    _local_services = None
+
+    ## This holds every characteristic made by declare_characteristic() by the uuids of its service and itself
+    _local_characteristics = None
     
     #
     # Functions
     #
     
-    def __init__(self):
-        pass
+    # (optional) backend = None: The backend to use for the radio, if None then a BleioBackend is made to use the board's radio.
+    # Pass in something like ble_simulator.SimulatedBackend() to run the manager without a board
+    def __init__(self, backend = None):
+        if backend == None:
+            backend = BleioBackend()
+
+        self._backend = backend
+        self._write_sequences = {}
+        self._read_sequences = {}
+        self._read_header = bytearray(2)
+        self._read_frames = {}
+        self._write_header = bytearray(2)
+        self._write_header_views = (None, memoryview(self._write_header)[:1], memoryview(self._write_header))
+        self._padding = {}
+        self._subscriptions = {}
+        self._handles = {}
+        self._send_queues = []
+        self._buffer_uuids = {}
+        self._codecs = {}
+        self._buffer_links = {}
+        self._local_services = {}
+        self._local_characteristics = {}
+        self.scan_cache = ScanCache(clock=backend.monotonic)
+        self.gatt_cache = GattCache()
+        self.connections = {}
+
+    # radio is a BLERadio (or the backend's equivalent) which allows it to scan for devices and handle basic connections.
+    # It's only taken from the backend the first time it's used so making a manager doesn't bring up the radio
+    @property
+    def _radio(self):
+        if self._radio_instance == None:
+            self._radio_instance = self._backend.radio
+        return self._radio_instance
+
     #
     # General Functions
     #
@@ -36,7 +1120,7 @@ class BluetoothManager:
     # Set if we are acting as a host or a peripheral
 
     # Get our name for bluetooth
-    def get_bluetooth_name(self) -> string:
+    def get_bluetooth_name(self) -> str:
         return self._radio.name
 
     # Get our transmission power
@@ -56,96 +1140,342 @@ class BluetoothManager:
         return self._radio.connected
 
     # Create a service specified by it's UUID
-    def create_service(self, uuid: string) -> Service:
-        return Service(UUID(int(uuid)))
+    # (use declare_service() when the code may be reloaded, this adds a new service every time it's called)
+    def create_service(self, uuid: str) -> Service:
+        global _gatt_table_checked
+        _gatt_table_checked = True
+        return self._backend.create_service(self._convert_uuid_to_num(uuid))
 
     # This acts as a way to create characteristics as they have to be added to services upon creation
     #
     # service -> Service: The service to add too
-    # uuid -> string: The uuid to specify the type of new characteristic
+    # uuid -> str: The uuid to specify the type of new characteristic
     # (optional) properties -> bool[6] = [False] * 6: A list of booleans that specify the properties of the characteristic
     # these are as follows from index 0-5; Write No Response, Write, Read, Notify, Indicate, Broadcast
     # (optional) read_perm -> Attribute = Attribute.OPEN: Specifys default reading permissions for all connections
     # (optional) write_perm -> Attribute = Attribute.OPEN: Specifys default writing permissions for all connections
     # (optional) max_length -> int = 20: The max length of a packet that can be written or read from the characteristic
     # (optional) fixed_length -> bool = False: Whether or not the length of a packet has to be a fixed amount
-    # (optional) user_description -> string = None: A defined description for the characteristic
-    def add_characteristic_to_service(self, service: Service, uuid: string, properties: list = [False] * 6, read_perm: Attribute = Attribute.OPEN, write_perm: Attribute = Attribute.OPEN, max_length: int = 20, fixed_length: bool = False, user_description: string = None) -> Characteristic:
-        return Characteristic.add_to_service(service, UUID(int(uuid)), properties=self._convert_properties_to_num(properties), read_perm=read_perm, write_perm=write_perm, max_length=max_length, fixed_length=fixed_length, user_description=user_description)
+    # (optional) user_description -> str = None: A defined description for the characteristic
+    def add_characteristic_to_service(self, service: Service, uuid: str, properties: list = [False] * 6, read_perm: Attribute = Attribute.OPEN, write_perm: Attribute = Attribute.OPEN, max_length: int = 20, fixed_length: bool = False, user_description: str = None) -> Characteristic:
+        return self._backend.add_characteristic(service, self._convert_uuid_to_num(uuid), self.convert_properties_to_num(properties), read_perm, write_perm, max_length, fixed_length, user_description)
 
     # characteristic -> Characteristic: The characteristic for the buffer to read from
     # (optional) timeout -> int = 1: How long we should wait for something new to read in seconds before giving up
     # (optional) buffer_size -> int = 64: How much data the buffer can hold
     def create_characteristic_buffer(self, characteristic: Characteristic, timeout: int = 1, buffer_size: int = 64) -> CharacteristicBuffer:
-        properties = self._convert_num_to_properties(characteristic.properties)
-        
         # Check if it's possible to read from characteristic
-        if properties[2]:
-            return CharacteristicBuffer(characteristic, timeout=timeout, buffer_size=buffer_size)
+        if characteristic.properties & PROPERTY_READ:
+            read_buffer = self._backend.create_characteristic_buffer(characteristic, timeout, buffer_size)
+            self._remember_buffer_uuid(read_buffer, characteristic)
+            self._remember_buffer_link(read_buffer, characteristic)
+            return read_buffer
         else:
             raise RoleError("ERROR: Cannot create buffer to read from characteristic when characteristic does not allow for reading!")
 
     # characteristic -> Characteristic: The characteristic for the buffer to write to
-    # buffer_size -> int: The total size of the buffer
-    # max_packet_size -> int: The maximum size of how big a single write packet can be (should probably be around buffer_size)
-    def create_packet_buffer(self, characteristic: Characteristic, buffer_size: int, max_packet_size: int) -> PacketBuffer:
-        properties = self._convert_num_to_properties(characteristic.properties)
-        
+    # (optional) buffer_size -> int = 4: How many packets the buffer holds (like _bleio this counts packets, not bytes)
+    # (optional) max_packet_size -> int = None: The maximum size of how big a single write packet can be,
+    # None uses the most the characteristic allows, which is cut down to what the connection allows when writing
+    def create_packet_buffer(self, characteristic: Characteristic, buffer_size: int = 4, max_packet_size: int = None) -> PacketBuffer:
         # Check if it's possible to write to the characteristic
-        if properties[0] or properties[1]:
-            return PacketBuffer(characteristic, buffer_size=buffer_size, max_packet_size=max_packet_size)
+        if characteristic.properties & (PROPERTY_WRITE | PROPERTY_WRITE_NO_RESPONSE):
+            # The length a peripheral's characteristic gives us may not be right, so go by the connection instead
+            if max_packet_size == None and characteristic.service != None and characteristic.service.remote:
+                max_packet_size = self.get_packet_length(characteristic)
+            write_buffer = self._backend.create_packet_buffer(characteristic, buffer_size, max_packet_size)
+            self._remember_buffer_uuid(write_buffer, characteristic)
+            self._remember_buffer_link(write_buffer, characteristic)
+            return write_buffer
         else:
             raise RoleError("ERROR: Cannot create buffer to write to a characteristic when characteristic does not allow for writing!")
 
+    # This deinits a buffer made by create_characteristic_buffer() or create_packet_buffer() and forgets everything the
+    # manager kept about it, use it instead of the buffer's own deinit() so nothing is left behind for buffers that are gone
+    #
+    # buffer -> CharacteristicBuffer or PacketBuffer: The buffer to get rid of
+    def deinit_buffer(self, buffer):
+        buffer.deinit()
+        self._forget_buffer(buffer)
+
+    # This gets the CharacteristicHandle for a characteristic, the same handle is returned every time for the same characteristic
+    #
+    # characteristic -> Characteristic: The characteristic to get the handle of
+    # (optional) max_length -> int = None: The max length of a packet for the handle's write buffer (only used when the handle is made),
+    # None uses the most the characteristic and the connection allow
+    # (optional) buffer_size -> int = 64: How many bytes the handle's read buffer can hold (only used when the handle is made)
+    def get_handle(self, characteristic: Characteristic, max_length: int = None, buffer_size: int = 64) -> CharacteristicHandle:
+        handle = self._handles.get(characteristic)
+        if handle == None:
+            handle = CharacteristicHandle(self, characteristic, max_length, buffer_size)
+            self._handles[characteristic] = handle
+        return handle
+
     # This reads with a characteristic buffer
+    # When message_framing is set this reads a single framed message and returns an empty bytes if a full one hasn't arrived
+    # If the characteristic has a codec (see set_codec()) the decoded value is returned instead
     def read_from_characteristic_with_buffer(self, read_buffer: CharacteristicBuffer) -> bytes:
         if self.get_bluetooth_connection_state():
-            return read_buffer.readline()
+            if self.message_framing == FRAMING_NONE:
+                value = read_buffer.readline()
+            else:
+                frame = self._read_frame_header(read_buffer)
+                if frame < 0:
+                    return b""
+                message = read_buffer.read(frame & 0xFF) if frame & 0xFF > 0 else b""
+                value = self._check_frame_sequence(read_buffer, frame >> 8, message)
+
+            if self._stats != None and value:
+                self._stats.count(self._buffer_uuids.get(read_buffer), BluetoothStats.MESSAGES_READ, len(value))
+            if self._reconnect != None and value:
+                self._note_data(self._buffer_links.get(read_buffer))
+            if self._codecs and value:
+                return self._decode(self._buffer_uuids.get(read_buffer), value)
+            return value
         else:
+            self._count_error()
             raise Exception("ERROR: Something went wrong when reading from characteristic!")
         
+    # This reads with a characteristic buffer into buf instead of returning a new bytes, it returns how many bytes were put into buf.
+    # Nothing is allocated so it can be called every frame without filling up memory. It doesn't wait for anything to arrive:
+    # without message_framing it reads everything that's arrived (as much as fits), with message_framing it reads a single
+    # message and returns 0 if one hasn't arrived yet (or it's a repeat when using FRAMING_SEQUENCE). A message that has only
+    # partly arrived is left where it is until the rest of it has. Codecs aren't used, buf holds the encoded message
+    #
+    # read_buffer -> CharacteristicBuffer: The buffer to read from
+    # buf -> bytearray or memoryview: Where to put what's read, with message_framing it must fit a whole message
+    def read_from_characteristic_with_buffer_into(self, read_buffer: CharacteristicBuffer, buf) -> int:
+        if not self.get_bluetooth_connection_state():
+            self._count_error()
+            raise Exception("ERROR: Something went wrong when reading from characteristic!")
+
+        if self.message_framing == FRAMING_NONE:
+            waiting = read_buffer.in_waiting
+            if waiting == 0 or len(buf) == 0:
+                return 0
+            count = read_buffer.readinto(buf, min(waiting, len(buf)))
+            if self._stats != None:
+                self._stats.count(self._buffer_uuids.get(read_buffer), BluetoothStats.MESSAGES_READ, count)
+            return count
+
+        frame = self._read_frame_header(read_buffer)
+        if frame < 0:
+            return 0
+        length = frame & 0xFF
+        if length > len(buf):
+            # Throw the message away so the next read starts at the next message, it has all arrived so this doesn't wait
+            read_buffer.read(length)
+            raise ValueError("ERROR: buf is too small for the message!")
+
+        count = read_buffer.readinto(buf, length) if length > 0 else 0
+        if self.message_framing == FRAMING_SEQUENCE:
+            if self._read_sequences.get(read_buffer) == frame >> 8:
+                return 0
+            self._read_sequences[read_buffer] = frame >> 8
+        if self._stats != None:
+            self._stats.count(self._buffer_uuids.get(read_buffer), BluetoothStats.MESSAGES_READ, count)
+        return count
+
+    # This reads the characteristic's value into buf, it returns how many bytes were put into buf.
+    # Note: _bleio makes a new bytes for the value every time it's read, so only buffers can be read without allocating anything.
+    # Codecs aren't used, buf holds the encoded value
+    #
+    # characteristic -> Characteristic: The characteristic to read from
+    # buf -> bytearray or memoryview: Where to put the value, anything that doesn't fit is left out
+    def read_from_characteristic_into(self, characteristic: Characteristic, buf) -> int:
+        if not self.get_bluetooth_connection_state():
+            self._count_error()
+            raise Exception("ERROR: Something went wrong when reading from characteristic!")
+
+        value = self._read_value(characteristic)
+        count = min(len(value), len(buf))
+        buf[:count] = value[:count]
+        return count
+
     # This reads with the direct value from the characteristic
+    # When message_framing is FRAMING_SEQUENCE an empty bytes is returned if the value hasn't changed since the last read
+    # If the characteristic has a codec (see set_codec()) the decoded value is returned instead, stateful codecs raise a ValueError
     def read_from_characteristic(self, characteristic: Characteristic) -> bytearray:
         if self.get_bluetooth_connection_state():
-            return characteristic.value
+            # The same value can be read more than once (or not at all), which a codec that decodes a message
+            # from the messages before it (like a DeltaCodec) can't tell apart from a new one
+            if self._codecs and getattr(self.get_codec(characteristic), "stateful", False):
+                raise ValueError("ERROR: Cannot read a characteristic with a stateful codec directly! Subscribe to it or read it with a buffer instead!")
+            if self._codecs or self._reconnect != None:
+                value = self._read_value(characteristic)
+                if self._reconnect != None and value:
+                    self._note_data(self._get_link_of(characteristic))
+                return self._decode(characteristic.uuid, value) if value and self._codecs else value
+            return self._read_value(characteristic)
         else:
+            self._count_error()
             raise Exception("ERROR: Something went wrong when reading from characteristic!")
 
+    # This reads the characteristic's value and takes off its frame header
+    def _read_value(self, characteristic: Characteristic) -> bytearray:
+        if self._stats == None:
+            if self.message_framing == FRAMING_NONE:
+                return characteristic.value
+            return self._unframe_message(characteristic, characteristic.value)
+
+        started = self._backend.monotonic()
+        value = characteristic.value
+        self._stats.read_latency.add(self._backend.monotonic() - started)
+        if self.message_framing != FRAMING_NONE:
+            value = self._unframe_message(characteristic, value)
+        if value:
+            self._stats.count(characteristic.uuid, BluetoothStats.MESSAGES_READ, len(value))
+        return value
+
     # write_buffer -> PacketBuffer: The buffer to write to
-    # message -> string: The message to send to the buffer
-    # (optional) max_length -> int = 20: The max length of a packet sent with the buffer
-    # (optional) clear_buffer -> bool = True: Whether or not to clear the buffer before sending the specified message
-    def write_to_characteristic_with_buffer(self, write_buffer: PacketBuffer, message: string, max_length: int = 20, clear_buffer: bool = True) -> int:
+    # message -> str, bytes, bytearray or memoryview: The message to send to the buffer, anything but a str is written as it is
+    # without being copied so the streaming loop doesn't have to allocate anything. If the characteristic has a codec (see set_codec())
+    # the message is whatever the codec encodes
+    # (optional) max_length -> int = None: The max length of a packet sent with the buffer, None uses the buffer's outgoing packet length
+    # (optional) clear_buffer -> bool = True: Whether or not to clear the buffer before sending the specified message (ignored with message_framing)
+    def write_to_characteristic_with_buffer(self, write_buffer: PacketBuffer, message, max_length: int = None, clear_buffer: bool = True) -> int:
         if self.get_bluetooth_connection_state():
-            if clear_buffer:
-                # Clear the buffer then write the actual message to prevent old messages from bleeding over
-                write_buffer.write(bytes((" " * (max_length - 1)) + "\n", 'utf-8'))
-            return write_buffer.write(bytes(message, 'utf-8'))
+            if max_length == None:
+                max_length = self._get_buffer_packet_length(write_buffer)
+            message = self._encode_buffer_message(write_buffer, message)
+            header = self._get_buffer_header(write_buffer, message, max_length)
+            padding = self._get_buffer_padding(max_length, clear_buffer)
+
+            if padding != None:
+                write_buffer.write(padding)
+            written = write_buffer.write(message, header=header)
+            self._count_buffer_write(write_buffer, message, written)
+            return written
         else:
+            self._count_error()
             raise Exception("ERROR: Something went wrong when writing to characteristic!")
 
     # characteristic -> Characteristic: The characteristic to directly write to
-    # message -> string: The message to send to the buffer
-    # (optional) max_length -> int = 20: The max length of a packet sent with the buffer
-    # (optional) clear_buffer -> bool = True: Whether or not to clear the buffer before sending the specified message
-    def write_to_characteristic(self, characteristic: Characteristic, message: string, max_length: int = 20, clear_buffer: bool = True) -> bytearray:
+    # message -> str: The message to send to the buffer, or whatever its codec encodes if it has one (see set_codec())
+    # (optional) max_length -> int = None: The max length of a packet sent with the buffer, None uses get_packet_length()
+    # (optional) clear_buffer -> bool = True: Whether or not to clear the buffer before sending the specified message (ignored with message_framing)
+    def write_to_characteristic(self, characteristic: Characteristic, message: str, max_length: int = None, clear_buffer: bool = True) -> bytearray:
         if self.get_bluetooth_connection_state():
-            if clear_buffer:
+            if max_length == None:
+                max_length = self.get_packet_length(characteristic)
+            if self._stats != None:
+                started = self._backend.monotonic()
+            if self._codecs:
+                message = self._encode(characteristic.uuid, message)
+            if isinstance(message, str):
+                message = bytes(message, 'utf-8')
+
+            if self.message_framing != FRAMING_NONE:
+                characteristic.value = self._frame_message(characteristic, message, max_length)
+            elif clear_buffer:
                 # Clear the buffer then write the actual message to prevent old messages from bleeding over
-                characteristic.value = bytes((" " * (max_length - 1)) + "\n", 'utf-8')
-            characteristic.value = bytes(message, 'utf-8')
+                characteristic.value = self._get_padding(max_length)
+                characteristic.value = message
+            else:
+                characteristic.value = message
+
+            if self._stats != None:
+                self._stats.write_latency.add(self._backend.monotonic() - started)
+                self._stats.count(characteristic.uuid, BluetoothStats.MESSAGES_WRITTEN, len(message))
             
             return characteristic.value
         else:
+            self._count_error()
             raise Exception("ERROR: Something went wrong when writing to characteristic!")
 
+    # This subscribes to a characteristic so every new value is handed to callback by update_subscriptions() instead of reading it every frame.
+    # For a host's characteristic this turns on notify or indicate, for one of our own characteristics this gets the values a host writes
+    #
+    # characteristic -> Characteristic: The characteristic to subscribe to
+    # callback -> function(characteristic, value: bytes): The function to call with every new value (decoded if the characteristic has a codec)
+    # (optional) indicate -> bool = False: Use indicate instead of notify so every value is acknowledged by us
+    # (optional) buffer_size -> int = 4: How many values (packets) can wait between calls to update_subscriptions()
+    def subscribe(self, characteristic: Characteristic, callback, indicate: bool = False, buffer_size: int = 4):
+        flags = characteristic.properties
+        remote = characteristic.service != None and characteristic.service.remote
+
+        # Check if the characteristic can actually give us new values
+        if remote and not flags & (PROPERTY_INDICATE if indicate else PROPERTY_NOTIFY):
+            raise RoleError("ERROR: Cannot subscribe to characteristic when characteristic does not allow for notify or indicate!")
+        if not remote and not flags & (PROPERTY_WRITE | PROPERTY_WRITE_NO_RESPONSE):
+            raise RoleError("ERROR: Cannot subscribe to characteristic when characteristic does not allow for writing!")
+
+        self.unsubscribe(characteristic)
+
+        # A PacketBuffer keeps each value separate, unlike a CharacteristicBuffer which joins them all together
+        read_buffer = self._backend.create_packet_buffer(characteristic, buffer_size, None)
+        if remote:
+            characteristic.set_cccd(notify=not indicate, indicate=indicate)
+        # The link is kept so service_connections() knows which peripheral the values come from
+        link = self._get_link_of(characteristic) if remote else None
+        self._subscriptions[characteristic] = (read_buffer, callback, bytearray(max(read_buffer.incoming_packet_length or 0, 20)), link, indicate)
+
+    # This stops handing values from a characteristic to its callback
+    def unsubscribe(self, characteristic: Characteristic):
+        subscription = self._subscriptions.pop(characteristic, None)
+        if subscription == None:
+            return
+
+        self.deinit_buffer(subscription[0])
+        if characteristic.service != None and characteristic.service.remote and self.get_bluetooth_connection_state():
+            characteristic.set_cccd(notify=False, indicate=False)
+
+    # This hands every value that has arrived since the last call to the callback it was subscribed with,
+    # call it once every frame. It returns the amount of values that were handed out
+    def update_subscriptions(self) -> int:
+        if not self.get_bluetooth_connection_state():
+            return 0
+
+        dispatched = 0
+        for characteristic, subscription in list(self._subscriptions.items()):
+            dispatched += self._dispatch_subscription(characteristic, subscription)
+        return dispatched
+
+    # This makes a SendQueue which joins small messages into full packets before writing them with write_buffer.
+    # Call update_send_queues() every frame so the packets get written
+    #
+    # write_buffer -> PacketBuffer: The buffer to write the packets with
+    # (optional) max_packet_size -> int = None: The size of a packet, None uses the outgoing packet length of write_buffer
+    # (so make the queue after connecting to get packets as big as the connection allows)
+    # (optional) max_delay -> float = 0.01: The longest a message waits in seconds for the rest of its packet to fill up
+    # (optional) capacity -> int = 4: How many packets can be waiting to be written
+    # (optional) overflow -> int = OVERFLOW_DROP_NEWEST: What to do with a new message when the queue is full (OVERFLOW_BLOCK,
+    # OVERFLOW_DROP_OLDEST or OVERFLOW_DROP_NEWEST)
+    # (optional) block_timeout -> float = None: How long send() waits in seconds with OVERFLOW_BLOCK, None waits until there's room
+    def create_send_queue(self, write_buffer: PacketBuffer, max_packet_size: int = None, max_delay: float = 0.01, capacity: int = 4, overflow: int = OVERFLOW_DROP_NEWEST, block_timeout: float = None) -> SendQueue:
+        send_queue = SendQueue(self, write_buffer, max_packet_size, max_delay, capacity, overflow, block_timeout)
+        self._send_queues.append(send_queue)
+        return send_queue
+
+    # This stops update_send_queues() from writing a SendQueue, anything still in it is thrown away
+    def remove_send_queue(self, send_queue: SendQueue):
+        if send_queue in self._send_queues:
+            self._send_queues.remove(send_queue)
+
+    # This writes the packets of every SendQueue that are ready, call it once every frame. It returns how many packets were written
+    def update_send_queues(self) -> int:
+        if not self.get_bluetooth_connection_state():
+            return 0
+
+        written = 0
+        for send_queue in self._send_queues:
+            written += send_queue.update()
+        return written
+
     #
     # Peripheral Functions
     #
 
-    def start_advertising(self, advertisement: Advertisement):
+    # This makes an advertisement that tells hosts about one of our services, so they can find us with match_service()
+    # service -> Service: The service to advertise
+    def create_services_advertisement(self, service: Service) -> Advertisement:
+        return self._backend.create_services_advertisement(service)
+
+    # advertisement -> Advertisement: The advertisement to send out
+    # (optional) interval -> float = 0.1: The time in seconds between advertisements (0.02 - 10.24)
+    def start_advertising(self, advertisement: Advertisement, interval: float = 0.1):
         if not self.get_bluetooth_advertising_state() and self.bluetooth_mode_peripheral:
-            self._radio.start_advertising(advertisement)
+            self._radio.start_advertising(advertisement, interval=interval)
         elif not self.bluetooth_mode_peripheral:
             raise RoleError("ERROR: Device is not acting as peripheral! Cannot work with advertisements!")
         else:
@@ -163,7 +1493,7 @@ class BluetoothManager:
 
     # This function lets the user scan for advertisements with a variety of settings to adjust how we scan
     # (optional) advertisements_to_collect -> int = 10: The total amount of advertisements we can collect in a scan
-    # (optional) buffer_size -> int = 512: How big a detected advertisement can be
+    # (optional) buffer_size -> int = None: How many bytes of advertisements can wait to be read, None picks it from the memory budget
     # (optional) extended -> bool = False: When true it will support extended advertisement packets
     # (optional) timeout -> float = None: The amount of time we should wait between detected advertisements to stop the scan
     # (optional) interval -> float = 0.1: The interval (in seconds) between the start of two consecutive scan windows, must be in the range 0.0025 - 40.959375 seconds.
@@ -172,17 +1502,30 @@ class BluetoothManager:
     # (optional) filter_no_name -> bool = True: If true it will filter out any advertisements that don't have a name
     # (optional) active -> bool = True: Allows the scan to actually request and retrieve scan responses (not sure why you'd turn this off)
     # (optional) print_debug -> bool = False: Prints debug information if true
-    def start_scanning(self, advertisements_to_collect: int = 10, buffer_size: int = 512, extended: bool = False, timeout: float = None, interval: float = 0.1, window: float = 0.1, minimum_rssi: int = -80, filter_no_name: bool = True, active: bool = True, print_debug: bool = False) -> dict:
+    # (optional) memory_budget -> int = None: How many bytes the scan buffer and the results can use, None uses half of the free
+    # memory when it can be known (see plan_scan_memory()). When the results are full the device with the weakest rssi is
+    # dropped to make room for a stronger one, and the scan stops early instead of running out of memory
+    def start_scanning(self, advertisements_to_collect: int = 10, buffer_size: int = None, extended: bool = False, timeout: float = None, interval: float = 0.1, window: float = 0.1, minimum_rssi: int = -80, filter_no_name: bool = True, active: bool = True, print_debug: bool = False, memory_budget: int = None) -> dict:
         if not self.bluetooth_mode_peripheral:
             detected_devices = dict()
             amount_of_advertisements = 0
+            started = self._backend.monotonic()
+
+            planned_buffer_size, capacity = self.plan_scan_memory(memory_budget, extended)
+            if buffer_size == None:
+                buffer_size = planned_buffer_size
+            # The rssi of every device in detected_devices so the weakest one can be dropped when it's full
+            detected_rssi = {}
             
-            for advertisement in self._radio.start_scan(ProvideServicesAdvertisement, Advertisement, buffer_size=buffer_size, extended=extended, timeout=timeout, interval=interval, window=window, minimum_rssi=minimum_rssi, active=active):
-                
+            for advertisement in self._scan_within_memory(buffer_size, extended, timeout, interval, window, minimum_rssi, active):
+                self.scan_cache.update(advertisement)
+                if self._stats != None:
+                    self._stats.advertisements_seen += 1
+
                 # If detected advertisements have a name and we don't have 50 or more collected then we should add it as that's
                 # a device we can connect to without using up all our memory
-                if (filter_no_name and advertisement.complete_name == None) or amount_of_advertisements >= advertisements_to_collect:
-                    continue;
+                if filter_no_name and advertisement.complete_name == None:
+                    continue
                 
                 # Increment to have an accurate amount of advertisements that passed the check
                 amount_of_advertisements += 1
@@ -199,8 +1542,32 @@ class BluetoothManager:
                 
                 # If the advertisement responds back it's likely a device and if we don't already have it we should add it
                 if advertisement.scan_response and ((not filter_no_name) + (detected_devices.get(advertisement.complete_name) == None)) >= 1:
-                    detected_devices[advertisement.complete_name] = advertisement.address
-                
+                    name = advertisement.complete_name
+                    rssi = advertisement.rssi if advertisement.rssi != None else -128
+                    keep = True
+                    if capacity != None and name not in detected_devices and len(detected_devices) >= capacity:
+                        # Make room by dropping the weakest device, unless this one is even weaker
+                        weakest = None
+                        for other in detected_rssi:
+                            if weakest == None or detected_rssi[other] < detected_rssi[weakest]:
+                                weakest = other
+                        keep = rssi > detected_rssi[weakest]
+                        if keep:
+                            del detected_devices[weakest]
+                            del detected_rssi[weakest]
+                            if print_debug:
+                                print("Dropped", weakest, "to make room for", name)
+                    if keep:
+                        detected_devices[name] = advertisement.address
+                        detected_rssi[name] = rssi
+
+                # Stop the scan as soon as we have enough instead of letting it run until the timeout for nothing
+                if amount_of_advertisements >= advertisements_to_collect:
+                    break
+
+            self._radio.stop_scan()
+            self._count_scan(started)
+
             if print_debug:
                 print("Number of Collected Advertisements:", amount_of_advertisements)
             
@@ -208,49 +1575,744 @@ class BluetoothManager:
         else:
             raise RoleError("ERROR: Device is not acting as Host! Cannot scan for advertisements!")
 
+    # This scans like start_scanning() but yields every device as soon as it's seen instead of returning them all at the end.
+    # Every device is only yielded once (by address) and the scan stops as soon as until matches an advertisement,
+    # so finding a device we already know about only takes as long as it takes to hear it once
+    #
+    # (optional) until -> function(advertisement) -> bool = None: Stops the scan after yielding the first advertisement it returns True for
+    # (see match_name() and match_service()), if None then the scan runs until timeout
+    # (optional) unique -> bool = True: If false every advertisement is yielded instead of only the first one from each device
+    # The rest of the arguments are the same as start_scanning() (memory_budget only sizes the scan buffer here)
+    def scan(self, until = None, buffer_size: int = None, extended: bool = False, timeout: float = None, interval: float = 0.1, window: float = 0.1, minimum_rssi: int = -80, filter_no_name: bool = True, active: bool = True, unique: bool = True, memory_budget: int = None):
+        if self.bluetooth_mode_peripheral:
+            raise RoleError("ERROR: Device is not acting as Host! Cannot scan for advertisements!")
+
+        if buffer_size == None:
+            buffer_size = self.plan_scan_memory(memory_budget, extended)[0]
+        seen_addresses = set()
+        started = self._backend.monotonic()
+        try:
+            for advertisement in self._scan_within_memory(buffer_size, extended, timeout, interval, window, minimum_rssi, active):
+                self.scan_cache.update(advertisement)
+                if self._stats != None:
+                    self._stats.advertisements_seen += 1
+
+                # Check the target first since it may be found by a service before its name is heard
+                if until != None and until(advertisement):
+                    yield advertisement
+                    return
+
+                if filter_no_name and advertisement.complete_name == None:
+                    continue
+                if unique:
+                    if advertisement.address in seen_addresses:
+                        continue
+                    seen_addresses.add(advertisement.address)
+                yield advertisement
+        finally:
+            # This runs when the scan ends or the generator is closed. CircuitPython never closes a generator that's just
+            # dropped, so a caller that stops early has to call close() on it (like find_device() does) to stop the radio
+            self._radio.stop_scan()
+            self._count_scan(started)
+
+    # This scans until an advertisement matches until and returns it, or None if timeout runs out first
+    # until -> function(advertisement) -> bool: The check for the device we want (see match_name() and match_service())
+    # The rest of the arguments are the same as start_scanning()
+    def find_device(self, until, timeout: float = None, buffer_size: int = None, extended: bool = False, interval: float = 0.1, window: float = 0.1, minimum_rssi: int = -80, active: bool = True) -> Advertisement:
+        scan = self.scan(until, buffer_size=buffer_size, extended=extended, timeout=timeout, interval=interval, window=window, minimum_rssi=minimum_rssi, filter_no_name=False, active=active)
+        try:
+            for advertisement in scan:
+                if until(advertisement):
+                    return advertisement
+            return None
+        finally:
+            # Returning from the loop leaves the scan paused, closing it is what stops the radio
+            scan.close()
+
     def stop_scanning(self):
         self._radio.stop_scan()
 
-    # detected_devices must be a dictionary that has the device's name as a key with the device's address as it's value
-    def connect(self, detected_devices: dict, device_name: string, print_debug: bool = False) -> BLEConnection:
-        if not self.bluetooth_mode_peripheral:
+    # This works out how big the scan buffer should be and how many devices start_scanning() can keep, it returns
+    # (buffer_size, capacity). The capacity is None when there's no budget and free memory can't be known
+    # (optional) memory_budget -> int = None: How many bytes the scan can use, None uses half of the free memory above SCAN_MEMORY_RESERVE
+    # (optional) extended -> bool = False: Whether the scan looks for extended advertisements, which need a bigger buffer
+    def plan_scan_memory(self, memory_budget: int = None, extended: bool = False) -> tuple:
+        maximum = MAX_EXTENDED_SCAN_BUFFER_SIZE if extended else MAX_SCAN_BUFFER_SIZE
+        if memory_budget == None:
+            free_memory = get_free_memory()
+            if free_memory == None:
+                return (maximum, None)
+            memory_budget = (free_memory - SCAN_MEMORY_RESERVE) // 2
+
+        # The buffer gets up to half of the budget and the rest holds the results
+        buffer_size = max(MIN_SCAN_BUFFER_SIZE, min(maximum, memory_budget // 2))
+        return (buffer_size, max(1, (memory_budget - buffer_size) // SCAN_RESULT_SIZE))
+
+    # This yields every advertisement the radio hears like BLERadio.start_scan() but it's careful with memory. If there isn't
+    # enough memory for the scan buffer it tries again with half the buffer, and the scan stops early (instead of crashing)
+    # when memory runs out or free memory drops below SCAN_MEMORY_RESERVE
+    def _scan_within_memory(self, buffer_size: int, extended: bool, timeout: float, interval: float, window: float, minimum_rssi: int, active: bool):
+        while True:
+            heard = False
             try:
-                self.ble = self._radio.connect(detected_devices[device_name])
-                
-                if print_debug:
-                    print("Connected to ", device_name, ": ", detected_devices[device_name], ": ", self.get_bluetooth_connection_state(), sep="")
-                
-                return self.ble
-            except KeyError:
+                for advertisement in self._radio.start_scan(*self._backend.scan_types, buffer_size=buffer_size, extended=extended, timeout=timeout, interval=interval, window=window, minimum_rssi=minimum_rssi, active=active):
+                    heard = True
+                    yield advertisement
+                    free_memory = get_free_memory(False)
+                    if free_memory != None and free_memory < SCAN_MEMORY_RESERVE and get_free_memory() < SCAN_MEMORY_RESERVE:
+                        return
+                return
+            except MemoryError:
+                self._radio.stop_scan()
+                gc.collect()
+                if heard or buffer_size <= MIN_SCAN_BUFFER_SIZE:
+                    return
+                buffer_size = max(MIN_SCAN_BUFFER_SIZE, buffer_size // 2)
+
+    # detected_devices must be a dictionary that has the device's name as a key with the device's address as it's value.
+    # If device_name isn't in detected_devices (or detected_devices is None) then the device is looked up in scan_cache,
+    # so a device seen in a recent scan can be connected to without scanning again
+    # (optional) timeout -> float = 4.0: How long to try connecting for in seconds
+    def connect(self, detected_devices: dict, device_name: str, print_debug: bool = False, timeout: float = 4.0) -> BLEConnection:
+        if not self.bluetooth_mode_peripheral:
+            address = None
+            if detected_devices != None:
+                address = detected_devices.get(device_name)
+            if address == None:
+                cached_device = self.scan_cache.find(device_name)
+                if cached_device != None:
+                    address = cached_device.address
+            if address == None:
                 raise BluetoothError("Device name not found! Cannot connect to nonexistant device!")
+
+            started = self._backend.monotonic()
+            try:
+                self.ble = self._radio.connect(address, timeout=timeout)
+            except Exception:
+                self._count_error()
+                raise
+            if self._stats != None:
+                self._stats.connects += 1
+                self._stats.connect_latency.add(self._backend.monotonic() - started)
+
+            # Keep every connection so we can be connected to multiple peripherals at once
+            self._link = PeripheralLink(address, self.ble, self.max_outgoing_messages)
+            self._link.last_data = self._backend.monotonic()
+            self.connections[address] = self._link
+            self._last_peer = (address, device_name)
+
+            if print_debug:
+                print("Connected to ", device_name, ": ", address, ": ", self.get_bluetooth_connection_state(), sep="")
+
+            return self.ble
         else:
             raise RoleError("ERROR: Device is not acting as Host! Cannot connect to another device!")
 
-    def disconnect(self, print_debug: bool = False):
+    # (optional) address = None: The address of the peripheral to disconnect from, if None then we disconnect from ble
+    def disconnect(self, print_debug: bool = False, address = None):
         if not self.bluetooth_mode_peripheral:
-            if self.ble != None and self.get_bluetooth_connection_state():
-                self.ble.disconnect()
+            link = self._get_link(address)
+            if link != None and link.connected and self.get_bluetooth_connection_state():
+                link.connection.disconnect()
                 
                 if print_debug:
                     print("Disconnected")
+
+            if link != None:
+                self._forget_link(link)
+
+                # We meant to disconnect so auto reconnect shouldn't bring the link back
+                if self._last_peer != None and self._last_peer[0] == link.address:
+                    self._last_peer = None
+                    if self._reconnect != None:
+                        self._reconnect._subscriptions = []
+                        self._reconnect.attempts = 0
+                        self._reconnect.next_attempt = None
         else:
             raise RoleError("ERROR: Device is not acting as Host! Cannot disconnect from a device!")
 
     # This allows for a host to work with services from a connected peripheral
-    def discover_device_services(self, filters: list = []) -> tuple:
+    # (optional) address = None: The address of the peripheral to discover services from, if None then ble is used
+    def discover_device_services(self, filters: list = [], address = None) -> tuple:
         if not self.bluetooth_mode_peripheral:
+            link = self._get_link(address)
+
             # Make sure our connections are good
-            if self.ble and self.get_bluetooth_connection_state() and self.ble.connected:
+            if link != None and self.get_bluetooth_connection_state() and link.connected:
                 uuid_filters = []
                 for entry in filters:
-                    uuid_filters.append(UUID(int(entry)))
+                    uuid_filters.append(self._convert_uuid_to_num(entry))
                     
-                if len(uuid_filters) > 0:            
-                    return self.ble._bleio_connection.discover_remote_services(iter(uuid_filters))
-                else:
-                    return self.ble._bleio_connection.discover_remote_services()
+                started = self._backend.monotonic()
+                services = self._backend.discover_remote_services(link.connection, uuid_filters)
+                if self._stats != None:
+                    self._stats.discovery_latency.add(self._backend.monotonic() - started)
+
+                # Remember what we found so find_characteristic() and the next connection don't have to discover it again
+                for service in services:
+                    link._discovered_services[_get_uuid_key(service.uuid)] = service
+                self.gatt_cache.update(link.address, services, len(uuid_filters) == 0)
+
+                return services
         else:
             raise RoleError("ERROR: Device is not acting as Host! Cannot discover services from connected device!")
+
+    # This finds a characteristic of the connected peripheral by the uuids of its service and itself, None if it doesn't have it.
+    # If gatt_cache knows the peripheral then only the one service is discovered, otherwise every service is discovered once and remembered
+    #
+    # service_uuid -> str: The uuid of the service written like a hex code ("0x185A")
+    # characteristic_uuid -> str: The uuid of the characteristic written like a hex code ("0x2BDE")
+    # (optional) address = None: The address of the peripheral to look in, if None then ble is used
+    def find_characteristic(self, service_uuid: str, characteristic_uuid: str, address = None) -> Characteristic:
+        link = self._get_link(address)
+        if link == None:
+            return None
+
+        service_key = self._convert_uuid_to_num(service_uuid)
+        characteristic_key = self._convert_uuid_to_num(characteristic_uuid)
+
+        if service_key not in link._discovered_services:
+            cached = self.gatt_cache.get_service(link.address, service_key)
+            if cached != None:
+                self.discover_device_services([service_key], link.address)
+
+                # If the peripheral has changed since we cached it then forget it and look at everything it has
+                if not self._check_cached_service(link, service_key, cached):
+                    self.gatt_cache.forget(link.address)
+                    self.discover_device_services([], link.address)
+            else:
+                self.discover_device_services([], link.address)
+
+        service = link._discovered_services.get(service_key)
+        if service == None:
+            return None
+        for characteristic in service.characteristics:
+            if _get_uuid_key(characteristic.uuid) == characteristic_key:
+                return characteristic
+        return None
+
+    # This queues a message to be written to a peripheral by service_connections(), it returns False if too many are already waiting
+    #
+    # address -> Address: The address of the peripheral to write to
+    # write_buffer -> PacketBuffer: The buffer to write with
+    # message -> str: The message to write
+    def send_to(self, address, write_buffer: PacketBuffer, message: str) -> bool:
+        link = self.connections.get(address)
+        if link == None:
+            raise BluetoothError("ERROR: Not connected to that device! Cannot send to it!")
+        if len(link._outgoing) >= link.max_outgoing:
+            return False
+
+        link._outgoing.append((write_buffer, message))
+        return True
+
+    # This gives every connected peripheral a turn at having its values handed to their subscriptions and its queued messages written.
+    # A peripheral gets at most quantum values and quantum writes per turn so a busy peripheral can't hold up the rest of them,
+    # and the peripheral that goes first changes every call. The subscriptions to our own characteristics get a turn after them.
+    # Call it once every frame, it returns how many values and writes were done
+    #
+    # (optional) quantum -> int = 4: The most values and the most writes a single peripheral gets per turn
+    def service_connections(self, quantum: int = 4) -> int:
+        links = list(self.connections.values())
+        work = 0
+        start = self._next_link_index % len(links) if len(links) > 0 else 0
+        self._next_link_index = start + 1
+        for i in range(len(links)):
+            link = links[(start + i) % len(links)]
+            if not link.connected:
+                self._forget_link(link)
+                continue
+
+            # Hand out the values that came from this peripheral
+            for characteristic, subscription in list(self._subscriptions.items()):
+                if subscription[3] is link:
+                    work += self._dispatch_subscription(characteristic, subscription, quantum)
+
+            # Write what's waiting for this peripheral until its buffer is full
+            for _ in range(quantum):
+                if len(link._outgoing) == 0:
+                    break
+                write_buffer, message = link._outgoing[0]
+                if self.write_to_characteristic_with_buffer(write_buffer, message, clear_buffer=False) <= 0:
+                    break
+                link._outgoing.pop(0)
+                work += 1
+
+        # Values written to our own characteristics come from the host we're connected to, not from one of the peripherals
+        if self.get_bluetooth_connection_state():
+            for characteristic, subscription in list(self._subscriptions.items()):
+                if subscription[3] == None:
+                    work += self._dispatch_subscription(characteristic, subscription, quantum)
+        return work
+
+    # This hands the values waiting in a subscription's buffer to its callback, it returns how many were handed out
+    # (optional) limit -> int = None: The most values to hand out, if None every waiting value is
+    def _dispatch_subscription(self, characteristic: Characteristic, subscription: tuple, limit: int = None) -> int:
+        read_buffer, callback, packet, link, indicate = subscription
+        dispatched = 0
+        while limit == None or dispatched < limit:
+            count = read_buffer.readinto(packet)
+            if count <= 0:
+                break
+            value = bytes(packet[:count])
+            if self.message_framing != FRAMING_NONE:
+                value = self._unframe_message(read_buffer, value)
+            if self._stats != None:
+                self._stats.count(characteristic.uuid, BluetoothStats.MESSAGES_READ, len(value))
+            if self._reconnect != None:
+                self._note_data(link)
+            if self._codecs and value:
+                value = self._decode(characteristic.uuid, value)
+            callback(characteristic, value)
+            dispatched += 1
+        return dispatched
+
+    # This gets the link to a peripheral by address, or the link for ble if address is None
+    def _get_link(self, address) -> PeripheralLink:
+        if address == None:
+            return self._link
+        return self.connections.get(address)
+
+    # This gets the link a characteristic was discovered from, None if it's one of our own
+    def _get_link_of(self, characteristic: Characteristic) -> PeripheralLink:
+        for link in self.connections.values():
+            for service in link._discovered_services.values():
+                if characteristic in service.characteristics:
+                    return link
+        return None
+
+    def _forget_link(self, link: PeripheralLink):
+        if self.connections.get(link.address) is link:
+            del self.connections[link.address]
+
+        # The values of a peripheral we aren't connected to won't come anymore, auto reconnect remembers them to subscribe again
+        remember = self._reconnect != None and self._last_peer != None and self._last_peer[0] == link.address
+        if remember:
+            self._reconnect._subscriptions = []
+        for characteristic, subscription in list(self._subscriptions.items()):
+            if subscription[3] is link:
+                if remember:
+                    self._reconnect._subscriptions.append((_get_uuid_key(characteristic.service.uuid), _get_uuid_key(characteristic.uuid), subscription[1], subscription[4]))
+                del self._subscriptions[characteristic]
+                self.deinit_buffer(subscription[0])
+
+        # Neither will its characteristics so their handles (and sequence numbers) can go too
+        for service in link._discovered_services.values():
+            for characteristic in service.characteristics:
+                handle = self._handles.pop(characteristic, None)
+                if handle != None:
+                    handle.deinit()
+                self._forget_buffer(characteristic)
+
+        # The buffers made for it don't work anymore either
+        for buffer, buffer_link in list(self._buffer_links.items()):
+            if buffer_link is link:
+                self._forget_buffer(buffer)
+
+        # ble stays as the disconnected connection unless there is another peripheral to fall back to
+        if self._link is link and len(self.connections) > 0:
+            self._link = list(self.connections.values())[-1]
+            self.ble = self._link.connection
+
+    # This checks that a freshly discovered service still has the characteristics (and properties) we cached for it
+    def _check_cached_service(self, link: PeripheralLink, service_key, cached: list) -> bool:
+        service = link._discovered_services.get(service_key)
+        if service == None or len(service.characteristics) != len(cached):
+            return False
+        for i in range(len(cached)):
+            characteristic = service.characteristics[i]
+            if (_get_uuid_key(characteristic.uuid), characteristic.properties) != cached[i]:
+                return False
+        return True
+    #
+    # Connection Parameters
+    #
+
+    # This returns the parameters of a connection as a dictionary with the connection_interval (in milliseconds),
+    # peripheral_latency (how many connection events the peripheral may skip), supervision_timeout (in milliseconds),
+    # max_packet_length (how many bytes a single packet can carry) and mtu. Anything the backend can't tell us is None.
+    # None is returned if we aren't connected
+    #
+    # (optional) address = None: The address of the peripheral, if None then ble is used (or the host we're connected to as a peripheral)
+    def get_connection_parameters(self, address = None) -> dict:
+        connection = self._get_connection(address)
+        if connection == None:
+            return None
+
+        interval, latency, timeout, max_packet_length = self._backend.get_connection_parameters(connection)
+        return {
+            "connection_interval": interval,
+            "peripheral_latency": latency,
+            "supervision_timeout": timeout,
+            "max_packet_length": max_packet_length,
+            "mtu": max_packet_length + 3,
+        }
+
+    # This asks for new connection parameters, anything that's None is left as it is. The other side can turn them down or pick
+    # something close to them, so it returns what the parameters are afterwards (see get_connection_parameters())
+    #
+    # (optional) connection_interval -> float = None: The time between connection events in milliseconds (7.5 - 4000)
+    # (optional) peripheral_latency -> int = None: How many connection events the peripheral may skip when it has nothing to send (0 - 499)
+    # (optional) supervision_timeout -> float = None: How long in milliseconds without hearing from the other side before the link drops (100 - 32000),
+    # it has to be longer than 2 * connection_interval * (1 + peripheral_latency)
+    # (optional) address = None: The address of the peripheral, if None then ble is used (or the host we're connected to as a peripheral)
+    def set_connection_parameters(self, connection_interval: float = None, peripheral_latency: int = None, supervision_timeout: float = None, address = None) -> dict:
+        connection = self._get_connection(address)
+        if connection == None:
+            raise ConnectionError("ERROR: Not connected! Cannot set connection parameters!")
+
+        if connection_interval != None and (connection_interval < 7.5 or connection_interval > 4000):
+            raise ValueError("ERROR: connection_interval must be in the range 7.5 - 4000 milliseconds!")
+        if peripheral_latency != None and (peripheral_latency < 0 or peripheral_latency > 499):
+            raise ValueError("ERROR: peripheral_latency must be in the range 0 - 499!")
+        if supervision_timeout != None and (supervision_timeout < 100 or supervision_timeout > 32000):
+            raise ValueError("ERROR: supervision_timeout must be in the range 100 - 32000 milliseconds!")
+
+        # The link would drop before the peripheral is ever due to answer if the timeout were any shorter
+        current = self._backend.get_connection_parameters(connection)
+        interval = current[0] if connection_interval == None else connection_interval
+        latency = current[1] if peripheral_latency == None else peripheral_latency
+        timeout = current[2] if supervision_timeout == None else supervision_timeout
+        if interval != None and latency != None and timeout != None and timeout <= 2 * interval * (1 + latency):
+            raise ValueError("ERROR: supervision_timeout must be longer than 2 * connection_interval * (1 + peripheral_latency)!")
+
+        self._backend.set_connection_parameters(connection, connection_interval, peripheral_latency, supervision_timeout)
+        return self.get_connection_parameters(address)
+
+    # This asks for the connection parameters of one of the CONNECTION_PROFILES ("low-latency", "bulk" or "low-power")
+    # and returns what the parameters are afterwards (see get_connection_parameters())
+    #
+    # profile -> str: The name of the profile
+    # (optional) address = None: The address of the peripheral, if None then ble is used (or the host we're connected to as a peripheral)
+    def set_connection_profile(self, profile: str, address = None) -> dict:
+        parameters = CONNECTION_PROFILES.get(profile)
+        if parameters == None:
+            raise ValueError("ERROR: Unknown connection profile " + str(profile) + "!")
+        return self.set_connection_parameters(parameters[0], parameters[1], parameters[2], address)
+
+    # This returns how many bytes a single write to (or notification from) a characteristic can carry, which is the most
+    # the characteristic holds cut down to what the connection negotiated. DEFAULT_PACKET_LENGTH is used while there's no connection
+    def get_packet_length(self, characteristic: Characteristic) -> int:
+        remote = characteristic.service != None and characteristic.service.remote
+        connection = None
+        if remote:
+            link = self._get_link_of(characteristic)
+            if link != None and link.connected:
+                connection = link.connection
+        else:
+            connection = self._get_connection(None) if self.bluetooth_mode_peripheral else None
+
+        # A peripheral's characteristic may only know the largest length an attribute can have (512), which is still a fine upper bound
+        length = characteristic.max_length if characteristic.max_length else None
+        if connection == None:
+            return DEFAULT_PACKET_LENGTH if length == None else min(length, DEFAULT_PACKET_LENGTH)
+        negotiated = self._backend.get_connection_parameters(connection)[3]
+        return negotiated if length == None else min(length, negotiated)
+
+    # This gets the connection to a peripheral (or to the host when we're a peripheral), None if there isn't one
+    def _get_connection(self, address):
+        if self.bluetooth_mode_peripheral:
+            for connection in self._radio.connections:
+                if connection.connected:
+                    return connection
+            return None
+
+        link = self._get_link(address)
+        if link == None or not link.connected:
+            return None
+        return link.connection
+
+    # This gets how long a packet written with a buffer can be
+    def _get_buffer_packet_length(self, buffer) -> int:
+        length = buffer.outgoing_packet_length
+        return DEFAULT_PACKET_LENGTH if length == None else length
+
+    #
+    # Auto Reconnect
+    #
+
+    # This turns auto reconnect on or off. While it's on maintain_connection() keeps an eye on the link to the last peripheral
+    # connect() connected to, and when it drops (or stops looking healthy) it's connected to again with exponential backoff.
+    # Once it's back its subscriptions are made again (finding the characteristics through gatt_cache so only what's needed is discovered)
+    # and on_reconnect is called so anything else that belonged to the old connection (like buffers) can be made again.
+    # Calling disconnect() on that peripheral (or giving up on it after max_attempts) stops it from being reconnected to
+    #
+    # (optional) enabled -> bool = True: Whether to reconnect automatically
+    # (optional) initial_delay -> float = 0.5: How long to wait in seconds before the first attempt
+    # (optional) max_delay -> float = 30: The longest to wait in seconds between attempts
+    # (optional) multiplier -> float = 2: How much longer to wait after every failed attempt
+    # (optional) jitter -> float = 0.25: How much every wait is randomly made longer or shorter (0.25 is up to 25%)
+    # (optional) connect_timeout -> float = 4.0: How long a single attempt tries to connect for in seconds
+    # (optional) max_silence -> float = None: Reconnect early when nothing has come from the peripheral for this many seconds, None never does
+    # (optional) max_write_failures -> int = 5: Reconnect early when this many buffered writes in a row weren't taken, None never does
+    # (optional) min_rssi -> int = None: Reconnect early when the rssi is below this and still falling, None never does
+    # (optional) rssi_drop_rate -> float = None: Reconnect early when the rssi falls faster than this many dBm per second, None never does
+    # (the rssi checks need a backend that can tell us the rssi of a connection, _bleio can't so they only work in the simulator)
+    # (optional) on_reconnect -> function(manager) = None: Called every time the peripheral has been reconnected to
+    # (optional) max_attempts -> int = None: Give up on the peripheral after this many failed attempts in a row, None never gives up
+    def enable_auto_reconnect(self, enabled: bool = True, initial_delay: float = 0.5, max_delay: float = 30, multiplier: float = 2, jitter: float = 0.25, connect_timeout: float = 4.0, max_silence: float = None, max_write_failures: int = 5, min_rssi: int = None, rssi_drop_rate: float = None, on_reconnect = None, max_attempts: int = None):
+        if not enabled:
+            self._reconnect = None
+            return
+
+        self._reconnect = ReconnectPolicy(initial_delay, max_delay, multiplier, jitter, connect_timeout, max_silence, max_write_failures, min_rssi, rssi_drop_rate, on_reconnect, max_attempts)
+        now = self._backend.monotonic()
+        for link in self.connections.values():
+            link.last_data = now
+            link.write_failures = 0
+
+    # This checks the health of the link to the last peripheral and reconnects to it when it's needed, call it once every frame.
+    # It returns whether we're connected to that peripheral. Nothing is done while auto reconnect is off
+    def maintain_connection(self) -> bool:
+        policy = self._reconnect
+        if policy == None or self.bluetooth_mode_peripheral or self._last_peer == None:
+            return self.get_bluetooth_connection_state()
+
+        now = self._backend.monotonic()
+        address, name = self._last_peer
+        link = self.connections.get(address)
+        if link != None and link.connected:
+            reason = self._check_link_health(link, now)
+            if reason == None:
+                # Once the link has stayed up for a while the next drop starts the backoff over,
+                # so a link that keeps dropping straight after reconnecting is tried less and less often
+                if policy.attempts > 0 and policy.connected_at != None and now - policy.connected_at > policy.max_delay:
+                    policy.attempts = 0
+                return True
+
+            # Drop the link ourselves instead of waiting for it to time out
+            policy.early_drops += 1
+            policy.last_reason = reason
+            link.connection.disconnect()
+            self._forget_link(link)
+            policy.schedule(now)
+        elif link != None or policy.next_attempt == None:
+            if link != None:
+                self._forget_link(link)
+            policy.last_reason = "disconnected"
+            policy.schedule(now)
+
+        if now < policy.next_attempt:
+            return False
+        return self._reconnect_to_last_peer()
+
+    # This returns how healthy the link to a peripheral is as a dictionary, or None if we aren't connected to it
+    # (optional) address = None: The address of the peripheral, if None then ble is used
+    def link_health(self, address = None) -> dict:
+        link = self._get_link(address)
+        if link == None:
+            return None
+
+        health = {
+            "connected": link.connected,
+            "rssi": link.rssi,
+            "rssi_trend": link.rssi_trend,
+            "write_failures": link.write_failures,
+            "since_data": None if link.last_data == None else self._backend.monotonic() - link.last_data,
+        }
+        if self._reconnect != None:
+            health["reconnects"] = self._reconnect.reconnects
+            health["early_drops"] = self._reconnect.early_drops
+            health["last_reason"] = self._reconnect.last_reason
+        return health
+
+    # This returns why a link should be dropped early, or None if it looks healthy
+    def _check_link_health(self, link: PeripheralLink, now: float) -> str:
+        policy = self._reconnect
+        if policy.max_silence != None and now - link.last_data > policy.max_silence:
+            return "silence"
+        if policy.max_write_failures != None and link.write_failures >= policy.max_write_failures:
+            return "write_failures"
+
+        rssi = self._backend.connection_rssi(link.connection)
+        if rssi != None:
+            link._record_rssi(rssi, now)
+            if policy.min_rssi != None and link.rssi < policy.min_rssi and link.rssi_trend < 0:
+                return "rssi"
+            if policy.rssi_drop_rate != None and link.rssi_trend < -policy.rssi_drop_rate:
+                return "rssi_trend"
+        return None
+
+    # This makes a single attempt at reconnecting to the last peripheral and setting its subscriptions up again
+    def _reconnect_to_last_peer(self) -> bool:
+        policy = self._reconnect
+        address, name = self._last_peer
+        subscriptions = policy._subscriptions
+        try:
+            self.connect({name: address}, name, timeout=policy.connect_timeout)
+            for service_key, characteristic_key, callback, indicate in subscriptions:
+                characteristic = self.find_characteristic(service_key, characteristic_key, address)
+                if characteristic != None:
+                    self.subscribe(characteristic, callback, indicate)
+        except Exception:
+            link = self.connections.get(address)
+            if link != None:
+                if link.connected:
+                    link.connection.disconnect()
+                self._forget_link(link)
+            policy._subscriptions = subscriptions
+
+            # Giving up forgets the peripheral the same way disconnect() does, connect() to it again to start over
+            if policy.max_attempts != None and policy.attempts >= policy.max_attempts:
+                policy.last_reason = "gave_up"
+                policy._subscriptions = []
+                policy.attempts = 0
+                policy.next_attempt = None
+                self._last_peer = None
+                return False
+            policy.schedule(self._backend.monotonic())
+            return False
+
+        policy.next_attempt = None
+        policy.connected_at = self._backend.monotonic()
+        policy.reconnects += 1
+        if policy.on_reconnect != None:
+            policy.on_reconnect(self)
+        return True
+
+    # This remembers the uuid of the characteristic a buffer was made for, which is only needed to count stats and to find the
+    # codec of the buffer's messages. So turn stats on and set codecs before making the buffers they should cover
+    def _remember_buffer_uuid(self, buffer, characteristic: Characteristic):
+        if self._stats != None or self._codecs:
+            self._buffer_uuids[buffer] = characteristic.uuid
+
+    # This forgets everything kept about a buffer once it's gone (its uuid, link, sequence numbers and any half read message).
+    # A characteristic can be passed in too, for the sequence numbers of the values read and written to it directly
+    def _forget_buffer(self, buffer):
+        self._buffer_uuids.pop(buffer, None)
+        self._buffer_links.pop(buffer, None)
+        self._write_sequences.pop(buffer, None)
+        self._read_sequences.pop(buffer, None)
+        self._read_frames.pop(buffer, None)
+
+    # This remembers which peripheral a buffer belongs to, buffers for our own characteristics don't belong to one
+    def _remember_buffer_link(self, buffer, characteristic: Characteristic):
+        if characteristic.service != None and characteristic.service.remote:
+            link = self._get_link_of(characteristic)
+            if link != None:
+                self._buffer_links[buffer] = link
+
+    # This notes that a value just came from a peripheral
+    def _note_data(self, link: PeripheralLink):
+        if link != None:
+            link.last_data = self._backend.monotonic()
+
+    #
+    # Service Registry
+    #
+
+    # This gets our service with the specified uuid, it's only created the first time so declaring the same service every
+    # time the code runs doesn't make the GATT table grow. The first time a service is declared after the board starts
+    # or the code is reloaded, the services left over from before the reload are cleared out (this stops advertising and
+    # drops every connection, so declare services before doing either of those)
+    #
+    # uuid -> str: The uuid of the service written like a hex code ("0x185A")
+    def declare_service(self, uuid: str) -> Service:
+        global _gatt_table_checked
+        key = self._convert_uuid_to_num(uuid)
+        service = self._local_services.get(key)
+        if service != None:
+            return service
+
+        if not _gatt_table_checked:
+            _gatt_table_checked = True
+            if not self.get_bluetooth_connection_state() and not self.get_bluetooth_advertising_state():
+                self._backend.reset_local_services()
+
+        service = self._backend.create_service(key)
+        self._local_services[key] = service
+        return service
+
+    # This gets the characteristic with the specified uuid in one of our services, it's only added the first time so
+    # declaring it again gives back the same characteristic (and the same handle from get_handle()).
+    # The arguments are the same as add_characteristic_to_service(), a characteristic that was already declared must be declared
+    # with the same properties and max_length since a characteristic can't be changed once it's added
+    def declare_characteristic(self, service: Service, uuid: str, properties: list = [False] * 6, read_perm: Attribute = Attribute.OPEN, write_perm: Attribute = Attribute.OPEN, max_length: int = 20, fixed_length: bool = False, user_description: str = None) -> Characteristic:
+        key = (_get_uuid_key(service.uuid), self._convert_uuid_to_num(uuid))
+        characteristic = self._local_characteristics.get(key)
+        if characteristic != None:
+            if characteristic.properties != self.convert_properties_to_num(properties) or characteristic.max_length != max_length:
+                raise ValueError("ERROR: Characteristic " + str(uuid) + " was already declared with different properties or max_length!")
+            return characteristic
+
+        characteristic = self.add_characteristic_to_service(service, uuid, properties, read_perm, write_perm, max_length, fixed_length, user_description)
+        self._local_characteristics[key] = characteristic
+        return characteristic
+
+    # This gets a characteristic made by declare_characteristic(), None if it hasn't been declared
+    #
+    # service_uuid -> str: The uuid of the service it's in
+    # characteristic_uuid -> str: The uuid of the characteristic
+    def get_local_characteristic(self, service_uuid: str, characteristic_uuid: str) -> Characteristic:
+        return self._local_characteristics.get((self._convert_uuid_to_num(service_uuid), self._convert_uuid_to_num(characteristic_uuid)))
+
+    #
+    # Codecs
+    #
+
+    # This sets the codec a characteristic's values are encoded and decoded with (see ble_codec.py), so values can be sent
+    # as compact binary instead of text. Every read and write function uses it (except the _into ones) and so do subscriptions.
+    # It goes by the characteristic's uuid, so it's used for every buffer of that characteristic and for every peripheral's
+    # characteristic with that uuid. Both sides need a codec that matches.
+    # Note: binary messages can hold a "\n", so read them with message_framing or a subscription when using a CharacteristicBuffer.
+    # Set the codec before making the characteristic's buffers, buffers made before any codec was set never use one
+    #
+    # characteristic -> Characteristic: The characteristic to set the codec of
+    # codec -> object with encode(value) -> bytes and decode(data) -> value: The codec to use, None goes back to sending text
+    def set_codec(self, characteristic: Characteristic, codec):
+        key = _get_uuid_key(characteristic.uuid)
+        if codec == None:
+            self._codecs.pop(key, None)
+        else:
+            self._codecs[key] = codec
+
+    # This gets the codec of a characteristic, None if it doesn't have one
+    def get_codec(self, characteristic: Characteristic):
+        return self._codecs.get(_get_uuid_key(characteristic.uuid))
+
+    # This encodes a message with the codec of the characteristic with the uuid, the message is left as it is if there isn't one
+    def _encode(self, uuid, message):
+        codec = None if uuid == None else self._codecs.get(_get_uuid_key(uuid))
+        return message if codec == None else codec.encode(message)
+
+    # This decodes a value with the codec of the characteristic with the uuid, the value is left as it is if there isn't one
+    def _decode(self, uuid, value):
+        codec = None if uuid == None else self._codecs.get(_get_uuid_key(uuid))
+        return value if codec == None else codec.decode(value)
+
+    #
+    # Stats
+    #
+
+    # This turns the stats on or off, nothing is counted while they're off so they cost next to nothing.
+    # Messages of buffers made while the stats were off are counted without a uuid, so turn them on before making buffers
+    # (optional) enabled -> bool = True: Whether the stats should be kept
+    def enable_stats(self, enabled: bool = True):
+        if enabled and self._stats == None:
+            self._stats = BluetoothStats()
+        elif not enabled:
+            self._stats = None
+
+    # This returns a snapshot of the stats as a dictionary (see BluetoothStats.snapshot()), or None if they aren't enabled
+    def stats(self) -> dict:
+        if self._stats == None:
+            return None
+        return self._stats.snapshot()
+
+    # This sets every counter and histogram back to 0
+    def reset_stats(self):
+        if self._stats != None:
+            self._stats.reset()
+
+    def _count_error(self):
+        if self._stats != None:
+            self._stats.errors += 1
+
+    def _count_scan(self, started: float):
+        if self._stats != None:
+            self._stats.scans += 1
+            self._stats.scan_time += self._backend.monotonic() - started
+
     #
     # Miscellaneous Functions
     #
@@ -264,14 +2326,137 @@ class BluetoothManager:
         return num
 
     # This converts from a number to a boolean array of 6 in length for characteristic properties
+    # (use get_handle() for checks that are done every frame, it doesn't make a new list every time)
     def convert_num_to_properties(self, num: int) -> list:
         properties = [False] * 6
-        
-        binary = bin(num)[2:8]
-        binary = ("0" * (6 - len(binary))) + binary
 
         for i in range(0, 6):
-            if binary[i] == '1':
+            if num & (PROPERTY_WRITE_NO_RESPONSE >> i):
                 properties[i] = True
                 
-        return properties
\ No newline at end of file
+        return properties
+
+    # This converts a uuid written like a hex code ("0x185A") or a plain number into a number
+    def _convert_uuid_to_num(self, uuid) -> int:
+        if isinstance(uuid, str):
+            return int(uuid, 0)
+        # A 128 bit uuid is kept as its bytes (like _get_uuid_key() does)
+        if isinstance(uuid, bytes):
+            return uuid
+        return int(uuid)
+
+    # This gets how many bytes go in front of a message for the current message_framing
+    def _get_frame_header_length(self) -> int:
+        if self.message_framing == FRAMING_SEQUENCE:
+            return 2
+        return 1
+
+    # This puts the header for the current message_framing in front of a message
+    #
+    # target -> Characteristic or PacketBuffer: What the message will be written to (used to keep track of sequence numbers)
+    # message -> str or bytes: The message to frame
+    # max_length -> int: The max length of the framed message
+    def _frame_message(self, target, message, max_length: int) -> bytes:
+        if isinstance(message, str):
+            message = bytes(message, 'utf-8')
+
+        if len(message) + self._get_frame_header_length() > max_length or len(message) > 255:
+            raise ValueError("ERROR: Message is too long to fit in a single framed packet!")
+
+        if self.message_framing == FRAMING_SEQUENCE:
+            sequence = (self._write_sequences.get(target, -1) + 1) & 0xFF
+            self._write_sequences[target] = sequence
+            return bytes((sequence, len(message))) + message
+        return bytes((len(message),)) + message
+
+    # This fills in the frame header for a message written with a buffer and returns a view of it
+    def _get_write_header(self, target, message, max_length: int) -> memoryview:
+        header_length = self._get_frame_header_length()
+        if len(message) + header_length > max_length or len(message) > 255:
+            raise ValueError("ERROR: Message is too long to fit in a single framed packet!")
+
+        if self.message_framing == FRAMING_SEQUENCE:
+            sequence = (self._write_sequences.get(target, -1) + 1) & 0xFF
+            self._write_sequences[target] = sequence
+            self._write_header[0] = sequence
+        self._write_header[header_length - 1] = len(message)
+        return self._write_header_views[header_length]
+
+    # This reads the frame header of the next message in read_buffer, it returns the header as sequence * 256 + length once
+    # the whole message has arrived or -1 if it hasn't yet. The header of a message that's still arriving is kept in
+    # _read_frames, so nothing after the header is read until the message can be read whole and the reads stay in step
+    def _read_frame_header(self, read_buffer) -> int:
+        waiting = read_buffer.in_waiting
+        frame = self._read_frames.pop(read_buffer, None)
+        if frame == None:
+            header_length = self._get_frame_header_length()
+            if waiting < header_length:
+                return -1
+            header = self._read_header
+            read_buffer.readinto(header, header_length)
+            waiting -= header_length
+            frame = header[0] * 256 + header[1] if header_length == 2 else header[0]
+
+        if waiting < frame & 0xFF:
+            self._read_frames[read_buffer] = frame
+            return -1
+        return frame
+
+    # These build the packets write_to_characteristic_with_buffer() writes, the async manager writes the same ones but waits
+    # for space in the buffer in between.
+    # This encodes a message with the codec of the buffer's characteristic and turns a str into bytes
+    def _encode_buffer_message(self, write_buffer: PacketBuffer, message):
+        if self._codecs:
+            message = self._encode(self._buffer_uuids.get(write_buffer), message)
+        if isinstance(message, str):
+            message = bytes(message, 'utf-8')
+        return message
+
+    # This gets the frame header to write in front of a message, or None without message_framing.
+    # The header is written from its own buffer so the message doesn't have to be copied behind it
+    def _get_buffer_header(self, write_buffer: PacketBuffer, message, max_length: int) -> memoryview:
+        if self.message_framing == FRAMING_NONE:
+            return None
+        return self._get_write_header(write_buffer, message, max_length)
+
+    # This gets the packet to write before a message to clear the buffer so old messages don't bleed over, or None when
+    # there's no need to (with message_framing old data can't bleed into a message)
+    def _get_buffer_padding(self, max_length: int, clear_buffer: bool) -> bytes:
+        if not clear_buffer or self.message_framing != FRAMING_NONE:
+            return None
+        return self._get_padding(max_length)
+
+    # This counts a message written with a buffer for the stats and link health, written is what the buffer's write() returned
+    def _count_buffer_write(self, write_buffer: PacketBuffer, message, written: int):
+        if self._stats != None:
+            if written <= 0:
+                self._stats.write_shortfalls += 1
+            else:
+                self._stats.count(self._buffer_uuids.get(write_buffer), BluetoothStats.MESSAGES_WRITTEN, len(message))
+        if self._reconnect != None:
+            link = self._buffer_links.get(write_buffer)
+            if link != None:
+                link.write_failures = link.write_failures + 1 if written <= 0 else 0
+
+    # This gets the packet written by clear_buffer, it's only made once for every max_length
+    def _get_padding(self, max_length: int) -> bytes:
+        padding = self._padding.get(max_length)
+        if padding == None:
+            padding = bytes((" " * (max_length - 1)) + "\n", 'utf-8')
+            self._padding[max_length] = padding
+        return padding
+
+    # This takes the header off of a framed value read directly from a characteristic
+    def _unframe_message(self, source, value: bytes) -> bytes:
+        header_length = self._get_frame_header_length()
+        if value == None or len(value) < header_length:
+            return b""
+        return self._check_frame_sequence(source, value[0], value[header_length:header_length + value[header_length - 1]])
+
+    # This drops a message whose sequence number we've already read from source, which means nothing new has been written
+    def _check_frame_sequence(self, source, sequence: int, message: bytes) -> bytes:
+        if self.message_framing == FRAMING_SEQUENCE:
+            if self._read_sequences.get(source) == sequence:
+                return b""
+            self._read_sequences[source] = sequence
+        return bytes(message)
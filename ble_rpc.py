@@ -0,0 +1,347 @@
+#
+# Libraries
+#
+
+from ble_management import BluetoothManager, FRAMING_NONE, PROPERTY_NOTIFY, PROPERTY_WRITE, PROPERTY_WRITE_NO_RESPONSE, RoleError
+
+#
+# Variables
+#
+
+## Every request starts with a 2 byte header (request id, method) and every response with a 2 byte header (request id, status)
+HEADER_LENGTH = 2
+
+## These are the status byte of a response. RPC_TIMEOUT never goes over the air, it's what a call gets when no response
+## arrived in time
+RPC_OK = 0
+RPC_ERROR = 1
+RPC_UNKNOWN_METHOD = 2
+RPC_TIMEOUT = 3
+
+
+# This gets the most payload bytes that fit in a single request or response written with a buffer
+def _get_max_payload_length(manager: BluetoothManager, buffer) -> int:
+    length = manager._get_buffer_packet_length(buffer) - HEADER_LENGTH
+    if manager.message_framing != FRAMING_NONE:
+        length -= manager._get_frame_header_length()
+    return length
+
+
+# This answers calls from an RpcClient on a host. Requests arrive as writes to one of our characteristics and every
+# response is notified with another one (or the same one, if it allows both). Every request carries a request id that the
+# response is sent back with, so the host can have many calls going at once and they can be answered in any order.
+#
+# A method is a number from 0 to 255 with a handler that's given the request's payload and returns the response's payload
+# (bytes, str or None for an empty one). If a handler raises, the host gets RPC_ERROR with the error's message as the payload.
+# Requests and responses have to fit in a single packet, and the characteristics shouldn't have a codec (see set_codec())
+#
+# manager -> BluetoothManager: The manager the characteristics belong to, it has to be in peripheral mode
+# request_characteristic -> Characteristic: Our own characteristic the host writes requests to, it has to allow writing
+# response_characteristic -> Characteristic: Our own characteristic to notify responses with, it has to allow notify
+# (optional) buffer_size -> int = 16: How many requests (packets) can wait between calls to update()
+# (optional) capacity -> int = 16: How many responses can wait to be sent when the radio can't keep up, requests that
+# arrive while it's full are thrown away without being handled (they're counted in requests_dropped and the host's call times out)
+class RpcServer:
+    def __init__(self, manager: BluetoothManager, request_characteristic, response_characteristic, buffer_size: int = 16, capacity: int = 16):
+        if not response_characteristic.properties & PROPERTY_NOTIFY:
+            raise RoleError("ERROR: Cannot send responses with a characteristic that does not allow for notify!")
+
+        self._manager = manager
+        self.request_characteristic = request_characteristic
+        self.response_characteristic = response_characteristic
+        self.capacity = capacity
+
+        ## The total amount of requests that were answered, that failed (including unknown methods), and that were thrown away
+        ## because too many responses were waiting to be sent
+        self.requests_handled = 0
+        self.requests_failed = 0
+        self.requests_dropped = 0
+
+        self._handlers = {}
+        self._pending = []
+        self._write_buffer = manager.create_packet_buffer(response_characteristic)
+        manager.subscribe(request_characteristic, self._on_request, buffer_size=buffer_size)
+
+    # This sets the handler that answers a method
+    #
+    # method -> int: The number of the method (0 - 255)
+    # handler -> function(payload: bytes) -> bytes, str or None: The function that answers it, None stops answering it
+    def register(self, method: int, handler):
+        if method < 0 or method > 255:
+            raise ValueError("ERROR: A method must be between 0 and 255!")
+        if handler == None:
+            self._handlers.pop(method, None)
+        else:
+            self._handlers[method] = handler
+
+    # This answers every request that has arrived since the last call and sends the responses that were waiting for room,
+    # call it once every frame. It also hands any other subscription its values (see BluetoothManager.update_subscriptions()).
+    # It returns how many requests were answered
+    def update(self) -> int:
+        handled = self.requests_handled
+        self.flush()
+        self._manager.update_subscriptions()
+        self.flush()
+        return self.requests_handled - handled
+
+    # This sends as many of the waiting responses as the radio has room for, it returns how many are still waiting
+    def flush(self) -> int:
+        manager = self._manager
+        if not manager.get_bluetooth_connection_state():
+            return len(self._pending)
+
+        while len(self._pending) > 0:
+            if manager.write_to_characteristic_with_buffer(self._write_buffer, self._pending[0], None, False) <= 0:
+                break
+            self._pending.pop(0)
+        return len(self._pending)
+
+    # This throws away the responses waiting to be sent
+    def clear(self):
+        self._pending = []
+
+    def deinit(self):
+        self._manager.unsubscribe(self.request_characteristic)
+        self._manager.deinit_buffer(self._write_buffer)
+
+    def _on_request(self, characteristic, value: bytes):
+        if len(value) < HEADER_LENGTH:
+            return
+        if len(self._pending) >= self.capacity:
+            self.requests_dropped += 1
+            return
+
+        request_id = value[0]
+        handler = self._handlers.get(value[1])
+        if handler == None:
+            self.requests_failed += 1
+            self._respond(request_id, RPC_UNKNOWN_METHOD, b"")
+            return
+
+        try:
+            payload = handler(bytes(value[HEADER_LENGTH:]))
+        except Exception as error:
+            self.requests_failed += 1
+            self._respond(request_id, RPC_ERROR, str(error))
+            return
+
+        self.requests_handled += 1
+        self._respond(request_id, RPC_OK, payload)
+
+    def _respond(self, request_id: int, status: int, payload):
+        if payload == None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = bytes(payload, 'utf-8')
+
+        max_payload_length = _get_max_payload_length(self._manager, self._write_buffer)
+        if len(payload) > max_payload_length:
+            if status != RPC_OK:
+                payload = payload[:max_payload_length]
+            else:
+                status = RPC_ERROR
+                payload = b"response too long"[:max_payload_length]
+
+        self._pending.append(bytes((request_id, status)) + payload)
+        self.flush()
+
+
+# This calls methods on a peripheral's RpcServer. Calls are written back to back without waiting for the responses
+# before them, so as many as max_in_flight can be on their way at once and how many calls go through every second is set by
+# the link instead of by how long a single call takes to come back. Responses are matched to their call by request id
+# no matter what order they arrive in, and a call that isn't answered within its timeout is given RPC_TIMEOUT.
+#
+# A request id is a single byte so ids are used again. An id is never given to a new call while a call with it is waiting,
+# and the id of a call that timed out (or was cleared) isn't used again for timeout seconds, so a response that arrives
+# late is counted in late_responses instead of being taken for the response of a newer call.
+#
+# manager -> BluetoothManager: The manager the characteristics belong to, it has to be in host mode and connected
+# request_characteristic -> Characteristic: The peripheral's characteristic requests are written to (see find_characteristic())
+# response_characteristic -> Characteristic: The peripheral's characteristic responses are notified with
+# (optional) max_in_flight -> int = 16: The most calls that can be waiting for a response at once (1 - 256)
+# (optional) timeout -> float = 1.0: How long in seconds a call waits for its response when it isn't given a timeout of its own
+# (optional) buffer_size -> int = 4: How many packets the buffer requests are written with holds
+class RpcClient:
+    def __init__(self, manager: BluetoothManager, request_characteristic, response_characteristic, max_in_flight: int = 16, timeout: float = 1.0, buffer_size: int = 4):
+        if max_in_flight < 1 or max_in_flight > 256:
+            raise ValueError("ERROR: max_in_flight must be between 1 and 256!")
+        if not request_characteristic.properties & (PROPERTY_WRITE | PROPERTY_WRITE_NO_RESPONSE):
+            raise RoleError("ERROR: Cannot send requests with a characteristic that does not allow for writing!")
+
+        self._manager = manager
+        self.request_characteristic = request_characteristic
+        self.response_characteristic = response_characteristic
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+
+        ## The total amount of calls that were sent, that got a response, that timed out, and the responses that arrived
+        ## after their call had already timed out
+        self.calls_sent = 0
+        self.responses_received = 0
+        self.timeouts = 0
+        self.late_responses = 0
+
+        # request id -> [deadline, callback], and request id -> when a call that timed out with it stops waiting for a late response
+        self._in_flight = {}
+        self._held = {}
+        self._next_id = 0
+        self._next_deadline = None
+
+        self._write_buffer = manager.create_packet_buffer(request_characteristic, buffer_size=buffer_size)
+        # Every call that's waiting can be answered between two calls to update()
+        manager.subscribe(response_characteristic, self._on_response, buffer_size=max_in_flight)
+
+    # How many calls are waiting for a response
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    # This gets the most bytes a request's payload can hold over the current connection
+    @property
+    def max_payload_length(self) -> int:
+        return _get_max_payload_length(self._manager, self._write_buffer)
+
+    # This sends a call without waiting for its response, it returns the request id or None if it couldn't be sent
+    # because max_in_flight calls are already waiting, every request id is still in use, or the radio has no room for it yet
+    # (try again after update())
+    #
+    # method -> int: The number of the method to call (0 - 255)
+    # (optional) payload -> bytes or str = b"": What to hand the method, at most max_payload_length bytes
+    # (optional) callback -> function(status: int, payload: bytes) = None: The function to call with the response's status
+    # (RPC_OK, RPC_ERROR, RPC_UNKNOWN_METHOD or RPC_TIMEOUT) and payload, it's called by update()
+    # (optional) timeout -> float = None: How long to wait in seconds for the response, None uses the client's timeout
+    def call(self, method: int, payload = b"", callback = None, timeout: float = None) -> int:
+        if len(self._in_flight) >= self.max_in_flight:
+            return None
+        if isinstance(payload, str):
+            payload = bytes(payload, 'utf-8')
+        if len(payload) > self.max_payload_length:
+            raise ValueError("ERROR: Payload is " + str(len(payload)) + " bytes but only " + str(self.max_payload_length) + " fit in a request!")
+
+        now = self._manager._backend.monotonic()
+        request_id = self._get_free_id(now)
+        if request_id == None:
+            return None
+        if self._manager.write_to_characteristic_with_buffer(self._write_buffer, bytes((request_id, method)) + payload, None, False) <= 0:
+            return None
+
+        deadline = now + (self.timeout if timeout == None else timeout)
+        self._in_flight[request_id] = [deadline, callback]
+        if self._next_deadline == None or deadline < self._next_deadline:
+            self._next_deadline = deadline
+        self._next_id = (request_id + 1) & 0xFF
+        self.calls_sent += 1
+        return request_id
+
+    # This hands every response that has arrived to its call's callback and times out the calls that waited too long,
+    # call it once every frame. It also hands any other subscription its values (see BluetoothManager.update_subscriptions()).
+    # It returns how many calls finished
+    def update(self) -> int:
+        finished = self.responses_received + self.timeouts
+        if self._manager.get_bluetooth_connection_state():
+            self._manager.update_subscriptions()
+        self._expire(self._manager._backend.monotonic())
+        return self.responses_received + self.timeouts - finished
+
+    # This sends a call and waits for its response, it returns the response's payload.
+    # It raises an Exception if the call fails or no response arrives within timeout
+    # The arguments are the same as call()
+    def call_and_wait(self, method: int, payload = b"", timeout: float = None) -> bytes:
+        backend = self._manager._backend
+        result = []
+        callback = lambda status, response: result.append((status, response))
+
+        request_id = self.call(method, payload, callback, timeout)
+        while request_id == None:
+            if self.update() == 0:
+                backend.sleep(self._manager.poll_interval)
+            request_id = self.call(method, payload, callback, timeout)
+
+        while len(result) == 0:
+            if self.update() == 0 and len(result) == 0:
+                backend.sleep(self._manager.poll_interval)
+        return self._get_result(method, result[0])
+
+    # This is call_and_wait() for asyncio, other tasks keep running while it waits so many calls can be waited on at once
+    async def call_async(self, method: int, payload = b"", timeout: float = None) -> bytes:
+        backend = self._manager._backend
+        result = []
+        callback = lambda status, response: result.append((status, response))
+
+        request_id = self.call(method, payload, callback, timeout)
+        while request_id == None:
+            self.update()
+            await backend.sleep_async(self._manager.poll_interval)
+            request_id = self.call(method, payload, callback, timeout)
+
+        while len(result) == 0:
+            self.update()
+            if len(result) == 0:
+                await backend.sleep_async(self._manager.poll_interval)
+        return self._get_result(method, result[0])
+
+    # This gives up on every call that's waiting, their callbacks are never called
+    def clear(self):
+        now = self._manager._backend.monotonic()
+        for request_id in self._in_flight:
+            self._held[request_id] = now + self.timeout
+        self._in_flight = {}
+        self._next_deadline = None
+
+    def deinit(self):
+        self._manager.unsubscribe(self.response_characteristic)
+        self._manager.deinit_buffer(self._write_buffer)
+
+    def _on_response(self, characteristic, value: bytes):
+        if len(value) < HEADER_LENGTH:
+            return
+        call = self._in_flight.pop(value[0], None)
+        if call == None:
+            # Once the late response is here the id can be used again
+            self._held.pop(value[0], None)
+            self.late_responses += 1
+            return
+
+        self.responses_received += 1
+        if call[1] != None:
+            call[1](value[1], bytes(value[HEADER_LENGTH:]))
+
+    # This times out every call whose deadline has passed, the deadlines are only looked through once the soonest one passes
+    def _expire(self, now: float):
+        if self._next_deadline == None or now < self._next_deadline:
+            return
+
+        self._next_deadline = None
+        for request_id, call in list(self._in_flight.items()):
+            if now >= call[0]:
+                del self._in_flight[request_id]
+                self._held[request_id] = now + self.timeout
+                self.timeouts += 1
+                if call[1] != None:
+                    call[1](RPC_TIMEOUT, b"")
+            elif self._next_deadline == None or call[0] < self._next_deadline:
+                self._next_deadline = call[0]
+
+    # This gets the first request id from _next_id on that no call is waiting with and that isn't held, None if there isn't one
+    def _get_free_id(self, now: float) -> int:
+        request_id = self._next_id
+        for _ in range(256):
+            if request_id not in self._in_flight:
+                held = self._held.get(request_id)
+                if held == None:
+                    return request_id
+                if now >= held:
+                    del self._held[request_id]
+                    return request_id
+            request_id = (request_id + 1) & 0xFF
+        return None
+
+    def _get_result(self, method: int, result: tuple) -> bytes:
+        status, payload = result
+        if status == RPC_OK:
+            return payload
+        if status == RPC_TIMEOUT:
+            raise Exception("ERROR: Call to method " + str(method) + " timed out!")
+        if status == RPC_UNKNOWN_METHOD:
+            raise Exception("ERROR: Method " + str(method) + " does not exist on the peripheral!")
+        raise Exception("ERROR: Call to method " + str(method) + " failed! " + payload.decode())
@@ -0,0 +1,206 @@
+#
+# Libraries
+#
+
+import array
+from ble_management import BluetoothManager, FRAMING_NONE, PROPERTY_NOTIFY, RoleError
+from ble_codec import DeltaCodec, DELTA_HEADER_LENGTH, DELTA_MAX_VALUE_LENGTH
+
+#
+# Variables
+#
+
+## These are the sensors of the Circuit Playground that can be sampled by name, how many values each one gives and what
+## its values are multiplied by before they're turned into whole numbers (EX a temperature of 21.37 is sent as 2137)
+SENSOR_CHANNELS = {"acceleration": 3, "light": 1, "temperature": 1, "sound_level": 1}
+SENSOR_SCALES = {"acceleration": 100, "light": 1, "temperature": 100, "sound_level": 1}
+
+
+# This samples sensors at a steady rate into a ring buffer that's allocated up front and notifies them in batches with one
+# of our own characteristics, so a host that subscribes to it gets a stream of samples.
+#
+# Samples are taken on a fixed schedule (every 1 / rate seconds from the first one) no matter how long sending takes.
+# Sending never waits on the radio, when the radio can't keep up the samples wait in the ring buffer and once it's full
+# the oldest ones are thrown away, so a slow link never makes the samples late. Samples that couldn't be taken on time
+# because update() wasn't called for a while are skipped instead of being taken late.
+#
+# If the characteristic doesn't have a codec a DeltaCodec with a channel for every value of a sample is set on it, the
+# host needs to set the same codec on its characteristic (EX `ble_manager.set_codec(characteristic, DeltaCodec(3))`).
+# Every notification is a list of batch_size samples with the values of every sensor one after the other. Samples that
+# changed a lot take more bytes, so when a whole batch doesn't fit in a notification the samples that do are sent and
+# the rest go in the next one (this needs a codec with get_encoded_length(), like a DeltaCodec).
+#
+# manager -> BluetoothManager: The manager the characteristic belongs to
+# characteristic -> Characteristic: Our own characteristic to notify the samples with, it has to allow notify
+# (optional) sensors -> tuple = ("acceleration",): The sensors to sample, a name from SENSOR_CHANNELS or a function that
+# returns a number or a tuple of numbers (those are sent as they are so they should already be whole numbers)
+# (optional) rate -> float = 50: How many samples are taken every second
+# (optional) batch_size -> int = 4: How many samples go in a single notification
+# (optional) capacity -> int = 64: How many samples the ring buffer holds
+# (optional) max_length -> int = 20: The max length of a notification, a single encoded sample has to fit in it
+# (optional) keyframe_interval -> int = 16: The keyframe_interval of the DeltaCodec that's set if the characteristic doesn't have a codec
+# (optional) board = None: Where the named sensors are read from, if None then adafruit_circuitplayground's cp is used
+class SensorSampler:
+    def __init__(self, manager: BluetoothManager, characteristic, sensors: tuple = ("acceleration",), rate: float = 50, batch_size: int = 4, capacity: int = 64, max_length: int = 20, keyframe_interval: int = 16, board = None):
+        if not characteristic.properties & PROPERTY_NOTIFY:
+            raise RoleError("ERROR: Cannot stream samples with a characteristic that does not allow for notify!")
+        if batch_size > capacity:
+            raise ValueError("ERROR: batch_size cannot be bigger than capacity!")
+
+        self._manager = manager
+        self.characteristic = characteristic
+        self.period = 1 / rate
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self.max_length = max_length
+
+        # Every sensor is read with a function that gives back a number or a tuple, and how much to scale it by
+        self._readers = []
+        self.channels = 0
+        for sensor in sensors:
+            if isinstance(sensor, str):
+                if sensor not in SENSOR_CHANNELS:
+                    raise ValueError("ERROR: Unknown sensor " + sensor + "!")
+                if board == None:
+                    from adafruit_circuitplayground import cp
+                    board = cp
+                self._readers.append((self._make_reader(board, sensor), SENSOR_SCALES[sensor], SENSOR_CHANNELS[sensor]))
+                self.channels += SENSOR_CHANNELS[sensor]
+            else:
+                value = sensor()
+                channels = len(value) if isinstance(value, tuple) else 1
+                self._readers.append((sensor, 1, channels))
+                self.channels += channels
+
+        codec = manager.get_codec(characteristic)
+        if codec == None:
+            codec = DeltaCodec(self.channels, keyframe_interval)
+        # A sample has to fit even when every one of its values changed as much as it can
+        if isinstance(codec, DeltaCodec) and DELTA_HEADER_LENGTH + self.channels * DELTA_MAX_VALUE_LENGTH > max_length:
+            raise ValueError("ERROR: A sample of " + str(self.channels) + " values can take up to " + str(DELTA_HEADER_LENGTH + self.channels * DELTA_MAX_VALUE_LENGTH) + " bytes which cannot fit in a " + str(max_length) + " byte notification!")
+
+        ## The total amount of samples that were taken, sent, thrown away because the ring buffer was full, and skipped because they couldn't be taken on time
+        self.samples_taken = 0
+        self.samples_sent = 0
+        self.samples_dropped = 0
+        self.samples_missed = 0
+
+        ## The latest a sample has been taken after it was scheduled in seconds
+        self.max_jitter = 0.0
+
+        # The ring buffer holds capacity samples of channels values each, the oldest one starts at _head
+        self._samples = array.array("l", [0] * (capacity * self.channels))
+        self._batch = [0] * (batch_size * self.channels)
+        self._head = 0
+        self._count = 0
+        self._next_sample = None
+
+        manager.set_codec(characteristic, codec)
+        self._write_buffer = manager.create_packet_buffer(characteristic, buffer_size=4, max_packet_size=max_length)
+
+    # How many samples are waiting in the ring buffer to be sent
+    @property
+    def pending(self) -> int:
+        return self._count
+
+    # This takes a sample if one is due, it returns True if one was taken
+    def sample(self) -> bool:
+        now = self._manager._backend.monotonic()
+        if self._next_sample == None:
+            self._next_sample = now
+        if now < self._next_sample:
+            return False
+
+        # If we're more than a whole period late those samples are skipped so the schedule doesn't drift
+        missed = int((now - self._next_sample) / self.period)
+        self.samples_missed += missed
+        self.max_jitter = max(self.max_jitter, now - self._next_sample - missed * self.period)
+        self._next_sample += (missed + 1) * self.period
+
+        if self._count == self.capacity:
+            self._head = (self._head + 1) % self.capacity
+            self._count -= 1
+            self.samples_dropped += 1
+
+        index = ((self._head + self._count) % self.capacity) * self.channels
+        for reader, scale, channels in self._readers:
+            value = reader()
+            if channels == 1:
+                self._samples[index] = int(value * scale)
+                index += 1
+            else:
+                for channel in range(channels):
+                    self._samples[index] = int(value[channel] * scale)
+                    index += 1
+        self._count += 1
+        self.samples_taken += 1
+        return True
+
+    # This notifies every full batch of samples it can without waiting on the radio, it returns how many batches were sent
+    def send(self) -> int:
+        manager = self._manager
+        if not manager.get_bluetooth_connection_state():
+            return 0
+
+        sent = 0
+        while self._count >= self.batch_size:
+            batch = self._batch
+            for sample in range(self.batch_size):
+                index = ((self._head + sample) % self.capacity) * self.channels
+                for channel in range(self.channels):
+                    batch[sample * self.channels + channel] = self._samples[index + channel]
+
+            length = self._get_batch_length(batch)
+            if manager.write_to_characteristic_with_buffer(self._write_buffer, batch if length == len(batch) else batch[:length], self.max_length, False) <= 0:
+                # The codec already counted this batch as sent, so a DeltaCodec has to start over from a keyframe
+                codec = manager.get_codec(self.characteristic)
+                if hasattr(codec, "reset"):
+                    codec.reset()
+                break
+
+            samples = length // self.channels
+            self._head = (self._head + samples) % self.capacity
+            self._count -= samples
+            self.samples_sent += samples
+            sent += 1
+        return sent
+
+    # This takes a sample if one is due and sends every full batch, call it at least once every period.
+    # It returns how many batches were sent
+    def update(self) -> int:
+        self.sample()
+        return self.send()
+
+    # This samples and sends forever, start it as its own task with asyncio.create_task(sampler.run()).
+    # It sleeps until the next sample is due so other tasks run in between
+    async def run(self):
+        backend = self._manager._backend
+        while True:
+            self.update()
+            await backend.sleep_async(max(0, self._next_sample - backend.monotonic()))
+
+    # This throws away every sample waiting to be sent
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def deinit(self):
+        self._manager.deinit_buffer(self._write_buffer)
+
+    # This gets how many values from the start of batch fit in a single notification, always at least a whole sample
+    def _get_batch_length(self, batch: list) -> int:
+        manager = self._manager
+        length = len(batch)
+        codec = manager.get_codec(self.characteristic)
+        if not hasattr(codec, "get_encoded_length"):
+            return length
+
+        max_length = self.max_length
+        if manager.message_framing != FRAMING_NONE:
+            max_length -= manager._get_frame_header_length()
+        while length > self.channels and codec.get_encoded_length(batch, length) > max_length:
+            length -= self.channels
+        return length
+
+    def _make_reader(self, board, sensor: str):
+        return lambda: getattr(board, sensor)
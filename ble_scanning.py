@@ -0,0 +1,187 @@
+#
+# Libraries
+#
+
+from ble_management import BluetoothManager
+
+#
+# Variables
+#
+
+## These are the phases of an AdaptiveScanner. SCAN_FAST listens all the time so devices are found as soon as possible,
+## SCAN_BACKGROUND only listens for a small part of every interval and doesn't send scan requests so the radio is mostly off
+SCAN_FAST = 0
+SCAN_BACKGROUND = 1
+
+
+# This scans in short slices and moves between a fast phase and a background phase depending on how often new devices
+# (or the device we're looking for) show up. It starts out fast, and once nothing new has shown up for fast_hold seconds
+# it drops to the background phase. As soon as something new shows up in the background phase it goes back to fast.
+# That way the first device is found quickly and the radio is barely on while nothing around us is changing.
+#
+# A device is new when it hasn't been heard by this scanner before. Devices that had to be forgotten to make room are still
+# recognised for a while (see capacity), so a room with more devices than capacity doesn't keep the scanner fast.
+# Since the background phase scans passively, devices that only send their name in a scan response are heard without
+# a name there, so match them by service (see match_service())
+#
+# manager -> BluetoothManager: The manager to scan with, it has to be in host mode
+# (optional) until -> function(advertisement) -> bool = None: The check for the device we're looking for (see match_name()
+# and match_service()), finding it counts as a hit even when it isn't new. If None only new devices count
+# (optional) fast -> tuple = (0.1, 0.1, True): The (interval, window, active) of the fast phase
+# (optional) background -> tuple = (1.28, 0.064, False): The (interval, window, active) of the background phase
+# (optional) fast_hold -> float = 10.0: How long in seconds to stay fast after the last hit
+# (optional) slice_time -> float = 1.0: How long in seconds every call to update() scans for
+# (optional) capacity -> int = 32: How many devices are remembered to tell new ones apart, the one heard from longest ago is forgotten first.
+# The addresses of at least the last 4 * capacity forgotten devices (at most 8 * capacity) are kept too so they aren't new when they're heard again
+# (optional) smoothing -> float = 0.25: How much a single slice moves hit_rate (0 - 1), lower is smoother
+# (optional) minimum_rssi -> int = -80: The weakest signal that's listened to
+# (optional) extended -> bool = False: When true devices that use extended advertising are heard too
+class AdaptiveScanner:
+    def __init__(self, manager: BluetoothManager, until = None, fast: tuple = (0.1, 0.1, True), background: tuple = (1.28, 0.064, False), fast_hold: float = 10.0, slice_time: float = 1.0, capacity: int = 32, smoothing: float = 0.25, minimum_rssi: int = -80, extended: bool = False):
+        for interval, window, active in (fast, background):
+            if window > interval:
+                raise ValueError("ERROR: A scan window cannot be longer than its interval!")
+
+        self._manager = manager
+        self.until = until
+        self.fast = fast
+        self.background = background
+        self.fast_hold = fast_hold
+        self.slice_time = slice_time
+        self.capacity = capacity
+        self.smoothing = smoothing
+        self.minimum_rssi = minimum_rssi
+        self.extended = extended
+
+        ## How many new devices and targets show up every second, smoothed over the slices
+        self.hit_rate = 0.0
+
+        ## The total time in seconds spent scanning in each phase, and how much of it the radio was actually listening
+        self.fast_time = 0.0
+        self.background_time = 0.0
+        self.radio_on_time = 0.0
+
+        ## The total amount of new devices that were heard
+        self.devices_found = 0
+
+        # address -> the time it was last heard
+        self._known = {}
+        # The addresses that were forgotten to make room in _known, kept in two generations so the oldest half can be dropped at once
+        self._forgotten = set()
+        self._forgotten_before = set()
+        self.reset()
+
+    # This goes back to the fast phase and starts timing discovery again, the devices that have been heard are kept
+    def reset(self):
+        now = self._manager._backend.monotonic()
+
+        ## phase is SCAN_FAST or SCAN_BACKGROUND
+        self.phase = SCAN_FAST
+
+        ## How long in seconds it took from reset() (or making the scanner) to the first hit, None until there is one
+        self.time_to_discovery = None
+
+        ## The advertisement of the device we're looking for the last time it was heard, None until it's found
+        self.target = None
+
+        self._started = now
+        self._target_heard = False
+        self._fast_until = now + self.fast_hold
+
+    # This scans for a single slice in the current phase and then picks the phase for the next one. Every slice runs for
+    # the whole slice_time, even once the device we're looking for is heard, so the time spent in each phase and hit_rate
+    # are measured over whole slices. It returns the new devices and the target if it showed up during the slice
+    def update(self) -> list:
+        manager = self._manager
+        interval, window, active = self.fast if self.phase == SCAN_FAST else self.background
+
+        hits = []
+        target_was_heard = self._target_heard
+        self._target_heard = False
+        started = manager._backend.monotonic()
+        for advertisement in manager.scan(None, extended=self.extended, timeout=self.slice_time, interval=interval, window=window, minimum_rssi=self.minimum_rssi, filter_no_name=False, active=active, unique=False):
+            # The target is only a hit when it shows up, hearing it every slice (or many times in one) isn't a reason to stay fast
+            is_target = self.until != None and self.until(advertisement)
+            shows_up = is_target and not target_was_heard and not self._target_heard
+            if is_target:
+                self.target = advertisement
+                self._target_heard = True
+            if self._remember(advertisement.address, manager._backend.monotonic()) or shows_up:
+                hits.append(advertisement)
+
+        now = manager._backend.monotonic()
+        elapsed = now - started
+        self.radio_on_time += elapsed * window / interval
+        if self.phase == SCAN_FAST:
+            self.fast_time += elapsed
+        else:
+            self.background_time += elapsed
+        if elapsed > 0:
+            self.hit_rate += self.smoothing * (len(hits) / elapsed - self.hit_rate)
+
+        if len(hits) > 0:
+            if self.time_to_discovery == None:
+                self.time_to_discovery = now - self._started
+            self.phase = SCAN_FAST
+            self._fast_until = now + self.fast_hold
+        elif now >= self._fast_until:
+            self.phase = SCAN_BACKGROUND
+        return hits
+
+    # This scans adaptively until the device we're looking for is heard and returns its advertisement,
+    # or None if timeout runs out first (only slices that have started before it runs out are scanned)
+    # (optional) timeout -> float = None: How long to look for in seconds, if None it looks until the device is found
+    def find(self, timeout: float = None) -> "Advertisement":
+        if self.until == None:
+            raise ValueError("ERROR: Cannot find a device without an until check!")
+
+        deadline = None if timeout == None else self._manager._backend.monotonic() + timeout
+        while deadline == None or self._manager._backend.monotonic() < deadline:
+            self.update()
+            if self._target_heard:
+                return self.target
+        return None
+
+    # This returns how the scanner has been doing as a dictionary
+    def report(self) -> dict:
+        scan_time = self.fast_time + self.background_time
+        return {
+            "phase": "fast" if self.phase == SCAN_FAST else "background",
+            "time_to_discovery": self.time_to_discovery,
+            "hit_rate": self.hit_rate,
+            "devices_found": self.devices_found,
+            "fast_time": self.fast_time,
+            "background_time": self.background_time,
+            "radio_on_time": self.radio_on_time,
+            "duty_cycle": self.radio_on_time / scan_time if scan_time > 0 else 0.0,
+        }
+
+    # This remembers that a device was heard, it returns True if it's new
+    def _remember(self, address, now: float) -> bool:
+        if address in self._known:
+            self._known[address] = now
+            return False
+
+        # A device that was forgotten to make room has been heard before, so it goes back in without counting as new
+        is_new = address not in self._forgotten and address not in self._forgotten_before
+        self._forgotten.discard(address)
+        self._forgotten_before.discard(address)
+
+        if len(self._known) >= self.capacity:
+            oldest = None
+            for other, heard in self._known.items():
+                if oldest == None or heard < self._known[oldest]:
+                    oldest = other
+            del self._known[oldest]
+            self._forget(oldest)
+        self._known[address] = now
+        if is_new:
+            self.devices_found += 1
+        return is_new
+
+    # This keeps the address of a device that was forgotten to make room, once there are too many the oldest generation is dropped
+    def _forget(self, address):
+        if len(self._forgotten) >= 4 * self.capacity:
+            self._forgotten_before = self._forgotten
+            self._forgotten = set()
+        self._forgotten.add(address)
@@ -0,0 +1,766 @@
+#
+# Libraries
+#
+
+import copy
+import heapq
+import math
+import random
+
+
+#
+# _bleio Stand-ins
+#
+
+# These mirror the exceptions, constants and GATT objects of adafruit_ble and the _bleio core module so that code written
+# for the board behaves the same way when it's run against the simulator on a regular computer
+
+class BluetoothError(Exception):
+    pass
+
+
+class RoleError(BluetoothError):
+    pass
+
+
+class Attribute:
+    NO_ACCESS = 0
+    OPEN = 1
+    ENCRYPT_NO_MITM = 2
+    ENCRYPT_WITH_MITM = 3
+    LESC_ENCRYPT_WITH_MITM = 4
+    SIGNED_NO_MITM = 5
+    SIGNED_WITH_MITM = 6
+
+
+class UUID:
+    ## Only 16 bit uuids are simulated
+    size = 16
+
+    def __init__(self, value: int):
+        self._value = value
+        self.uuid16 = value & 0xFFFF
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, UUID) and other._value == self._value
+
+    def __hash__(self) -> int:
+        return hash(self._value)
+
+    def __repr__(self) -> str:
+        return "UUID(" + hex(self._value) + ")"
+
+
+class Address:
+    PUBLIC = 0
+    RANDOM_STATIC = 1
+
+    def __init__(self, address_bytes: bytes, address_type: int = RANDOM_STATIC):
+        self.address_bytes = bytes(address_bytes)
+        self.type = address_type
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Address) and other.address_bytes == self.address_bytes
+
+    def __hash__(self) -> int:
+        return hash(self.address_bytes)
+
+    def __repr__(self) -> str:
+        return "<Address " + ":".join(["%02x" % b for b in reversed(self.address_bytes)]) + ">"
+
+
+class Service:
+    def __init__(self, uuid: UUID, secondary: bool = False, remote: bool = False):
+        self.uuid = uuid
+        self.secondary = secondary
+        self.remote = remote
+        self.characteristics = ()
+        self.connection = None
+        self._radio = None
+
+
+class Characteristic:
+    ## The property bits follow the layout documented in the README (Write No Response is the most significant bit)
+    ## so that the numbers made by BluetoothManager.convert_properties_to_num mean the same thing here
+    BROADCAST = 1
+    INDICATE = 2
+    NOTIFY = 4
+    READ = 8
+    WRITE = 16
+    WRITE_NO_RESPONSE = 32
+
+    def __init__(self, service: Service, uuid: UUID, properties: int, max_length: int, fixed_length: bool, user_description: str, local = None, connection = None):
+        self.service = service
+        self.uuid = uuid
+        self.properties = properties
+        self.max_length = max_length
+        self.fixed_length = fixed_length
+        self.user_description = user_description
+        self.descriptors = ()
+
+        # Local characteristics hold the actual value, remote ones are a view of a local one through a connection
+        self._local = self if local == None else local
+        self._connection = connection
+        self._value = bytearray()
+        self._server_listeners = []
+        self._client_listeners = []
+        self._subscribers = {}
+
+    @staticmethod
+    def add_to_service(service: Service, uuid: UUID, *, properties: int = 0, read_perm: int = Attribute.OPEN, write_perm: int = Attribute.OPEN, max_length: int = 20, fixed_length: bool = False, initial_value: bytes = None, user_description: str = None):
+        characteristic = Characteristic(service, uuid, properties, max_length, fixed_length, user_description)
+        if initial_value != None:
+            characteristic._value = bytearray(initial_value)
+        service.characteristics += (characteristic,)
+        return characteristic
+
+    @property
+    def value(self) -> bytes:
+        if self._connection == None:
+            return bytes(self._value)
+
+        self._check_connected()
+        if not self.properties & Characteristic.READ:
+            raise BluetoothError("Read not permitted")
+
+        # A read is a request and a response so it costs a full round trip over the link
+        air = self._connection._air
+        arrival, response = self._connection._round_trip()
+        air.advance(arrival)
+        value = bytes(self._local._value)
+        air.advance(response)
+        return value
+
+    @value.setter
+    def value(self, value: bytes):
+        data = bytes(value)
+        if len(data) > self.max_length:
+            raise ValueError("Value length > max_length")
+
+        if self._connection == None:
+            self._value = bytearray(data)
+            self._local._notify_clients(data)
+            return
+
+        self._check_connected()
+        air = self._connection._air
+        if self.properties & Characteristic.WRITE:
+            # Writing with a response blocks until the peripheral acknowledges the write
+            arrival, response = self._connection._round_trip()
+            air.schedule(arrival, lambda: self._local._written(data))
+            air.advance(response)
+        elif self.properties & Characteristic.WRITE_NO_RESPONSE:
+            air.schedule(self._connection._transmit(), lambda: self._local._written(data))
+        else:
+            raise BluetoothError("Write not permitted")
+
+    def set_cccd(self, *, notify: bool = False, indicate: bool = False):
+        if self._connection == None:
+            raise BluetoothError("Cannot set CCCD on local characteristic")
+
+        self._check_connected()
+        arrival, response = self._connection._round_trip()
+        self._local._subscribers[self._connection] = (notify, indicate)
+        self._connection._air.advance(response)
+
+    def _check_connected(self):
+        if not self._connection.connected:
+            raise ConnectionError("Connection has been disconnected and can no longer be used")
+
+    # This is called on a local characteristic when a host writes to it
+    def _written(self, data: bytes):
+        self._value = bytearray(data)
+        for listener in self._server_listeners:
+            listener._receive(data)
+
+    # This sends a new local value to every host that has subscribed to it
+    def _notify_clients(self, data: bytes, listener = None):
+        for connection, (notify, indicate) in list(self._subscribers.items()):
+            if connection.connected and (notify or indicate):
+                connection._air.schedule(connection._transmit(), lambda c=connection: self._deliver_to_client(c, data, listener))
+
+    def _deliver_to_client(self, connection, data: bytes, listener = None):
+        for client_listener in self._client_listeners:
+            if client_listener._characteristic._connection is connection:
+                client_listener._receive(data)
+        if listener != None:
+            listener._in_flight -= 1
+
+    # This registers a buffer so it receives writes (on a local characteristic) or notifications (on a remote one)
+    def _add_listener(self, listener):
+        if self._connection == None:
+            self._server_listeners.append(listener)
+        else:
+            self._local._client_listeners.append(listener)
+
+            # Buffers on a remote characteristic subscribe to it just like _bleio does
+            notify, indicate = self._local._subscribers.get(self._connection, (False, False))
+            self._local._subscribers[self._connection] = (bool(self.properties & Characteristic.NOTIFY) or notify, bool(self.properties & Characteristic.INDICATE) or indicate)
+
+    def _remove_listener(self, listener):
+        for listeners in (self._local._server_listeners, self._local._client_listeners):
+            if listener in listeners:
+                listeners.remove(listener)
+
+
+class CharacteristicBuffer:
+    def __init__(self, characteristic: Characteristic, *, timeout: float = 1, buffer_size: int = 64):
+        self._characteristic = characteristic
+        self._timeout = timeout
+        self._buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._air = _air_of(characteristic)
+        characteristic._add_listener(self)
+
+    def _receive(self, data: bytes):
+        # Anything that doesn't fit in the buffer is dropped just like on the board
+        space = self._buffer_size - len(self._buffer)
+        self._buffer += data[:space]
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._buffer)
+
+    def reset_input_buffer(self):
+        self._buffer = bytearray()
+
+    def read(self, nbytes: int = None) -> bytes:
+        wanted = self._buffer_size if nbytes == None else nbytes
+        self._wait(lambda: len(self._buffer) >= wanted)
+        if len(self._buffer) == 0:
+            return None
+        data = bytes(self._buffer[:wanted])
+        self._buffer = self._buffer[wanted:]
+        return data
+
+    def readinto(self, buf, nbytes: int = None) -> int:
+        wanted = len(buf) if nbytes == None else min(nbytes, len(buf))
+        self._wait(lambda: len(self._buffer) >= wanted)
+        count = min(wanted, len(self._buffer))
+        buf[:count] = self._buffer[:count]
+        self._buffer = self._buffer[count:]
+        return count
+
+    def readline(self) -> bytes:
+        self._wait(lambda: b"\n" in self._buffer)
+        end = self._buffer.find(b"\n") + 1
+        if end == 0:
+            end = len(self._buffer)
+        line = bytes(self._buffer[:end])
+        self._buffer = self._buffer[end:]
+        return line
+
+    def deinit(self):
+        self._characteristic._remove_listener(self)
+
+    def _wait(self, predicate):
+        if self._air != None:
+            self._air.wait_until(predicate, self._air.now + self._timeout)
+
+
+## The most bytes a single PacketBuffer can take on the simulated board, a board's heap is much smaller than a computer's
+## so a buffer that's sized too big fails here with a MemoryError the same way it would on the board
+MAX_PACKET_BUFFER_MEMORY = 32768
+
+
+class PacketBuffer:
+    def __init__(self, characteristic: Characteristic, *, buffer_size: int, max_packet_size: int = None):
+        self._characteristic = characteristic
+        self._buffer_size = buffer_size
+        self._max_packet_size = characteristic.max_length if max_packet_size == None else max_packet_size
+
+        # Every packet in the ring buffer is stored with its 2 byte length
+        memory = buffer_size * (self._max_packet_size + 2)
+        if memory > MAX_PACKET_BUFFER_MEMORY:
+            raise MemoryError("memory allocation failed, allocating " + str(memory) + " bytes")
+        self._incoming = []
+
+        ## Like _bleio, buffer_size counts packets. This is how many can be waiting to go out over the air before write() starts returning 0
+        self._outgoing_capacity = max(2, buffer_size)
+        self._in_flight = 0
+        self._air = _air_of(characteristic)
+        characteristic._add_listener(self)
+
+    def _receive(self, data: bytes):
+        if len(self._incoming) >= self._buffer_size:
+            return
+        self._incoming.append(bytes(data))
+
+    @property
+    def incoming_packet_length(self) -> int:
+        return self._max_packet_size
+
+    # Like _bleio this is None while there's no connection to write over
+    @property
+    def outgoing_packet_length(self) -> int:
+        connection = self._connection()
+        if connection == None or not connection.connected:
+            return None
+        return min(self._max_packet_size, connection.max_packet_length)
+
+    @property
+    def packet_size(self) -> int:
+        return self.outgoing_packet_length
+
+    def readinto(self, buf) -> int:
+        if len(self._incoming) == 0:
+            return 0
+        packet = self._incoming.pop(0)
+        count = min(len(packet), len(buf))
+        buf[:count] = packet[:count]
+        return count
+
+    def write(self, data, *, header = None) -> int:
+        packet = bytes(data) if header == None else bytes(header) + bytes(data)
+        length = self.outgoing_packet_length
+        if length != None and len(packet) > length:
+            raise ValueError("Total length of data > max_packet_size")
+
+        characteristic = self._characteristic
+        if characteristic._connection == None:
+            # Writing to a local characteristic notifies every host that has subscribed to it
+            subscribed = [c for c, (n, i) in characteristic._subscribers.items() if c.connected and (n or i)]
+            if len(subscribed) == 0 or self._in_flight >= self._outgoing_capacity:
+                return 0
+            self._in_flight += len(subscribed)
+            characteristic._notify_clients(packet, self)
+            return len(packet)
+
+        characteristic._check_connected()
+        if self._in_flight >= self._outgoing_capacity:
+            return 0
+        self._in_flight += 1
+        self._air.schedule(characteristic._connection._transmit(), lambda: self._delivered(packet))
+        return len(packet)
+
+    def deinit(self):
+        self._characteristic._remove_listener(self)
+
+    def _delivered(self, packet: bytes):
+        self._in_flight -= 1
+        self._characteristic._local._written(packet)
+
+    def _connection(self):
+        if self._characteristic._connection != None:
+            return self._characteristic._connection
+        for connection in self._characteristic._subscribers:
+            if connection.connected:
+                return connection
+        return None
+
+
+class Connection:
+    def __init__(self, air, central, peripheral):
+        self._air = air
+        self._central = central
+        self._peripheral = peripheral
+        self._interval = air.connection_interval
+        self._mtu = air.mtu
+        self._event_index = 0
+        self._event_used = 0
+        self._last_arrival = 0.0
+        self._peripheral_latency = 0
+        self._supervision_timeout = 4000
+        self.connected = True
+
+    # BLEConnection and _bleio.Connection are the same object in the simulator
+    @property
+    def _bleio_connection(self):
+        return self
+
+    @property
+    def connection_interval(self) -> float:
+        return self._interval * 1000
+
+    @connection_interval.setter
+    def connection_interval(self, milliseconds: float):
+        self._interval = milliseconds / 1000
+        self._event_index = 0
+        self._event_used = 0
+
+    @property
+    def max_packet_length(self) -> int:
+        return self._mtu - 3
+
+    def discover_remote_services(self, service_uuids_whitelist = None) -> tuple:
+        whitelist = None if service_uuids_whitelist == None else list(service_uuids_whitelist)
+        services = []
+        for service in self._peripheral._services:
+            if whitelist != None and service.uuid not in whitelist:
+                continue
+
+            # Each service and characteristic costs a request and a response to discover
+            remote = Service(service.uuid, secondary=service.secondary, remote=True)
+            remote.connection = self
+            for local in service.characteristics:
+                remote.characteristics += (Characteristic(remote, local.uuid, local.properties, local.max_length, local.fixed_length, local.user_description, local, self),)
+                self._air.advance(self._round_trip()[1])
+            self._air.advance(self._round_trip()[1])
+            services.append(remote)
+        return tuple(services)
+
+    def disconnect(self):
+        if self.connected:
+            self.connected = False
+            for radio in (self._central, self._peripheral):
+                if self in radio._connections:
+                    radio._connections.remove(self)
+
+    # This works out when a packet sent now arrives, only packets_per_event packets fit in a single connection event
+    # and every lost packet is retransmitted in the next event just like the link layer does
+    def _transmit(self) -> float:
+        air = self._air
+        index = max(math.ceil(air.now / self._interval - 1e-9), self._event_index)
+        if index == self._event_index and self._event_used >= air.packets_per_event:
+            index += 1
+        if index != self._event_index:
+            self._event_index = index
+            self._event_used = 0
+        self._event_used += 1
+
+        arrival = index * self._interval + air._retransmit_delay(self._interval) + air.latency
+        arrival = max(arrival, self._last_arrival)
+        self._last_arrival = arrival
+        return arrival
+
+    # This returns when a request sent now arrives and when its response comes back (in the next connection event)
+    def _round_trip(self) -> tuple:
+        arrival = self._transmit()
+        return arrival, arrival + self._interval + self._air._retransmit_delay(self._interval) + self._air.latency
+
+
+BLEConnection = Connection
+
+
+class Advertisement:
+    def __init__(self):
+        self.address = None
+        self.complete_name = None
+        self.short_name = None
+        self.tx_power = None
+        self.appearance = None
+        self.rssi = None
+        self.scan_response = False
+        self.connectable = True
+        self.services = ()
+
+        ## data_dict holds the raw fields of the advertisement by their type (like 0xFF for manufacturer data) like adafruit_ble
+        self.data_dict = {}
+
+    # This is the advertisement as it would go over the air (only the flags and data_dict are modelled)
+    def __bytes__(self) -> bytes:
+        data = bytearray(b"\x02\x01\x06")
+        for field_type, value in self.data_dict.items():
+            data += bytes((len(value) + 1, field_type)) + bytes(value)
+        return bytes(data)
+
+    def __repr__(self) -> str:
+        return "Advertisement(complete_name=" + repr(self.complete_name) + ", services=" + repr(self.services) + ")"
+
+
+class ProvideServicesAdvertisement(Advertisement):
+    def __init__(self, *services):
+        super().__init__()
+        self.services = tuple([service.uuid for service in services])
+
+
+#
+# Simulated Radio
+#
+
+# This mirrors adafruit_ble.BLERadio for a single simulated board
+class SimulatedRadio:
+    def __init__(self, air, name: str, rssi: int, tx_power: int = 0):
+        self._air = air
+        self.name = name
+        self.tx_power = tx_power
+
+        ## rssi is how strong this board appears to other boards when they scan for it
+        self.rssi = rssi
+        self.address = air._next_address()
+        self._services = []
+        self._connections = []
+        self._advertising = False
+        self._advertisement = None
+        self._scan_response = None
+        self._advertising_interval = 0.1
+        self._next_advertisement = 0.0
+        self._scanning = False
+        air.radios.append(self)
+
+    @property
+    def address_bytes(self) -> bytes:
+        return self.address.address_bytes
+
+    @property
+    def advertising(self) -> bool:
+        return self._advertising
+
+    @property
+    def connected(self) -> bool:
+        return len(self._connections) > 0
+
+    @property
+    def connections(self) -> tuple:
+        return tuple(self._connections)
+
+    def start_advertising(self, advertisement: Advertisement, scan_response: Advertisement = None, interval: float = 0.1, timeout: int = None):
+        if self._advertising:
+            raise BluetoothError("Already advertising")
+
+        # adafruit_ble puts our name into the scan response when one isn't given (and the advertisement isn't extended)
+        if scan_response == None and len(bytes(advertisement)) <= 31:
+            scan_response = Advertisement()
+            scan_response.complete_name = self.name
+
+        self._advertisement = advertisement
+        self._scan_response = scan_response
+        self._advertising_interval = interval
+        self._next_advertisement = self._air.now + self._air.random.uniform(0, interval)
+        self._advertising = True
+
+    def stop_advertising(self):
+        self._advertising = False
+
+    def start_scan(self, *advertisement_types, buffer_size: int = 512, extended: bool = False, timeout: float = None, interval: float = 0.1, window: float = 0.1, minimum_rssi: int = -80, active: bool = True):
+        air = self._air
+        deadline = None if timeout == None else air.now + timeout
+
+        # We only hear the advertisements that land inside of a scan window
+        duty_cycle = min(1.0, window / interval)
+        self._scanning = True
+
+        while self._scanning:
+            advertiser = None
+            for radio in air.radios:
+                if radio is not self and radio._advertising and (advertiser == None or radio._next_advertisement < advertiser._next_advertisement):
+                    advertiser = radio
+
+            if advertiser == None or (deadline != None and advertiser._next_advertisement > deadline):
+                if deadline != None:
+                    air.advance(deadline)
+                break
+
+            air.advance(advertiser._next_advertisement)
+            advertiser._next_advertisement = max(air.now, advertiser._next_advertisement) + advertiser._advertising_interval + air.random.uniform(0, 0.01)
+            if air.random.random() >= duty_cycle:
+                continue
+
+            rssi = advertiser.rssi + round(air.random.uniform(-air.rssi_jitter, air.rssi_jitter))
+            if rssi < minimum_rssi:
+                continue
+
+            # Advertisements longer than 31 bytes are only heard by scans that look for extended advertisements
+            if not extended and len(bytes(advertiser._advertisement)) > 31:
+                continue
+
+            yield advertiser._scan_entry(advertiser._advertisement, rssi, False)
+            if active and advertiser._scan_response != None:
+                yield advertiser._scan_entry(advertiser._scan_response, rssi, True)
+
+        self._scanning = False
+
+    def stop_scan(self):
+        self._scanning = False
+
+    def connect(self, peer, *, timeout: float = 4.0) -> Connection:
+        air = self._air
+        address = getattr(peer, "address", peer)
+        target = None
+        for radio in air.radios:
+            if radio.address == address:
+                target = radio
+
+        if target == None or not target._advertising or not target._advertisement.connectable:
+            air.advance(air.now + timeout)
+            raise BluetoothError("Failed to connect: timeout")
+
+        # The connection request goes out right after the peripheral's next advertisement
+        air.advance(max(air.now, target._next_advertisement) + air.connection_interval)
+        target._advertising = False
+        connection = Connection(air, self, target)
+        self._connections.append(connection)
+        target._connections.append(connection)
+        return connection
+
+    def _scan_entry(self, advertisement: Advertisement, rssi: int, scan_response: bool) -> Advertisement:
+        entry = copy.copy(advertisement)
+        entry.data_dict = dict(advertisement.data_dict)
+        entry.address = self.address
+        entry.rssi = rssi
+        entry.scan_response = scan_response
+        return entry
+
+
+#
+# Simulated Air
+#
+
+# The air is the world every simulated board lives in. It holds a virtual clock that only moves forward when something has
+# to wait, so a benchmark measures the modelled link instead of how fast the computer running it is
+#
+# (optional) connection_interval -> float = 0.0075: The time in seconds between two connection events
+# (optional) latency -> float = 0.0: Extra one way delay in seconds added to every packet
+# (optional) mtu -> int = 23: The ATT MTU of new connections, a packet can hold mtu - 3 bytes
+# (optional) packet_loss -> float = 0.0: The chance (0 - 1) that a packet has to be retransmitted in the next connection event
+# (optional) packets_per_event -> int = 4: How many packets fit in a single connection event
+# (optional) rssi_jitter -> int = 3: How much the rssi of a scanned advertisement wanders from the advertiser's rssi
+# (optional) seed -> int = 0: The seed for packet loss, advertising jitter and rssi so runs are repeatable
+class SimulatedAir:
+    def __init__(self, connection_interval: float = 0.0075, latency: float = 0.0, mtu: int = 23, packet_loss: float = 0.0, packets_per_event: int = 4, rssi_jitter: int = 3, seed: int = 0):
+        self.connection_interval = connection_interval
+        self.latency = latency
+        self.mtu = mtu
+        self.packet_loss = packet_loss
+        self.packets_per_event = packets_per_event
+        self.rssi_jitter = rssi_jitter
+        self.random = random.Random(seed)
+        self.radios = []
+        self.now = 0.0
+        self._pending = []
+        self._sequence = 0
+        self._sleeping = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.advance(self.now + seconds)
+
+    # This sleeps without blocking other asyncio tasks. The clock is only moved by whichever task wakes up first,
+    # so tasks that sleep at the same time overlap instead of adding their sleeps together
+    async def sleep_async(self, seconds: float):
+        # asyncio is only imported here since importing it takes longer than the rest of the simulator put together
+        import asyncio
+        deadline = self.now + seconds
+        self._sleeping.append(deadline)
+        try:
+            await asyncio.sleep(0)
+            while self.now < deadline:
+                if deadline <= min(self._sleeping):
+                    self.advance(deadline)
+                else:
+                    await asyncio.sleep(0)
+        finally:
+            self._sleeping.remove(deadline)
+
+    # Run callback once the virtual clock reaches when
+    def schedule(self, when: float, callback):
+        self._sequence += 1
+        heapq.heappush(self._pending, (max(when, self.now), self._sequence, callback))
+
+    # Move the virtual clock forward to until, delivering everything that lands on the way
+    def advance(self, until: float):
+        while len(self._pending) > 0 and self._pending[0][0] <= until:
+            when, sequence, callback = heapq.heappop(self._pending)
+            self.now = max(self.now, when)
+            callback()
+        self.now = max(self.now, until)
+
+    # Move the virtual clock forward to the next delivery, returns False if nothing is on its way
+    def step(self) -> bool:
+        if len(self._pending) == 0:
+            return False
+        self.advance(self._pending[0][0])
+        return True
+
+    # Move the virtual clock forward until predicate is true or deadline passes, returns the last result of predicate
+    def wait_until(self, predicate, deadline: float) -> bool:
+        while not predicate():
+            if len(self._pending) == 0 or self._pending[0][0] > deadline:
+                self.advance(deadline)
+                return predicate()
+            self.advance(self._pending[0][0])
+        return True
+
+    def _retransmit_delay(self, interval: float) -> float:
+        delay = 0.0
+        while self.packet_loss > 0 and self.random.random() < self.packet_loss:
+            delay += interval
+        return delay
+
+    def _next_address(self) -> Address:
+        return Address(bytes([len(self.radios) + 1, 0, 0, 0, 0xAD, 0xDE]))
+
+
+#
+# Simulated Backend
+#
+
+# This is a drop in replacement for ble_management.BleioBackend that runs entirely in python.
+# Give every simulated board its own backend and put them in the same SimulatedAir to have them talk to each other
+#
+# (optional) air -> SimulatedAir = None: The air to put the board into, if None then the board gets an air of its own
+# (optional) name -> str = "CIRCUITPY": The name of the board
+# (optional) rssi -> int = -50: How strong the board appears to other boards when they scan for it
+class SimulatedBackend:
+    ## These are the advertisement types we look for when scanning
+    scan_types = (ProvideServicesAdvertisement, Advertisement)
+
+    def __init__(self, air: SimulatedAir = None, name: str = "CIRCUITPY", rssi: int = -50):
+        self.air = SimulatedAir() if air == None else air
+        self.radio = SimulatedRadio(self.air, name, rssi)
+
+    def monotonic(self) -> float:
+        return self.air.monotonic()
+
+    def sleep(self, seconds: float):
+        self.air.sleep(seconds)
+
+    async def sleep_async(self, seconds: float):
+        await self.air.sleep_async(seconds)
+
+    def create_service(self, uuid: int) -> Service:
+        service = Service(UUID(uuid))
+        service._radio = self.radio
+        self.radio._services.append(service)
+        return service
+
+    def add_characteristic(self, service: Service, uuid: int, properties: int, read_perm: int, write_perm: int, max_length: int, fixed_length: bool, user_description: str) -> Characteristic:
+        return Characteristic.add_to_service(service, UUID(uuid), properties=properties, read_perm=read_perm, write_perm=write_perm, max_length=max_length, fixed_length=fixed_length, user_description=user_description)
+
+    def create_characteristic_buffer(self, characteristic: Characteristic, timeout: float, buffer_size: int) -> CharacteristicBuffer:
+        return CharacteristicBuffer(characteristic, timeout=timeout, buffer_size=buffer_size)
+
+    def create_packet_buffer(self, characteristic: Characteristic, buffer_size: int, max_packet_size: int) -> PacketBuffer:
+        return PacketBuffer(characteristic, buffer_size=buffer_size, max_packet_size=max_packet_size)
+
+    def create_services_advertisement(self, service: Service) -> Advertisement:
+        return ProvideServicesAdvertisement(service)
+
+    def create_advertisement(self) -> Advertisement:
+        return Advertisement()
+
+    def reset_local_services(self):
+        self.radio._services = []
+
+    def discover_remote_services(self, connection: Connection, uuids: list) -> tuple:
+        if len(uuids) > 0:
+            return connection.discover_remote_services(iter([UUID(uuid) for uuid in uuids]))
+        return connection.discover_remote_services()
+
+    def get_connection_parameters(self, connection: Connection) -> tuple:
+        return (connection.connection_interval, connection._peripheral_latency, connection._supervision_timeout, connection.max_packet_length)
+
+    # The peripheral latency and supervision timeout are only remembered, the simulated link doesn't skip events or time out
+    def set_connection_parameters(self, connection: Connection, interval: float, latency: int, timeout: float):
+        if interval != None:
+            connection.connection_interval = interval
+        if latency != None:
+            connection._peripheral_latency = latency
+        if timeout != None:
+            connection._supervision_timeout = timeout
+
+    # The rssi of a connection is how strong the other board is, with the same jitter as scanning
+    def connection_rssi(self, connection: Connection) -> int:
+        other = connection._peripheral if connection._central is self.radio else connection._central
+        return other.rssi + round(self.air.random.uniform(-self.air.rssi_jitter, self.air.rssi_jitter))
+
+
+# This finds the air a characteristic lives in so buffers can wait on the virtual clock
+def _air_of(characteristic: Characteristic) -> SimulatedAir:
+    if characteristic._connection != None:
+        return characteristic._connection._air
+    if characteristic.service._radio != None:
+        return characteristic.service._radio._air
+    return None
@@ -0,0 +1,296 @@
+#
+# Libraries
+#
+
+from ble_management import BluetoothManager
+
+#
+# Variables
+#
+
+## These are the flags in the first byte of a fragment's header, the rest of that byte is the id of the message it belongs to
+FRAGMENT_START = 0x80
+FRAGMENT_END = 0x40
+FRAGMENT_ID_MASK = 0x3F
+
+## The first fragment of a message has a 4 byte header (flags and id, fragment length, message length low and high byte),
+## every fragment after it has a 2 byte header (flags and id, fragment length)
+FIRST_HEADER_LENGTH = 4
+HEADER_LENGTH = 2
+
+
+# This splits messages that are bigger than a single packet into fragments, writes them back to back without waiting
+# for responses, and puts them back together on the other side. Both sides must use a FragmentTransport.
+#
+# Sending goes through a PacketBuffer. Receiving can go through either a PacketBuffer or a CharacteristicBuffer. A CharacteristicBuffer
+# that's full cuts off the notifications that don't fit, so when a fragment read from one doesn't make sense the message it was part of
+# is thrown away and the bytes after it are searched for the next first fragment (see resyncs)
+class FragmentTransport:
+    #
+    # Variables
+    #
+
+    ## The total amount of messages that were thrown away because a fragment went missing or they were too big
+    messages_dropped = 0
+
+    ## The total amount of times a CharacteristicBuffer was out of step and had to be searched for the next first fragment
+    resyncs = 0
+
+    ## How long to wait in seconds between attempts when the write buffer is full
+    poll_interval = 0.001
+
+    # manager -> BluetoothManager: The manager that the buffers belong to
+    # (optional) write_buffer -> PacketBuffer = None: The buffer that fragments are written with, None if we only receive
+    # (optional) read_buffer -> PacketBuffer or CharacteristicBuffer = None: The buffer fragments are read from, None if we only send
+    # (optional) max_message_size -> int = 1024: The largest message that can be sent or received (65535 at most),
+    # this much memory is set aside up front to put received messages back together in
+    def __init__(self, manager: BluetoothManager, write_buffer = None, read_buffer = None, max_message_size: int = 1024):
+        if max_message_size > 0xFFFF:
+            raise ValueError("ERROR: max_message_size cannot be more than 65535 bytes!")
+
+        self._manager = manager
+        self._write_buffer = write_buffer
+        self._read_buffer = read_buffer
+        self.max_message_size = max_message_size
+
+        # Everything we need to receive is allocated here so receiving doesn't allocate anything
+        self._is_stream = hasattr(read_buffer, "in_waiting")
+        self._message = bytearray(max_message_size)
+        self._message_view = memoryview(self._message)
+        self._packet = bytearray(max(self._get_incoming_packet_length(), FIRST_HEADER_LENGTH + 0xFF))
+        self._packet_view = memoryview(self._packet)
+        self._receiving_id = None
+        self._expected_length = 0
+        self._received_length = 0
+
+        # While _searching a CharacteristicBuffer is out of step, the last _header_fill bytes of the first 4 in _packet are
+        # the bytes that might be the start of the next first fragment
+        self._searching = False
+        self._header_fill = 0
+
+        self._header = bytearray(FIRST_HEADER_LENGTH)
+        self._header_view = memoryview(self._header)
+        self._sending = None
+        self._send_offset = 0
+        self._send_id = 0
+
+    #
+    # Sending
+    #
+
+    # This returns true if a message is still being sent
+    def is_sending(self) -> bool:
+        return self._sending != None
+
+    # This queues a message to be sent by update(), it returns False if the previous message hasn't been fully sent yet
+    #
+    # message -> bytes, bytearray, memoryview or str: The message to send, it isn't copied so it must not change until it's sent
+    def send(self, message) -> bool:
+        if self._write_buffer == None:
+            raise ValueError("ERROR: Cannot send without a write buffer!")
+        if self._sending != None:
+            return False
+
+        if isinstance(message, str):
+            message = bytes(message, 'utf-8')
+        if len(message) > self.max_message_size:
+            raise ValueError("ERROR: Message is bigger than max_message_size!")
+
+        self._sending = memoryview(message)
+        self._send_offset = 0
+        return True
+
+    # This writes as many fragments of the current message as the write buffer will take without waiting,
+    # it returns True once the whole message has been written
+    def update(self) -> bool:
+        if not self._manager.get_bluetooth_connection_state():
+            raise ConnectionError("ERROR: Not connected! Cannot send fragments!")
+
+        while self._sending != None:
+            total = len(self._sending)
+            offset = self._send_offset
+            header_length = FIRST_HEADER_LENGTH if offset == 0 else HEADER_LENGTH
+            count = min(self._manager._get_buffer_packet_length(self._write_buffer) - header_length, total - offset, 0xFF)
+
+            flags = self._send_id & FRAGMENT_ID_MASK
+            if offset == 0:
+                flags |= FRAGMENT_START
+                self._header[2] = total & 0xFF
+                self._header[3] = total >> 8
+            if offset + count >= total:
+                flags |= FRAGMENT_END
+            self._header[0] = flags
+            self._header[1] = count
+
+            # The header is passed in separately so the fragment doesn't have to be copied into a new packet
+            if self._write_buffer.write(self._sending[offset:offset + count], header=self._header_view[:header_length]) <= 0:
+                return False
+
+            self._send_offset += count
+            if self._send_offset >= total:
+                self._sending = None
+                self._send_id += 1
+        return True
+
+    # This keeps writing fragments until the current message has been sent, returns False if timeout runs out first
+    # (optional) timeout -> float = None: How long to wait in seconds, None waits until the message is sent
+    def flush(self, timeout: float = None) -> bool:
+        backend = self._manager._backend
+        deadline = None if timeout == None else backend.monotonic() + timeout
+
+        while not self.update():
+            if deadline != None and backend.monotonic() >= deadline:
+                return False
+            backend.sleep(self.poll_interval)
+        return True
+
+    # This sends a whole message and waits until it's been written, returns False if timeout runs out first
+    def write(self, message, timeout: float = None) -> bool:
+        if not self.flush(timeout):
+            return False
+        self.send(message)
+        return self.flush(timeout)
+
+    #
+    # Receiving
+    #
+
+    # This reads every fragment that has arrived and returns a memoryview of the next complete message or None.
+    # The memoryview points into a buffer that is reused, so copy it if it's needed after the next call to receive()
+    def receive(self) -> memoryview:
+        if self._read_buffer == None:
+            raise ValueError("ERROR: Cannot receive without a read buffer!")
+
+        if self._is_stream:
+            return self._receive_stream()
+        return self._receive_packets()
+
+    def _receive_packets(self) -> memoryview:
+        while True:
+            count = self._read_buffer.readinto(self._packet)
+            if count < HEADER_LENGTH:
+                return None
+
+            flags = self._packet[0]
+            header_length = FIRST_HEADER_LENGTH if flags & FRAGMENT_START else HEADER_LENGTH
+            length = min(self._packet[1], count - header_length)
+            total = self._packet[2] | (self._packet[3] << 8) if flags & FRAGMENT_START else 0
+
+            if self._accept_fragment(flags, length, total):
+                self._message_view[self._received_length:self._received_length + length] = self._packet_view[header_length:header_length + length]
+                self._received_length += length
+                if flags & FRAGMENT_END:
+                    message = self._finish_message()
+                    if message != None:
+                        return message
+
+    def _receive_stream(self) -> memoryview:
+        read_buffer = self._read_buffer
+        packet = self._packet
+        while True:
+            if self._searching:
+                if not self._find_first_fragment():
+                    return None
+                header_length = FIRST_HEADER_LENGTH
+            elif read_buffer.in_waiting >= HEADER_LENGTH:
+                read_buffer.readinto(self._packet_view[:HEADER_LENGTH])
+                header_length = HEADER_LENGTH
+                if packet[0] & FRAGMENT_START and read_buffer.in_waiting >= FIRST_HEADER_LENGTH - HEADER_LENGTH:
+                    read_buffer.readinto(self._packet_view[HEADER_LENGTH:FIRST_HEADER_LENGTH])
+                    header_length = FIRST_HEADER_LENGTH
+            else:
+                return None
+
+            flags = packet[0]
+            length = packet[1]
+            total = packet[2] | (packet[3] << 8) if flags & FRAGMENT_START else 0
+            if not self._is_possible_fragment(flags, length, total, header_length):
+                self._lose_step(header_length)
+                continue
+
+            if self._accept_fragment(flags, length, total):
+                # The data goes straight from the buffer into the message
+                self._received_length += read_buffer.readinto(self._message_view[self._received_length:self._received_length + length])
+                if flags & FRAGMENT_END:
+                    message = self._finish_message()
+                    if message != None:
+                        return message
+            elif length > 0:
+                read_buffer.readinto(self._packet_view[:length])
+
+    # This checks if a header read from a CharacteristicBuffer can be a real one. Since a notification lands in the buffer as a whole,
+    # a fragment that isn't all there yet, is longer than its message or doesn't belong to the message we're putting together
+    # means part of a notification was cut off and we're reading data as if it were a header
+    def _is_possible_fragment(self, flags: int, length: int, total: int, header_length: int) -> bool:
+        if self._read_buffer.in_waiting < length:
+            return False
+        if flags & FRAGMENT_START:
+            return header_length == FIRST_HEADER_LENGTH and length <= total and (length == total or not flags & FRAGMENT_END)
+        if self._receiving_id == None:
+            return True
+        return flags & FRAGMENT_ID_MASK == self._receiving_id and self._received_length + length <= self._expected_length
+
+    # This throws away the message we're putting together and starts looking for the next first fragment one byte at a time,
+    # beginning with the byte after the start of the header that didn't make sense
+    def _lose_step(self, header_length: int):
+        if self._receiving_id != None:
+            self.messages_dropped += 1
+            self._receiving_id = None
+        self.resyncs += 1
+        self._packet[FIRST_HEADER_LENGTH - header_length + 1:FIRST_HEADER_LENGTH] = self._packet[1:header_length]
+        self._header_fill = header_length - 1
+        self._searching = True
+
+    # This reads a byte at a time until the last 4 bytes look like the header of a first fragment, it returns False if
+    # the buffer runs out first (the search carries on in the next call to receive())
+    def _find_first_fragment(self) -> bool:
+        packet = self._packet
+        read_buffer = self._read_buffer
+        while read_buffer.in_waiting > 0:
+            packet[0] = packet[1]
+            packet[1] = packet[2]
+            packet[2] = packet[3]
+            read_buffer.readinto(self._packet_view[3:FIRST_HEADER_LENGTH])
+            self._header_fill = min(self._header_fill + 1, FIRST_HEADER_LENGTH)
+
+            total = packet[2] | (packet[3] << 8)
+            if self._header_fill == FIRST_HEADER_LENGTH and packet[0] & FRAGMENT_START and total <= self.max_message_size and self._is_possible_fragment(packet[0], packet[1], total, FIRST_HEADER_LENGTH):
+                self._searching = False
+                return True
+        return False
+
+    # This checks that a fragment belongs to the message we're putting together and starts a new message if it's a first fragment
+    def _accept_fragment(self, flags: int, length: int, total: int) -> bool:
+        message_id = flags & FRAGMENT_ID_MASK
+        if flags & FRAGMENT_START:
+            if self._receiving_id != None:
+                # A new message started before the last one ended so a fragment of the last one went missing
+                self.messages_dropped += 1
+            if total > self.max_message_size:
+                self.messages_dropped += 1
+                self._receiving_id = None
+                return False
+            self._receiving_id = message_id
+            self._expected_length = total
+            self._received_length = 0
+        elif self._receiving_id != message_id:
+            return False
+
+        if self._received_length + length > self._expected_length:
+            self.messages_dropped += 1
+            self._receiving_id = None
+            return False
+        return True
+
+    def _finish_message(self) -> memoryview:
+        self._receiving_id = None
+        if self._received_length != self._expected_length:
+            self.messages_dropped += 1
+            return None
+        return self._message_view[:self._received_length]
+
+    def _get_incoming_packet_length(self) -> int:
+        length = getattr(self._read_buffer, "incoming_packet_length", None)
+        if length == None:
+            return 0
+        return length
@@ -0,0 +1,28 @@
+#
+# Libraries
+#
+
+import os
+import sys
+import pytest
+
+# The modules live in the root of the repo (the same way they're copied into the lib folder of a board)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ble_simulator import SimulatedAir
+
+# Every test gets its own simulated radio with a fixed seed so the results are the same on every run
+@pytest.fixture
+def air():
+    return SimulatedAir(seed=1)
+
+# This steps air (and calls every update in updates) until done() is True or limit seconds of virtual time have passed,
+# it returns what done() returned last
+def run_until(air, done, updates=(), limit: float = 30.0) -> bool:
+    end = air.now + limit
+    while not done() and air.now < end:
+        for update in updates:
+            update()
+        if not air.step():
+            air.sleep(0.01)
+    return done()
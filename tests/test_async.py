@@ -0,0 +1,78 @@
+#
+# Libraries
+#
+
+import asyncio
+import pytest
+from conftest import run_until
+from ble_async import AsyncBluetoothManager
+from ble_management import BluetoothManager, FRAMING_NONE, FRAMING_SEQUENCE
+from ble_simulator import SimulatedBackend
+from ble_benchmark import create_loopback
+
+# The async write waits for space in a full buffer instead of losing the message, and writes the same packets
+# (and counts the same stats) as the manager's own write
+@pytest.mark.parametrize("framing", [FRAMING_NONE, FRAMING_SEQUENCE])
+def test_write_waits_for_space(air, framing):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    host.enable_stats()
+    write_buffer = host.create_packet_buffer(h_characteristic, buffer_size=2)
+    read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=0, buffer_size=512)
+    ble_manager = AsyncBluetoothManager(host)
+    messages = [bytes(str(number) + "\n", 'utf-8') for number in range(12)]
+
+    async def write_all() -> list:
+        return [await ble_manager.write_to_characteristic_with_buffer(write_buffer, message, clear_buffer=False, timeout=1) for message in messages]
+    assert all(written > 0 for written in asyncio.run(write_all()))
+    assert host.stats()["characteristics"]["0x2BDE"]["messages_written"] == len(messages)
+    assert host.stats()["write_shortfalls"] == 0
+
+    length = sum(len(message) for message in messages) + len(messages) * (host._get_frame_header_length() if framing != FRAMING_NONE else 0)
+    run_until(air, lambda: read_buffer.in_waiting >= length)
+    if framing == FRAMING_NONE:
+        assert read_buffer.read(length) == b"".join(messages)
+    else:
+        assert [peripheral.read_from_characteristic_with_buffer(read_buffer) for _ in messages] == messages
+
+# A write that can't find space before its timeout returns 0 and is counted as a shortfall
+def test_write_timeout(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    host.enable_stats()
+    write_buffer = host.create_packet_buffer(h_characteristic, buffer_size=2)
+    ble_manager = AsyncBluetoothManager(host)
+    # Nothing takes packets off the air while the buffer is filled up
+    while write_buffer.write(b"fill") > 0:
+        pass
+
+    written = asyncio.run(ble_manager.write_to_characteristic_with_buffer(write_buffer, b"late", clear_buffer=False, timeout=0))
+    assert written == 0
+    assert host.stats()["write_shortfalls"] == 1
+
+# A device connected to a peripheral that is also a peripheral for another host gets the values of both,
+# the ones from its peripheral and the ones written to its own characteristic
+def test_run_subscriptions_hands_out_local_values(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    received = []
+    host.subscribe(h_characteristic, lambda characteristic, value: received.append(("peripheral", value)))
+
+    # The host also has a characteristic of its own that another host writes to
+    host.bluetooth_mode_peripheral = True
+    service = host.create_service("0x180F")
+    local_characteristic = host.add_characteristic_to_service(service, "0x2A19", properties=[True, True, True, False, False, False])
+    host.start_advertising(host._backend.create_services_advertisement(service))
+    host.subscribe(local_characteristic, lambda characteristic, value: received.append(("local", value)))
+
+    other = BluetoothManager(SimulatedBackend(air, name="Other"))
+    other.connect(other.start_scanning(timeout=1), "Host")
+    other_characteristic = other.find_characteristic("0x180F", "0x2A19")
+
+    async def run():
+        task = asyncio.create_task(AsyncBluetoothManager(host).run_subscriptions())
+        peripheral.write_to_characteristic(p_characteristic, b"from peripheral", clear_buffer=False)
+        other.write_to_characteristic(other_characteristic, b"from other", clear_buffer=False)
+        while len(received) < 2 and air.now < 5:
+            await asyncio.sleep(0)
+            air.step()
+        task.cancel()
+    asyncio.run(run())
+    assert sorted(received) == [("local", b"from other"), ("peripheral", b"from peripheral")]
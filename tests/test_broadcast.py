@@ -0,0 +1,82 @@
+#
+# Libraries
+#
+
+from ble_management import BluetoothManager
+from ble_broadcast import TelemetryBroadcaster, TelemetryCollector, TelemetryReading, MANUFACTURER_DATA
+from ble_simulator import SimulatedBackend
+
+# This makes a board that broadcasts and one that collects
+def create_devices(air, slots: int = 1, company_id: int = 0xFFFF) -> tuple:
+    board = BluetoothManager(SimulatedBackend(air, name="Board"))
+    board.bluetooth_mode_peripheral = True
+    listener = BluetoothManager(SimulatedBackend(air, name="Listener"))
+    return TelemetryBroadcaster(board, company_id=company_id, slots=slots), TelemetryCollector(listener)
+
+# This returns the (sequence, slot) of what the broadcaster has on the air
+def on_air(broadcaster) -> tuple:
+    data = broadcaster._advertisement.data_dict[MANUFACTURER_DATA]
+    return data[2], data[3]
+
+# Slots with a payload take turns every rotate_interval seconds and slots without one are skipped
+def test_slots_rotate(air):
+    broadcaster, collector = create_devices(air, slots=3)
+    broadcaster.set(b"a", slot=0)
+    broadcaster.set(b"c", slot=2)
+    broadcaster.start()
+    assert on_air(broadcaster) == (1, 2)
+
+    # Nothing changes until rotate_interval has passed
+    air.sleep(0.2)
+    assert not broadcaster.update()
+    air.sleep(0.3)
+    assert broadcaster.update()
+    assert on_air(broadcaster) == (1, 0)
+    air.sleep(0.5)
+    assert broadcaster.update()
+    assert on_air(broadcaster) == (1, 2)
+
+    # A new payload for the slot on the air goes out right away
+    air.sleep(0.1)
+    broadcaster.set(b"c2", slot=2)
+    assert broadcaster.update()
+    assert on_air(broadcaster) == (2, 2)
+
+# The same payload heard many times is handed over once, a new payload in the same slot is handed over again
+def test_collector_drops_duplicates(air):
+    broadcaster, collector = create_devices(air)
+    broadcaster.set(b"first")
+    broadcaster.start()
+    readings = collector.collect(timeout=1)
+    assert [reading.payload for reading in readings] == [b"first"]
+    assert collector.duplicates_dropped > 0
+
+    broadcaster.set(b"second")
+    air.sleep(0.1)
+    broadcaster.update()
+    readings = collector.collect(timeout=1)
+    assert [(reading.payload, reading.sequence) for reading in readings] == [(b"second", 2)]
+    assert collector.readings_received == 2
+
+# Payloads with another company id are ignored
+def test_collector_filters_company_id(air):
+    broadcaster, collector = create_devices(air, company_id=0x1234)
+    broadcaster.set(b"theirs")
+    broadcaster.start()
+    assert collector.collect(timeout=1) == []
+    assert collector.readings_received == 0 and collector.duplicates_dropped == 0
+
+    collector.company_id = 0x1234
+    assert len(collector.collect(timeout=1)) == 1
+
+# Only capacity boards and slots are remembered, the one heard from longest ago is forgotten and is new when it's heard again
+def test_collector_capacity(air):
+    broadcaster, collector = create_devices(air)
+    collector.capacity = 2
+    assert collector._is_new(TelemetryReading(b"a", 0, 1, b"", -50, 0.0))
+    assert collector._is_new(TelemetryReading(b"b", 0, 1, b"", -50, 1.0))
+    assert not collector._is_new(TelemetryReading(b"a", 0, 1, b"", -50, 2.0))
+    assert collector._is_new(TelemetryReading(b"c", 0, 1, b"", -50, 3.0))
+    assert len(collector._last_sequences) == 2
+    assert collector._is_new(TelemetryReading(b"b", 0, 1, b"", -50, 4.0))
+    assert not collector._is_new(TelemetryReading(b"c", 0, 1, b"", -50, 5.0))
@@ -0,0 +1,139 @@
+#
+# Libraries
+#
+
+import pytest
+from conftest import run_until
+from ble_codec import StructCodec, VarintCodec, DeltaCodec, DELTA_KEYFRAME, DELTA_CHANGE, DELTA_HEADER_LENGTH
+from ble_benchmark import create_loopback
+
+def test_struct_codec():
+    codec = StructCodec("<hhh")
+    assert codec.size == 6
+    assert codec.decode(codec.encode((1, -2, 300))) == (1, -2, 300)
+    with pytest.raises(ValueError):
+        codec.decode(bytes(5))
+
+    single = StructCodec("<f")
+    assert single.decode(single.encode(0.5)) == 0.5
+
+def test_varint_codec():
+    codec = VarintCodec()
+    values = [0, -1, 1, 63, -64, 64, 1000000, -1000000]
+    data = codec.encode(values)
+    assert codec.decode(data) == values
+    # Small numbers only take a single byte
+    assert len(codec.encode([0, -1, 1, 63, -64])) == 5
+    assert codec.decode(codec.encode(5)) == [5]
+
+    unsigned = VarintCodec(signed=False)
+    assert unsigned.encode(127) == b"\x7f"
+    assert unsigned.encode(128) == b"\x80\x01"
+    with pytest.raises(ValueError):
+        unsigned.encode(-1)
+    with pytest.raises(ValueError):
+        unsigned.decode(b"\x80")
+
+def test_delta_codec_round_trip():
+    encoder = DeltaCodec(channels=3, keyframe_interval=4)
+    decoder = DeltaCodec(channels=3, keyframe_interval=4)
+
+    for message in range(10):
+        samples = [20000 + message, -5 - message, message * 1000, 20001 + message, -6 - message, message * 1000 + 7]
+        data = encoder.encode(samples)
+        assert data[0] == (DELTA_KEYFRAME if message % 4 == 0 else DELTA_CHANGE)
+        assert decoder.decode(data) == samples
+
+    with pytest.raises(ValueError):
+        encoder.encode([1, 2])
+
+# get_encoded_length() measures a message without changing what the next one is compared to
+def test_delta_codec_encoded_length():
+    codec = DeltaCodec(channels=2, keyframe_interval=3)
+    for message in range(6):
+        samples = [message * 40000, -message, message * 40000 + 200, 5 - message]
+        length = codec.get_encoded_length(samples)
+        assert codec.get_encoded_length(samples, 2) < length
+        assert len(codec.encode(samples)) == length
+
+# A receiver that missed the keyframe can't decode anything until the next one arrives
+def test_delta_codec_waits_for_keyframe():
+    encoder = DeltaCodec(keyframe_interval=3)
+    decoder = DeltaCodec(keyframe_interval=3)
+
+    encoder.encode([10])
+    assert decoder.decode(encoder.encode([11])) == None
+    assert decoder.decode(encoder.encode([12])) == None
+    assert decoder.decode(encoder.encode([13])) == [13]
+    assert decoder.decode(encoder.encode([14])) == [14]
+
+    encoder.reset()
+    decoder.reset()
+    data = encoder.encode([15])
+    assert data[0] == DELTA_KEYFRAME
+    assert decoder.decode(data) == [15]
+
+# A message heard twice is only decoded once, and after a message goes missing nothing is decoded until the next keyframe
+def test_delta_codec_sequence():
+    encoder = DeltaCodec(keyframe_interval=4)
+    decoder = DeltaCodec(keyframe_interval=4)
+    messages = [encoder.encode([value]) for value in range(100, 110)]
+    assert [data[1] for data in messages] == list(range(10))
+
+    assert decoder.decode(messages[0]) == [100]
+    assert decoder.decode(messages[1]) == [101]
+    assert decoder.decode(messages[1]) == None
+    assert decoder.decode(messages[2]) == [102]
+
+    # messages[3] goes missing, messages[4] is the next keyframe
+    assert decoder.decode(messages[4]) == [104]
+    assert decoder.decode(messages[6]) == None
+    assert decoder.decode(messages[7]) == None
+    assert decoder.decode(messages[8]) == [108]
+    assert decoder.decode(messages[9]) == [109]
+    with pytest.raises(ValueError):
+        decoder.decode(bytes([DELTA_CHANGE]))
+
+# The sequence number wraps around after 255 without looking like a gap
+def test_delta_codec_sequence_wraps():
+    encoder = DeltaCodec(keyframe_interval=1000)
+    decoder = DeltaCodec(keyframe_interval=1000)
+    for value in range(300):
+        assert decoder.decode(encoder.encode([value])) == [value]
+    assert len(encoder.encode([300])) == DELTA_HEADER_LENGTH + 1
+
+# Values written to a characteristic with a codec reach a subscriber already decoded
+def test_codec_over_subscription(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    host.set_codec(h_characteristic, DeltaCodec())
+    peripheral.set_codec(p_characteristic, DeltaCodec())
+    received = []
+    host.subscribe(h_characteristic, lambda characteristic, value: received.append(value))
+
+    sent = []
+    for message in range(5):
+        samples = [20000 + message * 3 + offset for offset in range(4)]
+        sent.append(samples)
+        peripheral.write_to_characteristic(p_characteristic, samples, clear_buffer=False)
+        assert run_until(air, lambda: len(received) == len(sent), (host.update_subscriptions,))
+    assert received == sent
+
+# A value that's read directly can be read more than once, so reading one with a stateful codec is refused instead of
+# applying the same change again on every read
+def test_stateful_codec_refuses_direct_reads(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    host.set_codec(h_characteristic, DeltaCodec())
+    peripheral.set_codec(p_characteristic, DeltaCodec())
+    peripheral.write_to_characteristic(p_characteristic, [101], clear_buffer=False)
+    while air.step():
+        pass
+    with pytest.raises(ValueError):
+        host.read_from_characteristic(h_characteristic)
+
+    host.set_codec(h_characteristic, VarintCodec())
+    peripheral.set_codec(p_characteristic, VarintCodec())
+    peripheral.write_to_characteristic(p_characteristic, [101], clear_buffer=False)
+    while air.step():
+        pass
+    assert host.read_from_characteristic(h_characteristic) == [101]
+    assert host.read_from_characteristic(h_characteristic) == [101]
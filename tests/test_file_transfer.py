@@ -0,0 +1,128 @@
+#
+# Libraries
+#
+
+import io
+import random
+import pytest
+from conftest import run_until
+from ble_file_transfer import FileTransferServer, FileTransferClient, MESSAGE_DATA, STATUS_OK, STATUS_NOT_FOUND, STATUS_DENIED
+from ble_benchmark import create_loopback, SERVICE_UUID, CHARACTERISTIC_UUID
+
+DATA = bytes(random.Random(1).getrandbits(8) for _ in range(6000))
+
+# This sets up a FileTransferServer on the peripheral serving root and a FileTransferClient on the host
+def create_transfer(air, root, mtu_length: int = 20, server_settings: dict = {}, **settings) -> tuple:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, max_length=mtu_length)
+    server = FileTransferServer(peripheral, p_characteristic, p_characteristic, root=str(root), **server_settings)
+    client = FileTransferClient(host, SERVICE_UUID, CHARACTERISTIC_UUID, **settings)
+    return host, peripheral, p_characteristic, server, client
+
+# This runs a transfer until it ends (hook is called before every step, to break the link for example)
+def finish(air, server, client, hook = None) -> int:
+    updates = (server.update, client.update) if hook == None else (hook, server.update, client.update)
+    assert run_until(air, lambda: client.status != None, updates, limit=60)
+    return client.status
+
+# This drops the link from the host's side and connects to the peripheral again
+def reconnect(host, peripheral, p_characteristic, air):
+    host.ble.disconnect()
+    air.sleep(0.3)
+    peripheral.start_advertising(peripheral._backend.create_services_advertisement(p_characteristic.service))
+    host.connect({"Peripheral": host._last_peer[0]}, "Peripheral")
+
+def test_pull_and_push(air, tmp_path):
+    (tmp_path / "log.bin").write_bytes(DATA)
+    host, peripheral, p_characteristic, server, client = create_transfer(air, tmp_path)
+
+    destination = io.BytesIO()
+    client.start_pull("log.bin", destination)
+    assert finish(air, server, client) == STATUS_OK
+    assert destination.getvalue() == DATA
+    assert client.progress == 1.0
+
+    client.start_push(io.BytesIO(DATA[::-1]), "pushed.bin", resume=False)
+    assert finish(air, server, client) == STATUS_OK
+    assert (tmp_path / "pushed.bin").read_bytes() == DATA[::-1]
+    assert server.transfers_completed == 2
+
+def test_pull_resumes_after_disconnect(air, tmp_path):
+    (tmp_path / "log.bin").write_bytes(DATA)
+    host, peripheral, p_characteristic, server, client = create_transfer(air, tmp_path)
+    dropped = []
+
+    def drop():
+        if len(dropped) == 0 and client.confirmed > len(DATA) // 3:
+            dropped.append(client.confirmed)
+            reconnect(host, peripheral, p_characteristic, air)
+
+    destination = io.BytesIO()
+    client.start_pull("log.bin", destination)
+    assert finish(air, server, client, drop) == STATUS_OK
+    assert len(dropped) == 1
+    assert destination.getvalue() == DATA
+    assert client.resumes == 1 and server.transfers_resumed == 1
+
+# A partly pulled file on disk is carried on from its end instead of being pulled again
+def test_pull_resumes_from_file(air, tmp_path):
+    (tmp_path / "log.bin").write_bytes(DATA)
+    partial = tmp_path / "partial.bin"
+    partial.write_bytes(DATA[:2500])
+    host, peripheral, p_characteristic, server, client = create_transfer(air, tmp_path)
+
+    client.start_pull("log.bin", str(partial))
+    assert finish(air, server, client) == STATUS_OK
+    assert partial.read_bytes() == DATA
+    assert client.chunks_received < len(DATA) // 14
+
+# Chunks that are corrupted on their way are caught by their crc and sent again
+def test_corrupted_chunks_are_resent(air, tmp_path):
+    (tmp_path / "log.bin").write_bytes(DATA)
+    host, peripheral, p_characteristic, server, client = create_transfer(air, tmp_path)
+    write = server._write
+    written = [0]
+
+    def corrupt(packet):
+        packet = bytearray(packet)
+        if packet[0] == MESSAGE_DATA:
+            written[0] += 1
+            if written[0] % 17 == 0:
+                packet[-1] ^= 0xFF
+        return write(packet)
+    server._write = corrupt
+
+    destination = io.BytesIO()
+    client.start_pull("log.bin", destination)
+    assert finish(air, server, client) == STATUS_OK
+    assert destination.getvalue() == DATA
+    assert client.crc_errors > 0
+    assert server.chunks_retransmitted >= client.crc_errors
+
+# A server with a small buffer that's only updated every few steps loses chunks of a push,
+# which the client sends again once they aren't acknowledged
+def test_push_into_small_buffer(air, tmp_path):
+    host, peripheral, p_characteristic, server, client = create_transfer(air, tmp_path, server_settings={"buffer_size": 4}, window=16)
+    steps = [0]
+
+    def slow_update():
+        steps[0] += 1
+        if steps[0] % 4 == 0:
+            server.update()
+
+    client.start_push(io.BytesIO(DATA), "big.bin")
+    assert run_until(air, lambda: client.status != None, (slow_update, client.update), limit=60)
+    assert client.status == STATUS_OK
+    assert (tmp_path / "big.bin").read_bytes() == DATA
+    assert client.chunks_retransmitted > 0
+
+def test_refused_transfers(air, tmp_path):
+    host, peripheral, p_characteristic, server, client = create_transfer(air, tmp_path, server_settings={"allow_push": False})
+
+    client.start_pull("missing.bin", io.BytesIO())
+    assert finish(air, server, client) == STATUS_NOT_FOUND
+    # Names can't reach outside of root
+    client.start_pull("../secret", io.BytesIO())
+    assert finish(air, server, client) == STATUS_DENIED
+    client.start_push(io.BytesIO(DATA), "pushed.bin")
+    assert finish(air, server, client) == STATUS_DENIED
+    assert not (tmp_path / "pushed.bin").exists()
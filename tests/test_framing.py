@@ -0,0 +1,164 @@
+#
+# Libraries
+#
+
+import pytest
+from conftest import run_until
+from ble_management import FRAMING_NONE, FRAMING_LENGTH, FRAMING_SEQUENCE
+from ble_benchmark import create_loopback
+
+MESSAGES = [b"", b"a", b"hello", bytes(range(18))]
+
+# Every framed message comes out of the CharacteristicBuffer the same as it went into the PacketBuffer, one at a time
+@pytest.mark.parametrize("framing", [FRAMING_LENGTH, FRAMING_SEQUENCE])
+def test_framed_messages_arrive_whole(air, framing):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    write_buffer = host.create_packet_buffer(h_characteristic, buffer_size=8)
+    read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=0, buffer_size=256)
+
+    for message in MESSAGES:
+        host.write_to_characteristic_with_buffer(write_buffer, message)
+    run_until(air, lambda: read_buffer.in_waiting >= sum(len(message) for message in MESSAGES) + len(MESSAGES) * host._get_frame_header_length())
+
+    received = [peripheral.read_from_characteristic_with_buffer(read_buffer) for _ in MESSAGES]
+    assert received == MESSAGES
+    assert read_buffer.in_waiting == 0
+
+# A message too long for a single framed packet is refused instead of being cut up
+@pytest.mark.parametrize("framing", [FRAMING_LENGTH, FRAMING_SEQUENCE])
+def test_framed_message_too_long(air, framing):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    write_buffer = host.create_packet_buffer(h_characteristic)
+
+    with pytest.raises(ValueError):
+        host.write_to_characteristic_with_buffer(write_buffer, bytes(20))
+
+# With FRAMING_SEQUENCE a value that's read again without being written again is an empty bytes
+def test_sequence_skips_repeated_value(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=FRAMING_SEQUENCE)
+
+    peripheral.write_to_characteristic(p_characteristic, "first")
+    assert host.read_from_characteristic(h_characteristic) == b"first"
+    assert host.read_from_characteristic(h_characteristic) == b""
+    peripheral.write_to_characteristic(p_characteristic, "second")
+    assert host.read_from_characteristic(h_characteristic) == b"second"
+
+# read_from_characteristic_with_buffer_into() reads a whole framed message into the same buffer every time
+@pytest.mark.parametrize("framing", [FRAMING_NONE, FRAMING_LENGTH, FRAMING_SEQUENCE])
+def test_read_into(air, framing):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    write_buffer = host.create_packet_buffer(h_characteristic)
+    read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=0, buffer_size=256)
+    buf = bytearray(20)
+
+    host.write_to_characteristic_with_buffer(write_buffer, b"12345", clear_buffer=False)
+    run_until(air, lambda: read_buffer.in_waiting >= 5 + host._get_frame_header_length())
+
+    count = peripheral.read_from_characteristic_with_buffer_into(read_buffer, buf)
+    assert bytes(buf[:count]) == b"12345"
+    assert peripheral.read_from_characteristic_with_buffer_into(read_buffer, buf) == 0
+
+# This sets up a host that writes raw bytes (without framing) to a peripheral that reads them as framed messages,
+# so a message can be made to arrive over more than one packet
+def create_raw_writer(air, framing: int) -> tuple:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    peripheral.message_framing = framing
+    write_buffer = host.create_packet_buffer(h_characteristic)
+    # The timeout is long so a read that waits for data would show up on the virtual clock
+    read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=1, buffer_size=256)
+    write = lambda data: host.write_to_characteristic_with_buffer(write_buffer, data, clear_buffer=False)
+    return write, peripheral, read_buffer
+
+# A message that has only partly arrived is left alone until the rest of it has, and nothing waits for it
+@pytest.mark.parametrize("framing", [FRAMING_LENGTH, FRAMING_SEQUENCE])
+def test_read_partial_message(air, framing):
+    write, peripheral, read_buffer = create_raw_writer(air, framing)
+    header = bytes((7, 3)) if framing == FRAMING_SEQUENCE else bytes((3,))
+
+    write(header + b"a")
+    run_until(air, lambda: read_buffer.in_waiting == len(header) + 1)
+    started = air.now
+    assert peripheral.read_from_characteristic_with_buffer(read_buffer) == b""
+    assert peripheral.read_from_characteristic_with_buffer(read_buffer) == b""
+    assert air.now == started
+
+    next_header = bytes((8, 1)) if framing == FRAMING_SEQUENCE else bytes((1,))
+    write(b"bc" + next_header + b"d")
+    run_until(air, lambda: read_buffer.in_waiting >= 2 + len(next_header) + 1)
+    assert peripheral.read_from_characteristic_with_buffer(read_buffer) == b"abc"
+    assert peripheral.read_from_characteristic_with_buffer(read_buffer) == b"d"
+
+@pytest.mark.parametrize("framing", [FRAMING_LENGTH, FRAMING_SEQUENCE])
+def test_read_into_partial_message(air, framing):
+    write, peripheral, read_buffer = create_raw_writer(air, framing)
+    header = bytes((7, 5)) if framing == FRAMING_SEQUENCE else bytes((5,))
+    buf = bytearray(20)
+
+    write(header + b"ab")
+    run_until(air, lambda: read_buffer.in_waiting == len(header) + 2)
+    started = air.now
+    assert peripheral.read_from_characteristic_with_buffer_into(read_buffer, buf) == 0
+    assert peripheral.read_from_characteristic_with_buffer_into(read_buffer, buf) == 0
+    assert air.now == started
+
+    write(b"cde" + header + b"fghij")
+    run_until(air, lambda: read_buffer.in_waiting >= 8)
+    assert peripheral.read_from_characteristic_with_buffer_into(read_buffer, buf) == 5
+    assert bytes(buf[:5]) == b"abcde"
+    if framing == FRAMING_SEQUENCE:
+        # The same sequence number again is a repeat
+        assert peripheral.read_from_characteristic_with_buffer_into(read_buffer, buf) == 0
+    else:
+        assert peripheral.read_from_characteristic_with_buffer_into(read_buffer, buf) == 5
+        assert bytes(buf[:5]) == b"fghij"
+    assert read_buffer.in_waiting == 0
+
+# A message that doesn't fit in buf is thrown away (even when buf is empty) and the next one is read as usual
+def test_read_into_message_too_big(air):
+    write, peripheral, read_buffer = create_raw_writer(air, FRAMING_LENGTH)
+
+    write(b"\x03abc\x02de")
+    run_until(air, lambda: read_buffer.in_waiting == 7)
+    with pytest.raises(ValueError):
+        peripheral.read_from_characteristic_with_buffer_into(read_buffer, bytearray(0))
+    buf = bytearray(2)
+    assert peripheral.read_from_characteristic_with_buffer_into(read_buffer, buf) == 2
+    assert buf == b"de"
+
+# Nothing is kept about buffers once they're gone, or about a peripheral once we've disconnected from it
+def test_buffers_are_forgotten(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=FRAMING_SEQUENCE)
+    write_buffer = host.create_packet_buffer(h_characteristic)
+    read_buffer = host.create_characteristic_buffer(h_characteristic, timeout=0)
+    host.write_to_characteristic_with_buffer(write_buffer, b"one")
+    host.write_to_characteristic(h_characteristic, b"two")
+    peripheral.write_to_characteristic(p_characteristic, b"three")
+    host.read_from_characteristic(h_characteristic)
+    assert write_buffer in host._write_sequences and h_characteristic in host._write_sequences
+    assert h_characteristic in host._read_sequences
+
+    host.deinit_buffer(write_buffer)
+    assert write_buffer not in host._write_sequences
+    assert write_buffer not in host._buffer_links
+
+    host.disconnect()
+    for kept in (host._write_sequences, host._read_sequences, host._read_frames, host._buffer_links):
+        assert h_characteristic not in kept and read_buffer not in kept
+
+# The uuid of a buffer is only kept while stats or codecs need it, and it's forgotten with the buffer
+def test_buffer_uuids_only_when_needed(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    plain_buffer = host.create_packet_buffer(h_characteristic)
+    assert plain_buffer not in host._buffer_uuids
+
+    host.enable_stats()
+    write_buffer = host.create_packet_buffer(h_characteristic)
+    read_buffer = host.create_characteristic_buffer(h_characteristic, timeout=0)
+    assert host._buffer_uuids[write_buffer] == h_characteristic.uuid
+    host.write_to_characteristic_with_buffer(write_buffer, b"counted")
+    assert host.stats()["characteristics"]["0x2BDE"]["messages_written"] == 1
+
+    host.deinit_buffer(write_buffer)
+    assert write_buffer not in host._buffer_uuids
+    host.disconnect()
+    assert read_buffer not in host._buffer_uuids
@@ -0,0 +1,90 @@
+#
+# Libraries
+#
+
+from ble_management import GattCache
+from ble_benchmark import create_loopback, SERVICE_UUID, CHARACTERISTIC_UUID
+
+OTHER_SERVICE_UUID = "0x180F"
+OTHER_CHARACTERISTIC_UUID = "0x2A19"
+NEW_CHARACTERISTIC_UUID = "0x2A1A"
+
+# This makes a loopback where the peripheral has a second service, returns the peripheral's advertisement and records the uuid filter of every discovery the host does
+def create_devices(air) -> tuple:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    other_service = peripheral.create_service(OTHER_SERVICE_UUID)
+    peripheral.add_characteristic_to_service(other_service, OTHER_CHARACTERISTIC_UUID, properties=[True, False, False, False, False, False])
+
+    discoveries = []
+    discover = host._backend.discover_remote_services
+    host._backend.discover_remote_services = lambda connection, uuids: discoveries.append(list(uuids)) or discover(connection, uuids)
+    advertisement = peripheral._backend.create_services_advertisement(p_characteristic.service)
+    return host, peripheral, other_service, advertisement, discoveries
+
+# This drops the link and connects to the peripheral again so nothing discovered over the last link is kept
+def reconnect(host, peripheral, advertisement):
+    host.disconnect()
+    peripheral.start_advertising(advertisement)
+    host.connect(host.start_scanning(timeout=1), "Peripheral")
+
+# The first find_characteristic() discovers everything, after reconnecting a peripheral the cache knows only the one service is discovered
+def test_find_characteristic_uses_cache(air):
+    host, peripheral, other_service, advertisement, discoveries = create_devices(air)
+    reconnect(host, peripheral, advertisement)
+    assert host.find_characteristic(OTHER_SERVICE_UUID, OTHER_CHARACTERISTIC_UUID) != None
+    assert discoveries == [[]]
+    assert len(host.gatt_cache) == 1
+
+    reconnect(host, peripheral, advertisement)
+    characteristic = host.find_characteristic(OTHER_SERVICE_UUID, OTHER_CHARACTERISTIC_UUID)
+    assert characteristic != None
+    assert discoveries == [[], [host._convert_uuid_to_num(OTHER_SERVICE_UUID)]]
+
+    # Once a service has been discovered over a link it isn't discovered again
+    assert host.find_characteristic(OTHER_SERVICE_UUID, OTHER_CHARACTERISTIC_UUID) is characteristic
+    assert host.find_characteristic(OTHER_SERVICE_UUID, NEW_CHARACTERISTIC_UUID) == None
+    assert len(discoveries) == 2
+
+# A peripheral whose GATT table changed since it was cached is forgotten and everything it has is discovered again
+def test_find_characteristic_replaces_stale_entry(air):
+    host, peripheral, other_service, advertisement, discoveries = create_devices(air)
+    reconnect(host, peripheral, advertisement)
+    host.find_characteristic(OTHER_SERVICE_UUID, OTHER_CHARACTERISTIC_UUID)
+
+    peripheral.add_characteristic_to_service(other_service, NEW_CHARACTERISTIC_UUID, properties=[True, False, False, False, False, False])
+    reconnect(host, peripheral, advertisement)
+    assert host.find_characteristic(OTHER_SERVICE_UUID, NEW_CHARACTERISTIC_UUID) != None
+    assert discoveries[1:] == [[host._convert_uuid_to_num(OTHER_SERVICE_UUID)], []]
+
+    assert len(host.gatt_cache.get_service(host._get_link(None).address, host._convert_uuid_to_num(OTHER_SERVICE_UUID))) == 2
+
+# Forgetting a peripheral makes the next find_characteristic() discover everything it has again
+def test_forget_invalidates_peripheral(air):
+    host, peripheral, other_service, advertisement, discoveries = create_devices(air)
+    reconnect(host, peripheral, advertisement)
+    host.find_characteristic(OTHER_SERVICE_UUID, OTHER_CHARACTERISTIC_UUID)
+    host.gatt_cache.forget(host._get_link(None).address)
+    assert len(host.gatt_cache) == 0
+
+    reconnect(host, peripheral, advertisement)
+    assert host.find_characteristic(OTHER_SERVICE_UUID, OTHER_CHARACTERISTIC_UUID) != None
+    assert discoveries == [[], []]
+
+# A saved cache loads back the same, and the peripheral remembered longest ago is forgotten once it's full
+def test_cache_file_and_capacity(air, tmp_path):
+    host, peripheral, other_service, advertisement, discoveries = create_devices(air)
+    path = str(tmp_path / "gatt_cache.bin")
+    host.gatt_cache = GattCache(path, capacity=2)
+    reconnect(host, peripheral, advertisement)
+    host.find_characteristic(OTHER_SERVICE_UUID, OTHER_CHARACTERISTIC_UUID)
+    address = host._get_link(None).address
+
+    loaded = GattCache(path)
+    assert loaded.get(address) == host.gatt_cache.get(address)
+    assert loaded.get_service(address, host._convert_uuid_to_num(SERVICE_UUID))[0][0] == host._convert_uuid_to_num(CHARACTERISTIC_UUID)
+
+    host.gatt_cache.update(b"other 1", (), True)
+    host.gatt_cache.update(b"other 2", (), True)
+    assert len(host.gatt_cache) == 2
+    assert host.gatt_cache.get(address) == None
+    assert len(GattCache(path)) == 2
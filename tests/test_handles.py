@@ -0,0 +1,41 @@
+#
+# Libraries
+#
+
+from ble_benchmark import create_loopback
+
+## Read, write and notify but not write without response or indicate
+PROPERTIES = [False, True, True, True, False, False]
+
+# This makes a loopback whose characteristic has PROPERTIES and records every PacketBuffer the host makes
+def create_devices(air) -> tuple:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, properties=PROPERTIES)
+    made = []
+    create_packet_buffer = host._backend.create_packet_buffer
+    host._backend.create_packet_buffer = lambda *args: made.append(create_packet_buffer(*args)) or made[-1]
+    return host, h_characteristic, made
+
+# The property flags are read from the characteristic once when the handle is made, and the same handle is given back every time
+def test_handle_flags(air):
+    host, h_characteristic, made = create_devices(air)
+    handle = host.get_handle(h_characteristic)
+    assert handle is host.get_handle(h_characteristic)
+    assert handle.flags == h_characteristic.properties
+    assert [handle.can_read, handle.can_write, handle.can_notify, handle.can_indicate] == [True, True, True, False]
+    assert host.convert_num_to_properties(handle.flags) == PROPERTIES
+
+# The write buffer is only made the first time it's used, and made again after deinit()
+def test_handle_write_buffer_is_lazy(air):
+    host, h_characteristic, made = create_devices(air)
+    handle = host.get_handle(h_characteristic, max_length=12)
+    assert len(made) == 0
+
+    write_buffer = handle.write_buffer
+    assert made == [write_buffer]
+    assert handle.write_buffer is write_buffer
+    assert write_buffer.outgoing_packet_length == 12
+    assert len(made) == 1
+
+    handle.deinit()
+    assert handle.write_buffer is not write_buffer
+    assert len(made) == 2
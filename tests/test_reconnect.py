@@ -0,0 +1,75 @@
+#
+# Libraries
+#
+
+from ble_benchmark import create_loopback
+
+# This makes a loopback with auto reconnect on and no jitter so every wait is exactly what the backoff says it is,
+# it returns the peripheral's advertisement too so it can advertise again after the link drops
+def create_devices(air, **settings) -> tuple:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    advertisement = peripheral._radio._advertisement
+    host.enable_auto_reconnect(jitter=0, connect_timeout=0.1, **settings)
+    host.subscribe(h_characteristic, lambda characteristic, value: None)
+    return host, peripheral, advertisement
+
+# This waits until the next attempt is due and makes it, it returns what maintain_connection() did
+def attempt(air, host) -> bool:
+    air.sleep(host._reconnect.next_attempt - air.now)
+    return host.maintain_connection()
+
+# Every failed attempt waits multiplier times longer than the one before, up to max_delay,
+# and once the peripheral is back its subscriptions are made again
+def test_backoff(air):
+    host, peripheral, advertisement = create_devices(air, initial_delay=0.5, max_delay=2)
+    peripheral._radio._connections[0].disconnect()
+    assert not host.maintain_connection()
+    assert host._reconnect.next_attempt - air.now == 0.5
+
+    # The peripheral stopped advertising when the host connected to it, so every attempt fails
+    waits = []
+    for _ in range(4):
+        assert not attempt(air, host)
+        waits.append(round(host._reconnect.next_attempt - air.now, 6))
+    assert waits == [1.0, 2.0, 2.0, 2.0]
+    assert host._reconnect.last_reason == "disconnected"
+
+    peripheral.start_advertising(advertisement)
+    assert attempt(air, host)
+    assert host._reconnect.reconnects == 1
+    assert len(host._subscriptions) == 1
+
+# After max_attempts failed attempts in a row the peripheral is forgotten and no more attempts are made
+def test_gives_up(air):
+    host, peripheral, advertisement = create_devices(air, initial_delay=0.5, max_attempts=3)
+    peripheral._radio._connections[0].disconnect()
+    host.maintain_connection()
+    for _ in range(3):
+        assert not attempt(air, host)
+    assert host._reconnect.last_reason == "gave_up"
+    assert host._reconnect.next_attempt == None and host._last_peer == None
+
+    # Even once the peripheral is back nothing reconnects to it
+    peripheral.start_advertising(advertisement)
+    air.sleep(60)
+    assert not host.maintain_connection()
+    assert host._reconnect.reconnects == 0
+
+# A link whose rssi is low and still falling is dropped early and reconnected to. The simulator gives the rssi of a connection,
+# on a board _bleio doesn't (BleioBackend.connection_rssi() is always None) so this never happens there
+def test_drops_weak_link(air):
+    host, peripheral, advertisement = create_devices(air, initial_delay=0.5, min_rssi=-80)
+    air.rssi_jitter = 0
+    for rssi in range(-50, -100, -5):
+        peripheral._radio.rssi = rssi
+        air.sleep(0.1)
+        if not host.maintain_connection():
+            break
+    assert host._reconnect.early_drops == 1
+    assert host._reconnect.last_reason == "rssi"
+    assert not host.link_health()["connected"]
+
+    peripheral._radio.rssi = -50
+    peripheral.start_advertising(advertisement)
+    assert attempt(air, host)
+    assert host.link_health()["rssi"] == None
@@ -0,0 +1,113 @@
+#
+# Libraries
+#
+
+import pytest
+from conftest import run_until
+from ble_management import FRAMING_NONE, FRAMING_SEQUENCE
+from ble_rpc import RpcServer, RpcClient, RPC_OK, RPC_ERROR, RPC_UNKNOWN_METHOD, RPC_TIMEOUT
+from ble_benchmark import create_loopback
+
+# This sets up an RpcServer on the peripheral with an echo method (1) and a method that always fails (2),
+# and an RpcClient on the host that calls them over the same characteristic
+def create_rpc(air, framing: int = FRAMING_NONE, **settings) -> tuple:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    server = RpcServer(peripheral, p_characteristic, p_characteristic)
+    server.register(1, lambda payload: payload)
+    server.register(2, lambda payload: 1 / 0)
+    client = RpcClient(host, h_characteristic, h_characteristic, **settings)
+    return server, client
+
+@pytest.mark.parametrize("framing", [FRAMING_NONE, FRAMING_SEQUENCE])
+def test_many_calls_in_flight(air, framing):
+    server, client = create_rpc(air, framing=framing, max_in_flight=8, buffer_size=8)
+    results = {}
+    for number in range(8):
+        payload = bytes(str(number), 'utf-8')
+        assert client.call(1, payload, lambda status, response, number=number: results.__setitem__(number, (status, response))) != None
+    assert client.in_flight == 8
+    assert client.call(1, b"full") == None
+
+    assert run_until(air, lambda: len(results) == 8, (server.update, client.update))
+    assert results == {number: (RPC_OK, bytes(str(number), 'utf-8')) for number in range(8)}
+    assert client.in_flight == 0
+    assert server.requests_handled == 8
+
+def test_failed_calls(air):
+    server, client = create_rpc(air)
+    results = []
+    client.call(2, b"", lambda status, response: results.append((status, response)))
+    client.call(9, b"", lambda status, response: results.append((status, response)))
+
+    assert run_until(air, lambda: len(results) == 2, (server.update, client.update))
+    assert results[0] == (RPC_ERROR, b"division by zero")
+    assert results[1] == (RPC_UNKNOWN_METHOD, b"")
+    assert server.requests_failed == 2
+
+# A call that isn't answered (the server is never updated here) gets RPC_TIMEOUT once its timeout passes
+def test_timeout(air):
+    server, client = create_rpc(air, timeout=0.2)
+    results = []
+    client.call(1, b"lost", lambda status, response: results.append(status))
+
+    assert run_until(air, lambda: len(results) == 1, (client.update,))
+    assert results == [RPC_TIMEOUT]
+    assert client.timeouts == 1 and client.in_flight == 0
+
+    # The response that shows up after the call timed out is counted instead of being handed to anyone
+    assert run_until(air, lambda: client.late_responses == 1, (server.update, client.update))
+
+# Requests that arrive while capacity responses are already waiting for the radio are thrown away without being
+# handled, and their calls time out
+def test_requests_dropped_when_full(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    server = RpcServer(peripheral, p_characteristic, p_characteristic, capacity=2)
+    handled = []
+    server.register(1, lambda payload: handled.append(payload) or payload)
+    client = RpcClient(host, h_characteristic, h_characteristic, max_in_flight=8, timeout=0.5, buffer_size=8)
+    results = {}
+    for number in range(8):
+        client.call(1, bytes((number,)), lambda status, response, number=number: results.__setitem__(number, status))
+    # Every request lands before the server gets to any of them
+    while air.step():
+        pass
+    server.update()
+
+    # The server's buffer holds 4 responses and 2 more wait in the server, so it can't take the last 2 requests
+    assert len(handled) == 6
+    assert server.requests_dropped == 2
+    assert run_until(air, lambda: len(results) == 8, (server.update, client.update))
+    assert sorted(results.values()) == [RPC_OK] * 6 + [RPC_TIMEOUT] * 2
+
+# Request ids wrap around after 255, so a new call skips the ids of calls that are still waiting and of calls that timed out
+# until their late response arrives or timeout passes, and a late response is never taken for a newer call's
+def test_request_ids_are_not_reused_too_soon(air):
+    server, client = create_rpc(air, timeout=0.2)
+    results = []
+    assert client.call(1, b"late", lambda status, response: results.append((status, response))) == 0
+    assert client.call(1, b"waiting") == 1
+    assert run_until(air, lambda: client.timeouts == 2, (client.update,))
+
+    # The ids have come all the way around
+    client._next_id = 0
+    assert client.call(1, b"new", lambda status, response: results.append((status, response))) == 2
+    assert run_until(air, lambda: len(results) == 2, (server.update, client.update))
+    assert results == [(RPC_TIMEOUT, b""), (RPC_OK, b"new")]
+    assert client.late_responses == 2
+
+    # Both late responses came in, so their ids are free again
+    client._next_id = 0
+    assert client.call(1, b"again") == 0
+    assert client.call(1, b"again") == 1
+
+# A timed out id whose response never comes is used again once timeout has passed
+def test_held_request_id_is_released(air):
+    server, client = create_rpc(air, timeout=0.2)
+    client.call(1, b"lost")
+    assert run_until(air, lambda: client.timeouts == 1, (client.update,))
+    client._next_id = 0
+    assert client.call(1, b"too soon") == 1
+
+    air.sleep(0.2)
+    client._next_id = 0
+    assert client.call(1, b"later") == 0
@@ -0,0 +1,50 @@
+#
+# Libraries
+#
+
+import pytest
+from conftest import run_until
+from ble_codec import DeltaCodec
+from ble_sampling import SensorSampler
+from ble_benchmark import create_loopback
+
+# This makes a sensor with 3 values that swing far enough between samples that every change takes 3 varint bytes
+def create_swinging_sensor() -> tuple:
+    taken = []
+
+    def read() -> tuple:
+        sign = 1 if len(taken) % 2 == 0 else -1
+        sample = (sign * 50000, sign * -40000 + len(taken), sign * 30000)
+        taken.append(sample)
+        return sample
+    return read, taken
+
+# A batch of big changes doesn't fit in a single notification, so it's sent over more of them instead of raising
+def test_large_changes_are_split(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    host.set_codec(h_characteristic, DeltaCodec(3))
+    received = []
+    host.subscribe(h_characteristic, lambda characteristic, value: received.extend(value))
+
+    read, taken = create_swinging_sensor()
+    sampler = SensorSampler(peripheral, p_characteristic, sensors=(read,), rate=50, batch_size=4)
+    # Making the sampler reads the sensor once to count its values
+    del taken[:]
+
+    notifications = 0
+    while sampler.samples_taken < 24:
+        notifications += sampler.update()
+        host.update_subscriptions()
+        if not air.step():
+            air.sleep(sampler.period / 4)
+    run_until(air, lambda: sampler.pending < sampler.batch_size and len(received) == 3 * sampler.samples_sent, (sampler.send, host.update_subscriptions))
+
+    assert sampler.samples_dropped == 0
+    assert notifications > sampler.samples_sent // sampler.batch_size
+    assert received == [value for sample in taken[:sampler.samples_sent] for value in sample]
+
+# A sample that can't fit in a notification even when it's alone is refused when the sampler is made
+def test_sample_too_big(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    with pytest.raises(ValueError):
+        SensorSampler(peripheral, p_characteristic, sensors=(lambda: (1, 2, 3, 4),), max_length=20)
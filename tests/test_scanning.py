@@ -0,0 +1,179 @@
+#
+# Libraries
+#
+
+import asyncio
+import ble_management
+from ble_async import AsyncBluetoothManager
+from ble_management import BluetoothManager, ScanCache, match_name, SCAN_MEMORY_RESERVE
+from ble_scanning import AdaptiveScanner, SCAN_BACKGROUND
+from ble_simulator import SimulatedBackend
+
+# This makes a host and a peripheral that advertises with its name
+def create_devices(air) -> tuple:
+    host = BluetoothManager(SimulatedBackend(air, name="Host"))
+    peripheral = BluetoothManager(SimulatedBackend(air, name="Peripheral"))
+    peripheral.bluetooth_mode_peripheral = True
+    peripheral.start_advertising(peripheral._backend.create_services_advertisement(peripheral.create_service("0x185A")))
+    return host, peripheral
+
+# This stands in for a scanned advertisement with only the fields the ScanCache reads
+class Advertisement:
+    def __init__(self, address, name: str = None, rssi: int = None, services: tuple = ()):
+        self.address = address
+        self.complete_name = name
+        self.rssi = rssi
+        self.services = services
+
+# This is a clock that only moves when a test moves it
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+# find_device() stops the radio before returning even though CircuitPython never closes a generator that's just dropped
+# (the scans are kept alive here so Python can't close them when they're dropped either)
+def test_find_device_stops_the_scan(air):
+    host, peripheral = create_devices(air)
+    scans = []
+    scan = host.scan
+    host.scan = lambda *args, **kwargs: scans.append(scan(*args, **kwargs)) or scans[-1]
+
+    advertisement = host.find_device(match_name("Peripheral"), timeout=5)
+    assert advertisement != None and advertisement.complete_name == "Peripheral"
+    assert len(scans) == 1
+    assert not host._radio._scanning
+
+# The async find_device() scans in slices with the manager's find_device(), so it stops the radio the same way
+def test_async_find_device_stops_the_scan(air):
+    host, peripheral = create_devices(air)
+    scans = []
+    scan = host.scan
+    host.scan = lambda *args, **kwargs: scans.append(scan(*args, **kwargs)) or scans[-1]
+
+    advertisement = asyncio.run(AsyncBluetoothManager(host).find_device(match_name("Peripheral"), timeout=5))
+    assert advertisement != None and advertisement.complete_name == "Peripheral"
+    assert not host._radio._scanning
+
+# Closing a scan that was stopped early stops the radio too
+def test_closing_scan_stops_the_radio(air):
+    host, peripheral = create_devices(air)
+    scan = host.scan(timeout=5)
+    assert next(scan).complete_name == "Peripheral"
+    assert host._radio._scanning
+    scan.close()
+    assert not host._radio._scanning
+
+# Devices that were forgotten to make room aren't new when they're heard again, so a room with more devices than
+# the scanner's capacity still lets it drop to the background phase
+def test_adaptive_scanner_settles_with_more_devices_than_capacity(air):
+    host = BluetoothManager(SimulatedBackend(air, name="Host"))
+    for i in range(6):
+        peripheral = BluetoothManager(SimulatedBackend(air, name="Peripheral" + str(i)))
+        peripheral.bluetooth_mode_peripheral = True
+        peripheral.start_advertising(peripheral._backend.create_services_advertisement(peripheral.create_service("0x185A")))
+
+    scanner = AdaptiveScanner(host, fast_hold=2.0, capacity=2)
+    for i in range(10):
+        scanner.update()
+    assert scanner.devices_found == 6
+    assert scanner.phase == SCAN_BACKGROUND
+
+# Devices that haven't been seen for ttl seconds are forgotten, seeing one again keeps it
+def test_scan_cache_forgets_devices_after_ttl():
+    clock = Clock()
+    cache = ScanCache(ttl=10, clock=clock)
+    cache.update(Advertisement(b"a", "Old", -50))
+    cache.update(Advertisement(b"b", "Kept", -60))
+    clock.now = 8
+    cache.update(Advertisement(b"b", rssi=-60))
+    clock.now = 12
+    assert cache.get(b"a") == None
+    assert cache.find("Old") == None
+    assert cache.get(b"b").name == "Kept"
+    assert len(cache) == 1
+
+# A full cache forgets the device that was seen longest ago to make room
+def test_scan_cache_forgets_oldest_when_full():
+    clock = Clock()
+    cache = ScanCache(capacity=3, clock=clock)
+    for i in range(3):
+        clock.now = i
+        cache.update(Advertisement(bytes([i]), "Device" + str(i), -50))
+    clock.now = 3
+    cache.update(Advertisement(bytes([0]), rssi=-50))
+    cache.update(Advertisement(bytes([3]), "Device3", -50))
+    assert len(cache) == 3
+    assert cache.get(bytes([1])) == None
+    assert cache.get(bytes([0])) != None and cache.get(bytes([3])) != None
+
+# The remembered rssi moves a smoothing part of the way to every new reading, and readings without an rssi
+# or a name leave what's remembered alone
+def test_scan_cache_smooths_rssi():
+    cache = ScanCache(smoothing=0.25, clock=Clock())
+    device = cache.update(Advertisement(b"a", "Device"))
+    assert device.rssi == None
+    assert repr(device) == "CachedDevice('Device', b'a', rssi=None)"
+    cache.update(Advertisement(b"a", rssi=-80))
+    assert device.rssi == -80
+    cache.update(Advertisement(b"a", rssi=-40))
+    assert device.rssi == -70
+    cache.update(Advertisement(b"a"))
+    assert device.rssi == -70 and device.name == "Device"
+    assert repr(device) == "CachedDevice('Device', b'a', rssi=-70.0)"
+
+# A slice lasts slice_time even when the device we're looking for is in range, so the phase timing covers whole slices
+def test_adaptive_scanner_slices_last_slice_time(air):
+    host, peripheral = create_devices(air)
+    scanner = AdaptiveScanner(host, until=match_name("Peripheral"), slice_time=0.5)
+    for i in range(3):
+        started = air.now
+        hits = scanner.update()
+        assert air.now - started >= 0.5
+        # The target only counts once, when it first shows up
+        assert len([hit for hit in hits if hit.complete_name == "Peripheral"]) == (1 if i == 0 else 0)
+        assert i == 0 or len(hits) == 0
+    assert scanner.target.complete_name == "Peripheral"
+    assert scanner.fast_time >= 1.5
+
+# A memory budget is split between the scan buffer (half of it, within the buffer size limits) and the results,
+# and without one half of the free memory above SCAN_MEMORY_RESERVE is planned for when it can be known
+def test_plan_scan_memory(air, monkeypatch):
+    host = BluetoothManager(SimulatedBackend(air, name="Host"))
+    assert host.plan_scan_memory(4096) == (512, 28)
+    assert host.plan_scan_memory(512) == (256, 2)
+    assert host.plan_scan_memory(200) == (128, 1)
+    assert host.plan_scan_memory(8192, extended=True) == (2048, 48)
+
+    monkeypatch.setattr(ble_management, "get_free_memory", lambda collect=True: None)
+    assert host.plan_scan_memory() == (512, None)
+    monkeypatch.setattr(ble_management, "get_free_memory", lambda collect=True: SCAN_MEMORY_RESERVE + 8192)
+    assert host.plan_scan_memory() == (512, 28)
+
+# Once the results of a scan hold as many devices as the budget has room for, a new device only gets in by
+# taking the place of the weakest one, and the radio is given the planned buffer size
+def test_scan_results_stop_when_full(air):
+    host = BluetoothManager(SimulatedBackend(air, name="Host"))
+    for i in range(5):
+        peripheral = BluetoothManager(SimulatedBackend(air, name="Peripheral" + str(i), rssi=-70 + i * 5))
+        peripheral.bluetooth_mode_peripheral = True
+        peripheral.start_advertising(peripheral._backend.create_services_advertisement(peripheral.create_service("0x185A")))
+
+    buffer_sizes = []
+    start_scan = host._radio.start_scan
+    host._radio.start_scan = lambda *args, **kwargs: buffer_sizes.append(kwargs["buffer_size"]) or start_scan(*args, **kwargs)
+
+    detected_devices = host.start_scanning(advertisements_to_collect=50, timeout=1, memory_budget=512)
+    assert buffer_sizes == [256]
+    assert sorted(detected_devices) == ["Peripheral3", "Peripheral4"]
+
+# A scan stops early instead of running out of memory once free memory drops below SCAN_MEMORY_RESERVE
+def test_scan_stops_when_memory_runs_low(air, monkeypatch):
+    host, peripheral = create_devices(air)
+    monkeypatch.setattr(ble_management, "get_free_memory", lambda collect=True: SCAN_MEMORY_RESERVE - 1)
+    started = air.now
+    assert len(list(host.scan(timeout=5, buffer_size=256, filter_no_name=False, unique=False))) == 1
+    assert air.now - started < 5
+    assert not host._radio._scanning
@@ -0,0 +1,78 @@
+#
+# Libraries
+#
+
+import pytest
+from conftest import run_until
+from ble_management import FRAMING_NONE, FRAMING_LENGTH, OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST
+from ble_benchmark import create_loopback
+
+# This sets up a host SendQueue that writes to a CharacteristicBuffer on the peripheral
+def create_queue(air, framing: int = FRAMING_NONE, **settings) -> tuple:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, framing=framing)
+    send_queue = host.create_send_queue(host.create_packet_buffer(h_characteristic, buffer_size=4), **settings)
+    read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=0, buffer_size=512)
+    return host, peripheral, send_queue, read_buffer
+
+# Small messages are joined into full packets, so 10 messages of 6 bytes only take 3 packets of 20 bytes
+def test_messages_are_joined(air):
+    host, peripheral, send_queue, read_buffer = create_queue(air, capacity=8)
+    messages = [bytes("msg" + str(number) + "!\n", 'utf-8') for number in range(10)]
+    for message in messages:
+        assert send_queue.send(message)
+    total = sum(len(message) for message in messages)
+    assert send_queue.pending == 3
+    assert send_queue.occupancy == total
+
+    assert send_queue.flush(timeout=5)
+    assert send_queue.pending == 0 and send_queue.occupancy == 0
+    run_until(air, lambda: read_buffer.in_waiting >= total)
+    assert read_buffer.read(read_buffer.in_waiting) == b"".join(messages)
+
+# The packet being filled isn't written until it's full or its first message has waited max_delay
+def test_max_delay(air):
+    host, peripheral, send_queue, read_buffer = create_queue(air, max_delay=0.05)
+    send_queue.send(b"hi")
+    assert send_queue.update() == 0
+    air.sleep(0.05)
+    assert send_queue.update() == 1
+    assert send_queue.pending == 0
+
+@pytest.mark.parametrize("overflow", [OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST])
+def test_overflow_drops(air, overflow):
+    host, peripheral, send_queue, read_buffer = create_queue(air, framing=FRAMING_LENGTH, capacity=2, overflow=overflow)
+    # Every framed message of 19 bytes (with its header) takes a whole packet
+    for number in range(5):
+        accepted = send_queue.send(bytes((number,)) * 18)
+        assert accepted == (number < 2 or overflow == OVERFLOW_DROP_OLDEST)
+    assert send_queue.pending == 2
+    assert send_queue.messages_dropped == 3
+
+    assert send_queue.flush(timeout=5)
+    run_until(air, lambda: read_buffer.in_waiting >= 38)
+    first = peripheral.read_from_characteristic_with_buffer(read_buffer)
+    second = peripheral.read_from_characteristic_with_buffer(read_buffer)
+    kept = (0, 1) if overflow == OVERFLOW_DROP_NEWEST else (3, 4)
+    assert (first[0], second[0]) == kept
+
+# With OVERFLOW_BLOCK send() writes packets until there's room, so nothing is dropped
+def test_overflow_block(air):
+    host, peripheral, send_queue, read_buffer = create_queue(air, framing=FRAMING_LENGTH, capacity=2, overflow=OVERFLOW_BLOCK, block_timeout=5)
+    for number in range(6):
+        assert send_queue.send(bytes((number,)) * 18)
+    assert send_queue.messages_dropped == 0
+    assert send_queue.flush(timeout=5)
+
+    run_until(air, lambda: read_buffer.in_waiting >= 19 * 6)
+    received = []
+    while read_buffer.in_waiting > 0:
+        received.append(peripheral.read_from_characteristic_with_buffer(read_buffer)[0])
+    assert received == list(range(6))
+
+def test_clear_counts_dropped(air):
+    host, peripheral, send_queue, read_buffer = create_queue(air)
+    send_queue.send(b"one")
+    send_queue.send(b"two")
+    send_queue.clear()
+    assert send_queue.pending == 0
+    assert send_queue.messages_dropped == 2
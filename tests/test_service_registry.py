@@ -0,0 +1,44 @@
+#
+# Libraries
+#
+
+import ble_management
+from ble_management import BluetoothManager
+from ble_simulator import SimulatedBackend
+
+## Read, write and notify
+PROPERTIES = [False, True, True, True, False, False]
+
+# This declares the services a board's code.py would, the way it does every time the code runs
+def declare(manager) -> tuple:
+    service = manager.declare_service("0x185A")
+    characteristic = manager.declare_characteristic(service, "0x2BDE", properties=PROPERTIES)
+    other = manager.declare_service("0x180F")
+    manager.declare_characteristic(other, "0x2A19", properties=PROPERTIES)
+    return service, characteristic
+
+# This counts the services and characteristics in the GATT table of a board
+def get_table_size(backend) -> tuple:
+    return len(backend.radio._services), sum([len(service.characteristics) for service in backend.radio._services])
+
+# Declaring the same services again gives back the same ones instead of adding to the GATT table
+def test_declare_twice(air, monkeypatch):
+    monkeypatch.setattr(ble_management, "_gatt_table_checked", False)
+    backend = SimulatedBackend(air)
+    manager = BluetoothManager(backend)
+    service, characteristic = declare(manager)
+    assert declare(manager) == (service, characteristic)
+    assert get_table_size(backend) == (2, 2)
+
+# The radio keeps its services when the code is reloaded but the module starts over, so the services left over
+# are cleared out the first time a service is declared and the GATT table ends up the same size
+def test_declare_after_reload(air, monkeypatch):
+    monkeypatch.setattr(ble_management, "_gatt_table_checked", False)
+    backend = SimulatedBackend(air)
+    declare(BluetoothManager(backend))
+
+    for _ in range(3):
+        monkeypatch.setattr(ble_management, "_gatt_table_checked", False)
+        service, characteristic = declare(BluetoothManager(backend))
+        assert get_table_size(backend) == (2, 2)
+        assert backend.radio._services[0] is service
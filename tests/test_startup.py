@@ -0,0 +1,45 @@
+#
+# Libraries
+#
+
+import pytest
+import ble_management
+from ble_management import BluetoothManager
+from ble_simulator import SimulatedBackend
+
+# This hands everything through to a backend and counts how many times its radio is asked for
+class WatchedBackend:
+    def __init__(self, backend):
+        self._watched = backend
+        self.radio_uses = 0
+
+    def __getattr__(self, name: str):
+        if name == "radio":
+            self.radio_uses += 1
+        return getattr(self._watched, name)
+
+# Making a manager and setting up its services doesn't bring up the radio, the first call that needs it does and it's kept after that.
+# (declare_service() needs it the first time it's called after a reload, to check for services left over from before)
+def test_radio_is_brought_up_on_first_use(air, monkeypatch):
+    monkeypatch.setattr(ble_management, "_gatt_table_checked", False)
+    backend = WatchedBackend(SimulatedBackend(air, name="Peripheral"))
+    manager = BluetoothManager(backend)
+    manager.bluetooth_mode_peripheral = True
+    manager.enable_stats()
+    service = manager.create_service("0x185A")
+    manager.add_characteristic_to_service(service, "0x2BDE", properties=[False, True, True, True, False, False])
+    advertisement = manager.create_services_advertisement(service)
+    assert backend.radio_uses == 0
+
+    manager.start_advertising(advertisement)
+    assert backend.radio_uses == 1
+    assert manager.get_bluetooth_advertising_state()
+    manager.stop_advertising()
+    assert backend.radio_uses == 1
+
+# ble_management imports without _bleio so it can be tested on a computer, only making a manager for the board's radio needs it
+def test_board_backend_needs_bleio():
+    if ble_management._bleio_available:
+        pytest.skip("_bleio is available")
+    with pytest.raises(ImportError):
+        BluetoothManager()
@@ -0,0 +1,69 @@
+#
+# Libraries
+#
+
+from ble_management import LatencyHistogram
+from ble_benchmark import create_loopback
+from conftest import run_until
+
+# Every time lands in the first bucket whose top it doesn't go over, anything slower than the last bucket goes into one more at the end
+def test_histogram_buckets():
+    histogram = LatencyHistogram()
+    for seconds in (0.0005, 0.001, 0.0011, 0.3, 10.0):
+        histogram.add(seconds)
+    assert histogram.counts == [2, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1]
+    assert histogram.percentile(50) == 2
+    assert histogram.percentile(60) == 2
+    assert histogram.percentile(80) == 500
+    assert histogram.percentile(99) == 10000
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 5
+    assert snapshot["min_ms"] == 0.5 and snapshot["max_ms"] == 10000
+    assert snapshot["buckets"] == histogram.counts and snapshot["buckets"] is not histogram.counts
+
+    histogram.reset()
+    assert histogram.snapshot() == {"count": 0}
+    assert histogram.percentile(50) == None
+
+# The messages and bytes written and read are counted for every characteristic, and reset_stats() sets them back to 0
+def test_characteristic_counters(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    host.enable_stats()
+    peripheral.enable_stats()
+    write_buffer = host.create_packet_buffer(h_characteristic)
+    read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=0)
+
+    for message in (b"one\n", b"two\n", b"three\n"):
+        assert host.write_to_characteristic_with_buffer(write_buffer, message, clear_buffer=False) > 0
+    run_until(air, lambda: read_buffer.in_waiting >= 14)
+    assert [peripheral.read_from_characteristic_with_buffer(read_buffer) for _ in range(3)] == [b"one\n", b"two\n", b"three\n"]
+
+    written = host.stats()["characteristics"]["0x2BDE"]
+    assert (written["messages_written"], written["bytes_written"], written["messages_read"]) == (3, 14, 0)
+    read = peripheral.stats()["characteristics"]["0x2BDE"]
+    assert (read["messages_read"], read["bytes_read"], read["messages_written"]) == (3, 14, 0)
+    assert host.stats()["connects"] == 0 and host.stats()["write_shortfalls"] == 0
+
+    host.reset_stats()
+    assert host.stats()["characteristics"] == {}
+    host.enable_stats(False)
+    assert host.stats() == None
+
+# Only buffers made while the stats are on have their uuid remembered (the rest are counted as unknown),
+# and deinit_buffer() forgets the uuid of the buffer it gets rid of
+def test_buffer_uuids(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    before = host.create_packet_buffer(h_characteristic)
+    host.enable_stats()
+    after = host.create_packet_buffer(h_characteristic)
+    assert list(host._buffer_uuids) == [after]
+
+    host.write_to_characteristic_with_buffer(before, b"a", clear_buffer=False)
+    host.write_to_characteristic_with_buffer(after, b"b", clear_buffer=False)
+    characteristics = host.stats()["characteristics"]
+    assert characteristics["unknown"]["messages_written"] == 1
+    assert characteristics["0x2BDE"]["messages_written"] == 1
+
+    host.deinit_buffer(after)
+    assert len(host._buffer_uuids) == 0
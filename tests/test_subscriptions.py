@@ -0,0 +1,99 @@
+#
+# Libraries
+#
+
+from conftest import run_until
+from ble_benchmark import create_loopback, SERVICE_UUID, CHARACTERISTIC_UUID
+from ble_management import BluetoothManager
+from ble_simulator import SimulatedBackend
+
+## Read, write, write without response, notify and indicate
+PROPERTIES = [True, True, True, True, True, False]
+
+# This connects a host to peripherals with the specified names, each with a characteristic the host subscribes to.
+# It returns the host, a list of (peripheral, its characteristic, the host's characteristic) and a list the values land in as (name, value)
+def create_peripherals(air, names: list) -> tuple:
+    host = BluetoothManager(SimulatedBackend(air, name="Host"))
+    peripherals = []
+    received = []
+    for name in names:
+        peripheral = BluetoothManager(SimulatedBackend(air, name=name))
+        peripheral.bluetooth_mode_peripheral = True
+        service = peripheral.create_service(SERVICE_UUID)
+        p_characteristic = peripheral.add_characteristic_to_service(service, CHARACTERISTIC_UUID, properties=PROPERTIES)
+        peripheral.start_advertising(peripheral._backend.create_services_advertisement(service))
+        peripherals.append((peripheral, p_characteristic))
+
+    detected_devices = host.start_scanning(timeout=1)
+    for i in range(len(names)):
+        host.connect(detected_devices, names[i])
+        h_characteristic = host.find_characteristic(SERVICE_UUID, CHARACTERISTIC_UUID)
+        host.subscribe(h_characteristic, lambda characteristic, value, name=names[i]: received.append((name, value)), buffer_size=8)
+        peripherals[i] += (h_characteristic,)
+    return host, peripherals, received
+
+# service_connections() hands a peripheral at most quantum values per turn, and the rest on the turns after it
+def test_service_connections_hands_out_quantum_values(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, properties=PROPERTIES)
+    received = []
+    host.subscribe(h_characteristic, lambda characteristic, value: received.append(value), buffer_size=8)
+
+    for i in range(6):
+        peripheral.write_to_characteristic(p_characteristic, bytes([i]), clear_buffer=False)
+    while air.step():
+        pass
+
+    assert host.service_connections(quantum=4) == 4
+    assert host.service_connections(quantum=4) == 2
+    assert received == [bytes([i]) for i in range(6)]
+
+# Losing the link remembers every subscription the way it was made, so a characteristic that can notify
+# and indicate is subscribed to with indicate again after reconnecting
+def test_lost_link_remembers_indicate(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air, properties=PROPERTIES)
+    host.enable_auto_reconnect()
+    host.subscribe(h_characteristic, lambda characteristic, value: None, indicate=True)
+
+    peripheral._radio._connections[0].disconnect()
+    assert run_until(air, lambda: host.service_connections() == 0 and len(host._reconnect._subscriptions) == 1)
+    assert host._reconnect._subscriptions[0][3]
+
+# Every peripheral gets quantum values per turn no matter how many the others have waiting,
+# and the peripheral that goes first changes every call
+def test_service_connections_takes_turns(air):
+    host, peripherals, received = create_peripherals(air, ["A", "B"])
+    for peripheral, p_characteristic, h_characteristic in peripherals:
+        for i in range(6):
+            peripheral.write_to_characteristic(p_characteristic, bytes([i]), clear_buffer=False)
+    while air.step():
+        pass
+
+    assert host.service_connections(quantum=2) == 4
+    assert [name for name, value in received] == ["A", "A", "B", "B"]
+    del received[:]
+    assert host.service_connections(quantum=2) == 4
+    assert [name for name, value in received] == ["B", "B", "A", "A"]
+    assert host.service_connections(quantum=2) == 4
+    assert host.service_connections(quantum=2) == 0
+    for name in "AB":
+        assert [value for sender, value in received if sender == name] == [bytes([i]) for i in range(2, 6)]
+
+# A peripheral that disconnects while the others are being serviced is forgotten on its turn, the rest still get theirs
+def test_service_connections_forgets_disconnected_peripheral(air):
+    host, peripherals, received = create_peripherals(air, ["A", "B", "C"])
+
+    # C drops its link while A's value is being handed out
+    def disconnect_c(characteristic, value):
+        peripherals[2][0]._radio._connections[0].disconnect()
+        received.append(("A", value))
+    host.subscribe(peripherals[0][2], disconnect_c)
+
+    for peripheral, p_characteristic, h_characteristic in peripherals:
+        peripheral.write_to_characteristic(p_characteristic, b"x", clear_buffer=False)
+    while air.step():
+        pass
+
+    assert host.service_connections() == 2
+    assert [name for name, value in received] == ["A", "B"]
+    assert len(host.connections) == 2
+    assert len(host._subscriptions) == 2
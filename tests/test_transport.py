@@ -0,0 +1,96 @@
+#
+# Libraries
+#
+
+import pytest
+from conftest import run_until
+from ble_transport import FragmentTransport
+from ble_benchmark import create_loopback
+
+MESSAGE = bytes(range(200)) * 3
+
+# This sets up a FragmentTransport on the host that writes to the peripheral, which reads with a PacketBuffer
+# or with a CharacteristicBuffer of read_size bytes when stream is True
+def create_transports(air, stream: bool = False, read_size: int = 1024, read_packets: int = 64) -> tuple:
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    if stream:
+        read_buffer = peripheral.create_characteristic_buffer(p_characteristic, timeout=0, buffer_size=read_size)
+    else:
+        read_buffer = peripheral.create_packet_buffer(p_characteristic, buffer_size=read_packets)
+    sender = FragmentTransport(host, write_buffer=host.create_packet_buffer(h_characteristic))
+    receiver = FragmentTransport(peripheral, read_buffer=read_buffer)
+    return host, peripheral, sender, receiver
+
+# This waits for the next message the receiver puts back together and returns a copy of it, or None if none shows up
+def receive(air, receiver) -> bytes:
+    received = []
+
+    def update():
+        message = receiver.receive()
+        if message != None:
+            received.append(bytes(message))
+
+    run_until(air, lambda: len(received) > 0, (update,), limit=2)
+    return received[0] if len(received) > 0 else None
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_messages_are_put_back_together(air, stream):
+    host, peripheral, sender, receiver = create_transports(air, stream=stream)
+    for message in (MESSAGE, b"", b"short", MESSAGE[:300]):
+        assert sender.write(message, timeout=5)
+        assert receive(air, receiver) == message
+    assert receiver.messages_dropped == 0
+
+# A message that loses a fragment is thrown away and the next one still comes through
+def test_lost_fragment_drops_message(air):
+    host, peripheral, sender, receiver = create_transports(air, read_packets=2)
+    # Only the first 2 of the message's fragments fit in the receiver's buffer
+    assert sender.write(MESSAGE[:100], timeout=5)
+    while air.step():
+        pass
+    assert receiver.receive() == None
+
+    assert sender.write(b"next", timeout=5)
+    assert receive(air, receiver) == b"next"
+    assert receiver.messages_dropped == 1
+
+# A full CharacteristicBuffer cuts a notification short, the message it was part of is thrown away and
+# the bytes after it are searched for the next message instead of being read as fragments
+def test_stream_finds_next_message_after_cut(air):
+    host, peripheral, sender, receiver = create_transports(air, stream=True, read_size=64)
+    # The second message's first notification is cut down to 16 of its 20 bytes and the rest of it doesn't fit
+    assert sender.write(MESSAGE[:40], timeout=5)
+    assert sender.write(MESSAGE[40:80], timeout=5)
+    while air.step():
+        pass
+    assert receive(air, receiver) == MESSAGE[:40]
+
+    # The start of the message after the cut is read as the cut fragment's data, the one after that is found again
+    assert sender.write(b"cut short", timeout=5)
+    assert sender.write(b"after it", timeout=5)
+    while air.step():
+        pass
+    assert receive(air, receiver) == b"after it"
+    assert receiver.resyncs == 1 and receiver.messages_dropped == 1
+
+    assert sender.write(MESSAGE[:50], timeout=5)
+    assert receive(air, receiver) == MESSAGE[:50]
+
+# A peripheral can start sending before the host has subscribed, the fragments wait until there's a connection to write them over
+def test_send_before_subscribe(air):
+    host, peripheral, h_characteristic, p_characteristic = create_loopback(air)
+    sender = FragmentTransport(peripheral, write_buffer=peripheral.create_packet_buffer(p_characteristic))
+    assert sender.send(MESSAGE[:100])
+    assert not sender.update()
+
+    receiver = FragmentTransport(host, read_buffer=host.create_characteristic_buffer(h_characteristic, timeout=0, buffer_size=256))
+    assert sender.flush(timeout=5)
+    assert receive(air, receiver) == MESSAGE[:100]
+
+# Sending over a link that's gone raises instead of waiting forever
+def test_send_after_disconnect(air):
+    host, peripheral, sender, receiver = create_transports(air)
+    host.disconnect()
+    assert sender.send(b"lost")
+    with pytest.raises(ConnectionError):
+        sender.update()